@@ -0,0 +1,127 @@
+"""
+Micro-benchmark for `DiskLRUCache`, comparing the get/set cost of the pickled index reloaded and
+rewritten on every access with the journaled and SQLite indexes, for different numbers of cached entries.
+
+Usage: python benchmarks/disk_cache.py [--entries 100,1000,10000] [--repeats 200]
+"""
+import os
+import time
+import pickle
+import random
+import shutil
+import argparse
+import tempfile
+from collections import OrderedDict
+from kservehelper.cache import DiskLRUCache
+from kservehelper.utils import flock
+
+
+class LegacyDiskLRUCache(DiskLRUCache):
+    """`DiskLRUCache` as it was before the journaled index, which unpickles and pickles the whole index."""
+
+    def __init__(self, capacity: int, cache_dir: str):
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.lock_path = os.path.join(cache_dir, "lock")
+        self.index_file = os.path.join(cache_dir, "index")
+        self._cache, self._total_size = OrderedDict(), 0
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def total_size(self):
+        return self._total_size
+
+    def _load(self):
+        with open(self.index_file, "rb") as f:
+            self._total_size, self._cache = pickle.load(f)
+
+    def _save(self):
+        with open(self.index_file, "wb") as f:
+            pickle.dump((self._total_size, self._cache), f)
+
+    def __getitem__(self, key: str):
+        with flock(self.lock_path):
+            self._load()
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            self._save()
+            path = os.path.join(self.cache_dir, self._cache[key]["filename"])
+            return path if os.path.isfile(path) else None
+
+    def __setitem__(self, key: str, filepath: str):
+        with flock(self.lock_path):
+            self._load()
+            if key in self._cache:
+                self._total_size -= self._cache.pop(key)["size"]
+            self._save()
+            item = {"filename": key, "size": os.stat(filepath).st_size}
+            shutil.copyfile(filepath, os.path.join(self.cache_dir, key))
+            self._cache[key] = item
+            self._total_size += item["size"]
+            self._save()
+
+
+def _populate(cache_dir: str, num_entries: int):
+    # Writes the cached files and an index in the pickle format, which both caches can load
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.makedirs(cache_dir)
+    entries = OrderedDict()
+    for i in range(num_entries):
+        key = f"lora_{i}.safetensors"
+        open(os.path.join(cache_dir, key), "wb").close()
+        entries[key] = {"filename": key, "size": 1}
+    with open(os.path.join(cache_dir, "index"), "wb") as f:
+        pickle.dump((num_entries, entries), f)
+
+
+def _run(cache, num_entries: int, repeats: int, filepath: str):
+    keys = [f"lora_{random.randrange(num_entries)}.safetensors" for _ in range(repeats)]
+    start_time = time.perf_counter()
+    for key in keys:
+        assert cache[key] is not None
+    get_time = (time.perf_counter() - start_time) / repeats
+
+    start_time = time.perf_counter()
+    for i in range(repeats):
+        cache[f"new_{i}.safetensors"] = filepath
+    set_time = (time.perf_counter() - start_time) / repeats
+    return get_time, set_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", default="100,1000,10000", type=str)
+    parser.add_argument("--repeats", default=200, type=int)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    filepath = os.path.join(tmp_dir, "file")
+    with open(filepath, "wb") as f:
+        f.write(b"\0")
+
+    caches = {
+        "legacy": lambda cache_dir: LegacyDiskLRUCache(10 ** 12, cache_dir),
+        "journal": lambda cache_dir: DiskLRUCache(10 ** 12, cache_dir, index_backend="journal"),
+        "sqlite": lambda cache_dir: DiskLRUCache(10 ** 12, cache_dir, index_backend="sqlite")
+    }
+    print(f"{'entries':>8}" + "".join(f"{name + ' get':>14}{name + ' set':>14}" for name in caches))
+    try:
+        for num_entries in [int(n) for n in args.entries.split(",")]:
+            line = f"{num_entries:>8}"
+            for name, create_cache in caches.items():
+                cache_dir = os.path.join(tmp_dir, name)
+                _populate(cache_dir, num_entries)
+                get_time, set_time = _run(create_cache(cache_dir), num_entries, args.repeats, filepath)
+                line += f"{get_time * 1000:>11.3f} ms{set_time * 1000:>11.3f} ms"
+            print(line)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
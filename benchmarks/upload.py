@@ -0,0 +1,123 @@
+"""
+Benchmark for uploading output files via the webhook. It starts a local webhook implementing `/upload` and
+`/upload_batch` (`kservehelper.testing.LocalWebhook`), and measures files/s, MB/s and the p50/p99 latency of
+one upload call for the sync (`requests`) and async (`aiohttp`) upload functions. The webhook can inject
+latency and failures (HTTP 500) to measure the cost of slow or flaky storage. The results are printed as JSON.
+
+Usage: python benchmarks/upload.py [--num-files 1 4 16] [--file-sizes 64 1024] [--latency 0]
+    [--failure-rate 0] [--repeats 10] [--output results.json]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from kservehelper import utils
+from kservehelper.types import Path
+from kservehelper.testing import LocalWebhook
+
+
+def _make_files(folder, num_files, file_size):
+    paths = []
+    for i in range(num_files):
+        path = os.path.join(folder, f"{time.time_ns()}-{i}.bin")
+        with open(path, "wb") as f:
+            f.write(os.urandom(file_size))
+        paths.append(Path(path))
+    return paths
+
+
+def _remove_files(paths):
+    for path in paths:
+        if os.path.exists(str(path)):
+            os.remove(str(path))
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+METHODS = {
+    "multithread": ("upload", lambda url, paths: utils._upload_multithread(url, paths, 60)),
+    "batch": ("upload_batch", lambda url, paths: utils._upload_batch(url, paths, 60)),
+    "async_multiple": ("upload", lambda url, paths: utils._async_upload_multiple(url, paths, 60)),
+    "async_batch": ("upload_batch", lambda url, paths: utils._async_upload_batch(url, paths, 60)),
+}
+
+
+def benchmark(webhook, method, num_files, file_size, repeats, folder):
+    suffix, func = METHODS[method]
+    url = f"{webhook.url}/{suffix}"
+    is_async = method.startswith("async")
+    loop = asyncio.new_event_loop() if is_async else None
+    latencies, errors, num_failures = [], 0, webhook.num_failures
+    try:
+        for _ in range(repeats):
+            paths = _make_files(folder, num_files, file_size)
+            start_time = time.perf_counter()
+            try:
+                if is_async:
+                    loop.run_until_complete(func(url, paths))
+                else:
+                    func(url, paths)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start_time)
+            _remove_files(paths)
+    finally:
+        if loop is not None:
+            loop.run_until_complete(utils.close_session())
+            loop.close()
+
+    total_time = sum(latencies)
+    return {
+        "method": method,
+        "num_files": num_files,
+        "file_size": file_size,
+        "latency": webhook.latency,
+        "failure_rate": webhook.failure_rate,
+        "files_per_s": num_files * repeats / total_time,
+        "mb_per_s": num_files * file_size * repeats / total_time / 1024 ** 2,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "errors": errors,
+        "webhook_failures": webhook.num_failures - num_failures
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--methods", nargs="+", default=list(METHODS.keys()), choices=list(METHODS.keys()))
+    parser.add_argument("--num-files", nargs="+", default=[1, 4, 16], type=int)
+    parser.add_argument("--file-sizes", nargs="+", default=[64, 1024], type=int, help="File sizes in KB")
+    parser.add_argument("--latency", default=0, type=float, help="Injected webhook latency in seconds")
+    parser.add_argument("--failure-rate", default=0, type=float, help="Probability of a webhook failure")
+    parser.add_argument("--repeats", default=10, type=int)
+    parser.add_argument("--output", default=None, type=str, help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    webhook = LocalWebhook(latency=args.latency, failure_rate=args.failure_rate, keep_files=False)
+    webhook.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for method in args.methods:
+                for num_files in args.num_files:
+                    for file_size in args.file_sizes:
+                        results.append(benchmark(
+                            webhook, method, num_files, file_size * 1024, args.repeats, folder))
+    finally:
+        webhook.stop()
+
+    report = json.dumps({"config": vars(args), "results": results}, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
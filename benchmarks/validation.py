@@ -0,0 +1,115 @@
+"""
+Micro-benchmark for payload validation, comparing the per-request `types.validate` loop
+with the validation plan compiled by `ModelIOInfo.set_input_signatures`.
+
+Usage: python benchmarks/validation.py [--batch-size 500] [--repeats 200]
+"""
+import copy
+import time
+import argparse
+import pydantic
+from packaging.version import Version
+from kservehelper.model import KServeModel, ModelIOInfo
+from kservehelper.types import Input, validate_new, validate_old
+
+
+class BatchModel:
+
+    def predict(
+            self,
+            param: str = Input(
+                description="global param",
+                default="test_param",
+                min_length=1,
+                max_length=100
+            ),
+            batch: list = [{
+                "prompt": Input(
+                    description="Input prompt",
+                    default="standing, (full body)++",
+                    max_length=1000
+                ),
+                "steps": Input(
+                    description="The number of steps",
+                    default=30,
+                    ge=1,
+                    le=100
+                ),
+                "scale": Input(
+                    description="Guidance scale",
+                    default=7.5,
+                    ge=0,
+                    le=20
+                ),
+            }]
+    ):
+        pass
+
+
+def validate(value, name, field):
+    """`types.validate` as it was before the pydantic version check was hoisted to import time."""
+    if Version(pydantic.version.VERSION) >= Version("2.0"):
+        validate_new(value, name, field)
+    else:
+        validate_old(value, name, field)
+
+
+def process_payload_legacy(io_info: ModelIOInfo, payload):
+    """The validation loop used before the validation plan was compiled."""
+    for key, value in payload.items():
+        if key not in io_info.inputs:
+            raise ValueError(f"model has no input parameter named {key}")
+        if not isinstance(value, list):
+            validate(value, key, io_info.input_defaults[key])
+        else:
+            assert io_info.is_batch_input(key)
+            for param in value:
+                assert isinstance(param, dict)
+                for k, v in param.items():
+                    validate(v, k, io_info.input_defaults[key][k])
+    for key, values in io_info.inputs.items():
+        if not io_info.is_batch_input(key):
+            if key not in payload:
+                payload[key] = values["default"]
+        else:
+            params = payload[key]
+            for k, v in values.items():
+                for param in params:
+                    if k not in param:
+                        param[k] = v["default"]
+    return payload
+
+
+def _run(func, payloads):
+    start_time = time.perf_counter()
+    for payload in payloads:
+        func(payload)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", default=500, type=int)
+    parser.add_argument("--repeats", default=200, type=int)
+    args = parser.parse_args()
+
+    model = KServeModel("benchmark", BatchModel)
+    io_info = model.model_io_info
+
+    payload = {
+        "param": "test",
+        "batch": [{"prompt": f"prompt {i}", "steps": 20} for i in range(args.batch_size)]
+    }
+    payloads = [copy.deepcopy(payload) for _ in range(args.repeats)]
+    legacy = _run(lambda p: process_payload_legacy(io_info, p), payloads)
+    payloads = [copy.deepcopy(payload) for _ in range(args.repeats)]
+    compiled = _run(model._process_payload, payloads)
+
+    print(f"batch size: {args.batch_size}, repeats: {args.repeats}")
+    print(f"legacy:   {legacy / args.repeats * 1000:.3f} ms/request")
+    print(f"compiled: {compiled / args.repeats * 1000:.3f} ms/request")
+    print(f"speedup:  {legacy / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, List
+
+
+class BatchProcessor:
+
+    def __init__(
+            self,
+            batch_func: Callable,
+            max_batch_size: int = 8,
+            max_wait_time: float = 0.01
+    ):
+        """
+        Collects concurrent requests and runs them through `batch_func` as one batch.
+
+        :param batch_func: The function that takes a list of payloads and returns a list of outputs
+            (or an awaitable of it) in the same order, e.g., the `predict_batch` method of a model.
+        :param max_batch_size: The maximum number of requests in one batch.
+        :param max_wait_time: The maximum time (in seconds) to wait for more requests once
+            the first request of a batch arrives.
+        """
+        assert max_batch_size >= 1, "`max_batch_size` should be >= 1"
+        self.batch_func = batch_func
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.logger = logging.getLogger(__name__)
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker.done():
+            # The queue and the worker are bound to the event loop they are created in
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, payload: Dict) -> Any:
+        """
+        Adds a request into the queue and waits for its output.
+
+        :param payload: The validated request payload.
+        :return: The output of `batch_func` for this payload.
+        """
+        self._start()
+        future = self._loop.create_future()
+        await self._queue.put((payload, future))
+        return await future
+
+    async def _collect(self) -> List:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait_time
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Skip the requests that have been cancelled by their callers
+            batch = [(payload, future) for payload, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                payloads = [payload for payload, _ in batch]
+                outputs = await self._call(payloads)
+                assert isinstance(outputs, (list, tuple)) and len(outputs) == len(batch), \
+                    f"`predict_batch` should return a list of {len(batch)} outputs"
+                for (_, future), output in zip(batch, outputs):
+                    if not future.done():
+                        future.set_result(output)
+            except Exception as e:
+                self.logger.error(f"failed to run batch: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _call(self, payloads: List[Dict]) -> List:
+        outputs = self.batch_func(payloads)
+        if inspect.isawaitable(outputs):
+            outputs = await outputs
+        return outputs
+
+
+class UploadAggregator:
+
+    def __init__(
+            self,
+            upload_func: Callable,
+            max_wait_time: float = 0.01,
+            max_batch_bytes: int = 8 * 1024 * 1024,
+            max_batch_files: int = 64
+    ):
+        """
+        Collects the files uploaded by concurrent requests via the same webhook, and uploads them
+        with one `upload_func` call. A batch is sent once `max_wait_time` has passed since its first
+        file arrived, or once it reaches `max_batch_bytes` or `max_batch_files`. Multiple batches
+        can be uploaded at the same time. If the upload of a batch fails, the files of each request
+        are uploaded separately, so that only the requests with bad files get the errors.
+
+        :param upload_func: The async function that takes a webhook URL and a list of files,
+            and returns their URLs in the same order, e.g., `_async_upload_batch`.
+        :param max_wait_time: The maximum time (in seconds) to wait for more files.
+        :param max_batch_bytes: The maximum total size of the files in one batch.
+        :param max_batch_files: The maximum number of files in one batch.
+        """
+        self.upload_func = upload_func
+        self.max_wait_time = max_wait_time
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_files = max_batch_files
+        self.logger = logging.getLogger(__name__)
+
+        self._loop = None
+        self._batches = {}
+        self._tasks = set()
+
+    @staticmethod
+    def _size(path) -> int:
+        return len(path) if hasattr(path, "__len__") else os.path.getsize(str(path))
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The pending batches are bound to the event loop they are created in
+            self._loop = loop
+            self._batches = {}
+            self._tasks = set()
+
+    async def submit(self, webhook_url: str, paths: List) -> List[str]:
+        """
+        Adds the files of a request into the current batch of the webhook and waits for their URLs.
+
+        :param webhook_url: The upload webhook URL.
+        :param paths: The files to upload.
+        :return: The URLs of the files.
+        """
+        self._start()
+        # The sizes are computed before the files join the batch, so a missing file only fails this request
+        num_bytes = sum(self._size(path) for path in paths)
+        future = self._loop.create_future()
+        batch = self._batches.get(webhook_url, None)
+        if batch is None:
+            batch = {"items": [], "num_bytes": 0, "num_files": 0}
+            batch["timer"] = self._loop.call_later(self.max_wait_time, self._flush, webhook_url, batch)
+            self._batches[webhook_url] = batch
+        batch["items"].append((paths, future))
+        batch["num_bytes"] += num_bytes
+        batch["num_files"] += len(paths)
+        if batch["num_bytes"] >= self.max_batch_bytes or batch["num_files"] >= self.max_batch_files:
+            self._flush(webhook_url, batch)
+        return await future
+
+    def _flush(self, webhook_url: str, batch: Dict):
+        if self._batches.get(webhook_url, None) is not batch:
+            return
+        del self._batches[webhook_url]
+        batch["timer"].cancel()
+        task = self._loop.create_task(self._upload(webhook_url, batch["items"]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _upload(self, webhook_url: str, items: List):
+        # Skip the requests that have been cancelled by their callers
+        items = [(paths, future) for paths, future in items if not future.done()]
+        if not items:
+            return
+        if len(items) == 1:
+            await self._upload_request(webhook_url, *items[0])
+            return
+        try:
+            urls = await self.upload_func(webhook_url, [path for paths, _ in items for path in paths])
+            assert len(urls) == sum(len(paths) for paths, _ in items), \
+                "The number of URLs doesn't match the number of files"
+            offset = 0
+            for paths, future in items:
+                if not future.done():
+                    future.set_result(list(urls[offset:offset + len(paths)]))
+                offset += len(paths)
+        except Exception as e:
+            self.logger.error(f"failed to upload batch: {e}, uploading the files of each request separately")
+            await asyncio.gather(*[self._upload_request(webhook_url, paths, future) for paths, future in items])
+
+    async def _upload_request(self, webhook_url: str, paths: List, future: asyncio.Future):
+        try:
+            urls = await self.upload_func(webhook_url, paths)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(list(urls))
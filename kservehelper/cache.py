@@ -1,21 +1,83 @@
 import os
+import copy
 import json
+import time
+import uuid
 import mmh3
-import pickle
+import errno
+import fcntl
 import shutil
+import asyncio
 import logging
 import tempfile
 import threading
+import concurrent.futures
 from pathlib import Path
 from typing import Dict, Callable, Any, Union
 from collections import OrderedDict
 from .utils import flock
+from .cache_index import JournaledIndex, SQLiteIndex
 from .storage import S3Storage
+from .metrics import RESULT_CACHE_HITS, RESULT_CACHE_MISSES, RESULT_CACHE_EVICTIONS
 
 
 ###################################################################
 # Memory cache designed for caching models in memory
 ###################################################################
+class SingleFlight:
+
+    def __init__(self):
+        """
+        Runs at most one call of a function per key at a time. The callers arriving while a call for
+        the same key is running wait for it and share its result (or its exception) instead of calling
+        the function again, e.g., N concurrent requests for an uncached model load it only once.
+        """
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def _join(self, key):
+        with self.lock:
+            future = self.calls.get(key, None)
+            if future is not None:
+                return future, False
+            future = concurrent.futures.Future()
+            self.calls[key] = future
+            return future, True
+
+    def _run(self, key, func: Callable, future: concurrent.futures.Future):
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def do(self, key, func: Callable) -> Any:
+        """
+        Calls `func` if no call for `key` is running, otherwise waits for the running one.
+
+        :param key: The key, e.g., the model name.
+        :param func: The function without arguments.
+        :return: The return value of `func`, or raises its exception.
+        """
+        future, owner = self._join(key)
+        if owner:
+            self._run(key, func, future)
+        return future.result()
+
+    async def ado(self, key, func: Callable) -> Any:
+        """
+        The async version of `do`, which runs `func` in the default executor of the event loop.
+        The sync and async callers of the same key share one call.
+        """
+        future, owner = self._join(key)
+        if owner:
+            # The call keeps running for the other waiters even if this caller is cancelled
+            asyncio.get_running_loop().run_in_executor(None, self._run, key, func, future)
+        return await asyncio.wrap_future(future)
+
+
 class MemoryLRUCache:
 
     def __init__(self, num_cached_objects):
@@ -65,6 +127,7 @@ class MemoryCache:
         self.folder = folder
         self.cache = MemoryLRUCache(num_cached_objects)
         self.load_func = load_func
+        self.flights = SingleFlight()
 
         self.models = {}
         if models is None:
@@ -88,65 +151,278 @@ class MemoryCache:
         model = self.cache.get(key)
         if model is not None:
             return model
-        if key not in self.models:
-            self._load_model_config()
+        try:
+            return self.flights.do(key, lambda: self._load(key))
+        except Exception as e:
+            self.logger.error(str(e))
+            return None
 
+    async def aget(self, key: str):
+        """
+        The async version of `__getitem__`, which loads the model in a worker thread.
+        """
+        model = self.cache.get(key)
+        if model is not None:
+            return model
         try:
-            filename = self.models.get(key, key)
-            model = self.load_func(os.path.join(self.folder, filename))
-            if model is not None:
-                self.cache.set(key, model)
+            return await self.flights.ado(key, lambda: self._load(key))
         except Exception as e:
             self.logger.error(str(e))
+            return None
+
+    def _load(self, key: str):
+        # The model may have been loaded by the previous call
+        model = self.cache.get(key)
+        if model is not None:
+            return model
+        if key not in self.models:
+            self._load_model_config()
+        filename = self.models.get(key, key)
+        model = self.load_func(os.path.join(self.folder, filename))
+        if model is not None:
+            self.cache.set(key, model)
         return model
 
 
+###################################################################
+# Memory cache designed for caching prediction results
+###################################################################
+class ResultCache:
+
+    def __init__(
+            self,
+            name: str = "default",
+            capacity: int = 1024,
+            ttl: float = None,
+            disk_cache: "DiskLRUCache" = None
+    ):
+        """
+        :param name: The cache name used as the label of the cache metrics.
+        :param capacity: The maximum number of results cached in the memory.
+        :param ttl: The time-to-live (in seconds) of the cached results. Default: no expiration.
+        :param disk_cache: The disk cache for storing the results evicted from the memory, which is optional.
+        """
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.capacity = capacity
+        self.ttl = ttl
+        self.disk_cache = disk_cache
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> Union["ResultCache", None]:
+        """
+        Creates a result cache configured by the environment variables `RESULT_CACHE_SIZE`,
+        `RESULT_CACHE_TTL`, `RESULT_CACHE_DIR` and `RESULT_CACHE_DISK_CAPACITY`.
+        Returns None if `RESULT_CACHE_SIZE` is not set, i.e., the result cache is disabled.
+        """
+        capacity = int(os.getenv("RESULT_CACHE_SIZE", 0))
+        if capacity <= 0:
+            return None
+        disk_cache = None
+        if os.getenv("RESULT_CACHE_DIR"):
+            disk_cache = DiskLRUCache(
+                capacity=int(os.getenv("RESULT_CACHE_DISK_CAPACITY", 10 ** 9)),
+                cache_dir=os.getenv("RESULT_CACHE_DIR")
+            )
+        return cls(
+            name=name,
+            capacity=capacity,
+            ttl=float(os.getenv("RESULT_CACHE_TTL", 0)) or None,
+            disk_cache=disk_cache
+        )
+
+    @staticmethod
+    def make_key(payload: Dict, upload_target: str = None) -> str:
+        """
+        Computes the cache key of a request payload from its canonical JSON representation.
+
+        :param payload: The validated request payload.
+        :param upload_target: The upload webhook or bucket of the output files, if any, so that the URLs
+            uploaded to one target are not returned to the requests asking for another one.
+        """
+        if upload_target is not None:
+            payload = {"payload": payload, "upload_target": upload_target}
+        data = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return format(mmh3.hash128(data, signed=False), "032x")
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.cache)}
+
+    def _hit(self):
+        self.hits += 1
+        RESULT_CACHE_HITS.labels(name=self.name).inc()
+
+    def _miss(self):
+        self.misses += 1
+        RESULT_CACHE_MISSES.labels(name=self.name).inc()
+
+    def get(self, key: str) -> Union[Any, None]:
+        """
+        Gets a copy of the cached result given a key, or None if the result is not cached or expired.
+        """
+        with self.lock:
+            if key in self.cache:
+                expire_time, value = self.cache[key]
+                if expire_time is None or expire_time > time.time():
+                    self.cache.move_to_end(key)
+                    self._hit()
+                    return copy.deepcopy(value)
+                del self.cache[key]
+
+        if self.disk_cache is not None:
+            item = self._load_from_disk(key)
+            if item is not None:
+                self._set(key, *item)
+                self._hit()
+                return copy.deepcopy(item[1])
+        self._miss()
+        return None
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """
+        Caches a copy of a result.
+
+        :param key: The cache key.
+        :param value: The result.
+        :param ttl: The time-to-live (in seconds) of this result if it is shorter than the one of the cache,
+            e.g., the expiration time of the URLs in the result.
+        """
+        if self.ttl and (not ttl or self.ttl < ttl):
+            ttl = self.ttl
+        expire_time = time.time() + ttl if ttl else None
+        self._set(key, expire_time, copy.deepcopy(value))
+
+    def _set(self, key, expire_time, value):
+        evicted = []
+        with self.lock:
+            self.cache[key] = (expire_time, value)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.capacity:
+                evicted.append(self.cache.popitem(last=False))
+                self.evictions += 1
+                RESULT_CACHE_EVICTIONS.labels(name=self.name).inc()
+        if self.disk_cache is not None:
+            for cache_key, (cache_expire_time, cache_value) in evicted:
+                self._save_to_disk(cache_key, cache_expire_time, cache_value)
+
+    def _save_to_disk(self, key, expire_time, value):
+        if expire_time is not None and expire_time <= time.time():
+            return
+        path = None
+        try:
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+                path = f.name
+                json.dump({"expire_time": expire_time, "value": value}, f)
+            self.disk_cache[key] = path
+        except Exception as e:
+            self.logger.error(f"failed to save result {key} to disk: {e}")
+        finally:
+            if path is not None and os.path.isfile(path):
+                os.remove(path)
+
+    def _load_from_disk(self, key):
+        try:
+            path = self.disk_cache[key]
+            if path is None:
+                return None
+            with open(path, "r") as f:
+                item = json.load(f)
+        except Exception as e:
+            self.logger.error(f"failed to load result {key} from disk: {e}")
+            return None
+        if item["expire_time"] is not None and item["expire_time"] <= time.time():
+            return None
+        return item["expire_time"], item["value"]
+
+
 ###################################################################
 # Disk cache designed for caching models loaded from S3 on disk
 ###################################################################
+# The ioctl request for cloning a file (a reflink) on Btrfs, XFS, etc.
+FICLONE = 0x40049409
+
+
+def _clone_file(src: str, dst: str):
+    """
+    Copies a file without reading it into the user space, i.e., with a reflink if the filesystem supports it,
+    or with `copy_file_range`, and falls back to a normal copy.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except OSError:
+            pass
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 2 ** 30))
+                    if n == 0:
+                        break
+                    remaining -= n
+                return
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+
 class DiskLRUCache:
+    INDEX_BACKENDS = {"journal": JournaledIndex, "sqlite": SQLiteIndex}
+    # The staging files not modified for this time (in seconds) are left by crashed processes
+    STALE_STAGING_AGE = 3600
 
-    def __init__(self, capacity: int = None, cache_dir: str = None):
+    def __init__(self, capacity: int = None, cache_dir: str = None, index_backend: str = None):
+        """
+        :param capacity: The capacity (in Bytes) of the cache.
+        :param cache_dir: The cache directory for storing files.
+        :param index_backend: The index backend, i.e., "journal" (default) or "sqlite".
+            If it is not set, the environment variable `DISK_CACHE_INDEX` is used.
+        """
         if not capacity:
             capacity = 10 * 10 ** 9
         if not cache_dir:
             cache_dir = tempfile.gettempdir()
+        if not index_backend:
+            index_backend = os.getenv("DISK_CACHE_INDEX", "journal")
+        assert index_backend in DiskLRUCache.INDEX_BACKENDS, \
+            f"`index_backend` should be one of {list(DiskLRUCache.INDEX_BACKENDS.keys())}"
 
         self.capacity = capacity
         self.cache_dir = cache_dir
-        self.cache = OrderedDict()
-        self.total_size = 0
         if not os.path.exists(self.cache_dir):
             os.mkdir(self.cache_dir)
 
-        self.lock_path = os.path.join(self.cache_dir, "lock")
-        self.index_file = os.path.join(self.cache_dir, "index")
-        with flock(self.lock_path):
-            if os.path.exists(self.index_file):
-                self._load()
-            else:
-                self._save()
+        self.index = DiskLRUCache.INDEX_BACKENDS[index_backend](self.cache_dir)
+        self.index.open()
 
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
+        self._remove_stale_staging_files()
 
-    def _load(self):
-        with open(self.index_file, "rb") as f:
-            self.total_size, self.cache = pickle.load(f)
+    @property
+    def cache(self) -> OrderedDict:
+        return self.index.entries
 
-    def _save(self):
-        with open(self.index_file, "wb") as f:
-            pickle.dump((self.total_size, self.cache), f)
+    @property
+    def total_size(self) -> int:
+        return self.index.total_size
 
     def __getitem__(self, key: str):
-        with flock(self.lock_path):
-            if os.path.exists(self.index_file):
-                self._load()
-            if key not in self.cache:
+        with self.index.transaction():
+            item = self.index.get(key)
+            if item is None:
                 return None
-            self.cache.move_to_end(key)
-            self._save()
-            item = self.cache[key]
+            self.index.touch(key)
             path = os.path.join(self.cache_dir, item["filename"])
             if os.path.isfile(path):
                 return path
@@ -154,41 +430,96 @@ class DiskLRUCache:
                 return None
 
     def __setitem__(self, key: str, filepath: str):
-        with flock(self.lock_path):
-            if os.path.exists(self.index_file):
-                self._load()
+        self.set(key, filepath)
+
+    def staging_path(self) -> str:
+        """
+        Returns a unique path in the cache directory for writing a file before it is added by `set`
+        with `move=True`, e.g., a file being downloaded.
+        """
+        return os.path.join(self.cache_dir, f".staging-{uuid.uuid4().hex}")
 
+    def _remove_stale_staging_files(self):
+        """
+        Removes the staging files left by the processes that crashed before renaming them into the cache.
+        The staging files of the other running processes are kept since they are recently modified.
+        """
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.startswith(".staging-"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > DiskLRUCache.STALE_STAGING_AGE:
+                    os.remove(entry.path)
+                    self.logger.info(f"removed stale staging file {entry.name}")
+            except FileNotFoundError:
+                pass
+
+    def _stage(self, filepath: str, move: bool) -> str:
+        path = self.staging_path()
+        if move:
+            try:
+                os.rename(filepath, path)
+                # A rename keeps the modification time, so mark the file as fresh for the stale file sweep
+                os.utime(path)
+                return path
+            except OSError as e:
+                # The file is on another filesystem
+                if e.errno != errno.EXDEV:
+                    raise
+        _clone_file(filepath, path)
+        if move:
+            os.remove(filepath)
+        return path
+
+    def set(self, key: str, filepath: str, move: bool = False):
+        """
+        Adds a file into the cache. The file is moved or copied into the cache directory before
+        the lock is acquired, and then renamed to its final path, so the other readers never see
+        a partially written file.
+
+        :param key: The cache key, which is also the filename in the cache directory.
+        :param filepath: The path of the file.
+        :param move: Whether to move the file (which is a rename if it is on the same filesystem,
+            e.g., a file at `staging_path()`) instead of copying it.
+        """
+        staged_path = self._stage(filepath, move)
+        try:
+            self._commit(key, staged_path)
+        finally:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+
+    def _commit(self, key: str, staged_path: str):
+        with self.index.transaction(write=True):
             # Check if the cache is full or the item exists
-            while self.total_size >= self.capacity:
+            while self.index.total_size >= self.capacity:
                 self.logger.info(f"cache hit capacity {self.capacity}")
-                cache_key, item = self.cache.popitem(last=False)
-                self.total_size -= item["size"]
+                cache_key, item = self.index.least_recently_used()
+                self.index.remove(cache_key)
                 path = os.path.join(self.cache_dir, item["filename"])
                 if os.path.isfile(path):
                     os.remove(path)
-                self.logger.info("evicted {cache_key} from cache")
-
-            if key in self.cache:
-                item = self.cache[key]
-                self.total_size -= item["size"]
-                del self.cache[key]
-                path = os.path.join(self.cache_dir, item["filename"])
-                if os.path.isfile(path):
-                    os.remove(path)
-            self._save()
-
-            # Copy the file and update the cache
-            file_stats = os.stat(filepath)
+                self.logger.info(f"evicted {cache_key} from cache")
+
+            item = self.index.get(key)
+            if item is not None:
+                self.index.remove(key)
+                if item["filename"] != key:
+                    path = os.path.join(self.cache_dir, item["filename"])
+                    if os.path.isfile(path):
+                        os.remove(path)
+
+            # Rename the staged file (replacing the existing one) and update the cache
+            file_stats = os.stat(staged_path)
             item = {"filename": key, "size": file_stats.st_size}
-            path = os.path.join(self.cache_dir, item["filename"])
-            shutil.copyfile(filepath, path)
-            self.cache[key] = item
-            self.cache.move_to_end(key)
-            self.total_size += item["size"]
-            self._save()
+            os.replace(staged_path, os.path.join(self.cache_dir, item["filename"]))
+            self.index.set(key, item)
 
 
 class DiskCache:
+    # The number of lock files shared by the keys, so that the lock files don't grow with the keys
+    NUM_LOCK_STRIPES = 64
 
     def __init__(
             self,
@@ -198,7 +529,8 @@ class DiskCache:
             aws_bucket: str = os.getenv("BUCKET", "hypergai-upload-models"),
             aws_region_name: str = os.getenv("REGION_NAME", "ap-southeast-1"),
             aws_access_key_id: str = os.getenv("AWS_ACCESS_KEY_ID", ""),
-            aws_secret_access_key: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
+            aws_secret_access_key: str = os.getenv("AWS_SECRET_ACCESS_KEY", ""),
+            index_backend: str = os.getenv("DISK_CACHE_INDEX", "journal")
     ):
         """
         :param num_shards: The number of cache shards.
@@ -208,6 +540,7 @@ class DiskCache:
         :param aws_region_name: AWS S3 bucket region.
         :param aws_access_key_id: AWS S3 access key ID.
         :param aws_secret_access_key: AWS S3 secret access key.
+        :param index_backend: The index backend of the cache shards, i.e., "journal" or "sqlite".
         """
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -217,8 +550,9 @@ class DiskCache:
 
         self.caches = []
         for i in range(num_shards):
-            cache = DiskLRUCache(capacity // num_shards, os.path.join(cache_dir, f"{i}"))
+            cache = DiskLRUCache(capacity // num_shards, os.path.join(cache_dir, f"{i}"), index_backend)
             self.caches.append(cache)
+        self._remove_key_lock_files()
 
         self.bucket = aws_bucket
         self.region_name = aws_region_name
@@ -246,6 +580,34 @@ class DiskCache:
                 return j
         return b - 1
 
+    def _lock_path(self, key: str) -> str:
+        """
+        Returns the lock file of a key. The keys are hashed into `NUM_LOCK_STRIPES` lock files, so
+        the downloads of different keys rarely wait for each other.
+        """
+        stripe = mmh3.hash(str(key), signed=False) % DiskCache.NUM_LOCK_STRIPES
+        return os.path.join(self.cache_dir, f".lock-{stripe}")
+
+    def _remove_key_lock_files(self):
+        """
+        Removes the `{key}.lock` files created by the previous versions, which used one lock file per key.
+        The files still locked by the running processes are kept.
+        """
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".lock") or not entry.is_file():
+                continue
+            try:
+                fd = os.open(entry.path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(entry.path)
+            except (BlockingIOError, FileNotFoundError):
+                pass
+            finally:
+                os.close(fd)
+
     def get(self, key: str) -> Union[str, None]:
         """
         Gets the filepath given a key (filename). If the file is not in the cache, it will
@@ -264,7 +626,7 @@ class DiskCache:
             self.logger.error(str(e))
             return None
 
-        with flock(os.path.join(self.cache_dir, f"{key}.lock")):
+        with flock(self._lock_path(key)):
             # Try again if acquired the file lock (other process might download the file)
             try:
                 path = cache[key]
@@ -275,18 +637,20 @@ class DiskCache:
                 return None
 
             if self.storage is not None:
-                filepath = "/tmp/tmp_file"
-                if os.path.isfile(filepath):
-                    os.remove(filepath)
-                if not self.storage.download(key=key, filename=filepath):
-                    self.logger.error(f"failed to download file: {key}")
-                    return None
+                # Download to a unique file on the same filesystem, which is then renamed into the cache
+                filepath = cache.staging_path()
                 try:
-                    cache[key] = filepath
+                    if not self.storage.download(key=key, filename=filepath):
+                        self.logger.error(f"failed to download file: {key}")
+                        return None
+                    cache.set(key, filepath, move=True)
                     return cache[key]
                 except Exception as e:
                     self.logger.error(str(e))
                     return None
+                finally:
+                    if os.path.isfile(filepath):
+                        os.remove(filepath)
             else:
                 return None
 
@@ -300,7 +664,7 @@ class DiskCache:
         """
         cache_index = self._shard_index(key)
         cache = self.caches[cache_index]
-        with flock(os.path.join(self.cache_dir, f"{key}.lock")):
+        with flock(self._lock_path(key)):
             try:
                 if self.storage is not None and \
                         not self.storage.upload(filename=filepath, key=key):
@@ -325,7 +689,8 @@ class ModelCache:
             aws_bucket: str = os.getenv("BUCKET", "hypergai-upload-models"),
             aws_region_name: str = os.getenv("REGION_NAME", "ap-southeast-1"),
             aws_access_key_id: str = os.getenv("AWS_ACCESS_KEY_ID", ""),
-            aws_secret_access_key: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
+            aws_secret_access_key: str = os.getenv("AWS_SECRET_ACCESS_KEY", ""),
+            index_backend: str = os.getenv("DISK_CACHE_INDEX", "journal")
     ):
         """
         :param num_shards: The number of cache shards.
@@ -337,6 +702,7 @@ class ModelCache:
         :param aws_region_name: AWS S3 bucket region.
         :param aws_access_key_id: AWS S3 access key ID.
         :param aws_secret_access_key: AWS S3 secret access key.
+        :param index_backend: The index backend of the disk cache, i.e., "journal" or "sqlite".
         """
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -347,16 +713,42 @@ class ModelCache:
             aws_bucket=aws_bucket,
             aws_region_name=aws_region_name,
             aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
+            aws_secret_access_key=aws_secret_access_key,
+            index_backend=index_backend
         )
         self.mem_cache = MemoryLRUCache(
             num_cached_objects=num_mem_objects
         )
         self.load_func = model_load_func
+        self.flights = SingleFlight()
 
     def get(self, key: str) -> Union[Any, None]:
         model = self.mem_cache.get(key)
         # Hit the memory cache
+        if model is not None:
+            return model
+        # Only one caller loads the model, and the others wait for it
+        try:
+            return self.flights.do(key, lambda: self._load(key))
+        except Exception as e:
+            self.logger.error(str(e))
+            return None
+
+    async def aget(self, key: str) -> Union[Any, None]:
+        """
+        The async version of `get`, which loads the model in a worker thread.
+        """
+        model = self.mem_cache.get(key)
+        if model is not None:
+            return model
+        try:
+            return await self.flights.ado(key, lambda: self._load(key))
+        except Exception as e:
+            self.logger.error(str(e))
+            return None
+
+    def _load(self, key: str) -> Union[Any, None]:
+        model = self.mem_cache.get(key)
         if model is not None:
             return model
         # Try to load from the disk cache
@@ -364,16 +756,12 @@ class ModelCache:
         if path is None:
             self.logger.error(f"model with key {key} doesn't exist in disk cache")
             return None
-        try:
-            # Load the model
-            model = self.load_func(path) if self.load_func is not None else path
-            if model is None:
-                return None
-            self.mem_cache.set(key, model)
-            return model
-        except Exception as e:
-            self.logger.error(str(e))
+        # Load the model
+        model = self.load_func(path) if self.load_func is not None else path
+        if model is None:
             return None
+        self.mem_cache.set(key, model)
+        return model
 
     def set(self, key: str, filepath: str) -> bool:
         # Set the disk cache first
@@ -0,0 +1,336 @@
+import os
+import glob
+import json
+import time
+import pickle
+import sqlite3
+import threading
+from typing import Dict, Tuple, Union
+from contextlib import contextmanager
+from collections import OrderedDict
+from .locks import flock
+
+
+class JournaledIndex:
+
+    def __init__(self, folder: str, compact_threshold: int = 1000):
+        """
+        The LRU index of a disk cache, i.e., the cached items ordered from the least recently used
+        to the most recently used, and their total size. The index is kept in the memory, and the
+        changes are appended to a journal file, from which the other processes sharing the cache
+        directory catch up. The journal is compacted into a snapshot once it has more than
+        `max(compact_threshold, number of items)` records.
+
+        The methods other than `open` should be called inside `transaction`, which holds the lock
+        of the cache directory. Lookups hold a shared lock, so that the hits in different processes
+        don't block each other, and their records are appended to the journal concurrently. Once
+        they exceed the threshold, the lookup takes the exclusive lock after releasing the shared one
+        to compact the journal.
+
+        :param folder: The cache directory.
+        :param compact_threshold: The minimum number of journal records before compaction.
+        """
+        self.folder = folder
+        self.snapshot_file = os.path.join(folder, "index")
+        self.lock_path = os.path.join(folder, "lock")
+        self.compact_threshold = compact_threshold
+
+        self.entries = OrderedDict()
+        self.total_size = 0
+        # The snapshot generation, i.e., the number of compactions, and the position in its journal
+        self.generation = 0
+        self.offset = 0
+        self.num_records = 0
+        # The in-memory index is shared by the threads of a process
+        self.lock = threading.RLock()
+        self.exclusive = False
+
+    def _journal_file(self, generation: int) -> str:
+        return os.path.join(self.folder, f"journal.{generation}")
+
+    def open(self):
+        with self.lock, flock(self.lock_path):
+            self.load()
+
+    @contextmanager
+    def transaction(self, write: bool = False):
+        """
+        Holds the lock of the cache directory, and applies the changes made by the other processes.
+
+        :param write: Whether the index is going to be modified, which needs an exclusive lock.
+            Otherwise, only `touch` is allowed.
+        """
+        with self.lock:
+            with flock(self.lock_path, shared=not write):
+                self.exclusive = write
+                try:
+                    self.sync()
+                    yield
+                finally:
+                    self.exclusive = False
+            # The journal can't be compacted under the shared lock, so the records of the lookups
+            # are compacted afterwards with the exclusive lock, which keeps the journal bounded
+            if not write and self._needs_compaction():
+                with flock(self.lock_path):
+                    self.sync()
+                    if self._needs_compaction():
+                        self.compact()
+
+    def load(self):
+        """
+        Loads the snapshot (or creates an empty one) and replays its journal.
+        """
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, "rb") as f:
+                data = pickle.load(f)
+            # The index files written before the journal was added don't have the generation
+            self.total_size, self.entries = data[0], data[1]
+            self.generation = data[2] if len(data) > 2 else 0
+        else:
+            self.total_size, self.entries, self.generation = 0, OrderedDict(), 0
+            self._save_snapshot()
+        self.offset, self.num_records = 0, 0
+
+        journal_file = self._journal_file(self.generation)
+        if not os.path.exists(journal_file):
+            open(journal_file, "ab").close()
+        # Remove the journals left by an interrupted compaction
+        for path in glob.glob(os.path.join(self.folder, "journal.*")):
+            if path != journal_file and path.rsplit(".", 1)[-1].isdigit():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Removed by another process holding the shared lock
+                    pass
+        self._replay()
+
+    def sync(self):
+        """
+        Applies the changes made by the other processes since the last call.
+        """
+        if not os.path.exists(self._journal_file(self.generation)) or \
+                os.path.exists(self._journal_file(self.generation + 1)):
+            # The journal has been compacted by another process
+            self.load()
+        else:
+            self._replay()
+
+    def _replay(self):
+        with open(self._journal_file(self.generation), "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Skip the last record if it is not completely written
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            self._apply(json.loads(line))
+            self.num_records += 1
+        self.offset += end
+
+    def _apply(self, record: Dict):
+        op, key = record["op"], record["key"]
+        if op == "touch":
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        elif op == "set":
+            if key in self.entries:
+                self.total_size -= self.entries.pop(key)["size"]
+            self.entries[key] = record["item"]
+            self.total_size += record["item"]["size"]
+        elif op == "remove":
+            if key in self.entries:
+                self.total_size -= self.entries.pop(key)["size"]
+
+    def _append(self, record: Dict):
+        # The records appended by the other processes holding the shared lock may come before this one,
+        # so the journal is replayed instead of applying the record directly
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        fd = os.open(self._journal_file(self.generation), os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self._replay()
+        if self.exclusive and self._needs_compaction():
+            self.compact()
+
+    def _needs_compaction(self) -> bool:
+        return self.num_records > max(self.compact_threshold, len(self.entries))
+
+    def _save_snapshot(self):
+        path = f"{self.snapshot_file}.tmp"
+        with open(path, "wb") as f:
+            pickle.dump((self.total_size, self.entries, self.generation), f)
+        os.replace(path, self.snapshot_file)
+
+    def compact(self):
+        """
+        Writes the index into a new snapshot and starts a new journal.
+        """
+        old_journal = self._journal_file(self.generation)
+        self.generation += 1
+        open(self._journal_file(self.generation), "wb").close()
+        self._save_snapshot()
+        os.remove(old_journal)
+        self.offset, self.num_records = 0, 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Union[Dict, None]:
+        return self.entries.get(key, None)
+
+    def touch(self, key: str):
+        """
+        Marks an item as the most recently used one.
+        """
+        if next(reversed(self.entries), None) != key:
+            self._append({"op": "touch", "key": key})
+
+    def set(self, key: str, item: Dict):
+        """
+        Adds or replaces an item, where `item["size"]` is its size.
+        """
+        self._append({"op": "set", "key": key, "item": item})
+
+    def remove(self, key: str):
+        self._append({"op": "remove", "key": key})
+
+    def least_recently_used(self) -> Tuple[str, Dict]:
+        return next(iter(self.entries.items()))
+
+
+class SQLiteIndex:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_access INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+        CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY, total_size INTEGER NOT NULL);
+        INSERT OR IGNORE INTO stats VALUES (0, 0);
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+            UPDATE stats SET total_size = total_size + NEW.size WHERE id = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+            UPDATE stats SET total_size = total_size - OLD.size WHERE id = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+            UPDATE stats SET total_size = total_size - OLD.size + NEW.size WHERE id = 0;
+        END;
+    """
+
+    def __init__(self, folder: str, timeout: float = 300):
+        """
+        The LRU index of a disk cache stored in a SQLite database in WAL mode, with one row per item
+        holding its size and last access time. The processes sharing the cache directory read the index
+        without blocking each other, and the least recently used items are found by an indexed query.
+
+        The methods other than `open` should be called inside `transaction`.
+
+        :param folder: The cache directory.
+        :param timeout: The maximum time (in seconds) to wait for the database lock.
+        """
+        self.folder = folder
+        self.db_file = os.path.join(folder, "index.db")
+        self.snapshot_file = os.path.join(folder, "index")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # A connection can only be used by the thread (and the process) that creates it
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def open(self):
+        """
+        Creates the tables, and imports the items from the pickle index if the cache directory has one.
+        """
+        self.conn.executescript(self.SCHEMA)
+        with self.transaction(write=True):
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] > 0:
+                return
+            if os.path.exists(self.snapshot_file):
+                index = JournaledIndex(self.folder)
+                index.open()
+                for key, item in index.entries.items():
+                    self.set(key, item)
+            self.conn.execute("PRAGMA user_version = 1")
+
+    @contextmanager
+    def transaction(self, write: bool = False):
+        """
+        Runs the queries inside in one transaction if `write` is true, which blocks the other writers
+        (but not the readers) until it is committed.
+
+        :param write: Whether the index is going to be modified.
+        """
+        if not write:
+            yield
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+
+    @property
+    def total_size(self) -> int:
+        return self.conn.execute("SELECT total_size FROM stats WHERE id = 0").fetchone()[0]
+
+    @property
+    def entries(self) -> OrderedDict:
+        rows = self.conn.execute("SELECT key, filename, size FROM entries ORDER BY last_access")
+        return OrderedDict((key, {"filename": filename, "size": size}) for key, filename, size in rows)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Union[Dict, None]:
+        row = self.conn.execute("SELECT filename, size FROM entries WHERE key = ?", (key,)).fetchone()
+        return {"filename": row[0], "size": row[1]} if row is not None else None
+
+    def touch(self, key: str):
+        """
+        Marks an item as the most recently used one.
+        """
+        # The access time (in nanoseconds) is kept larger than the others, so that the order is strict
+        self.conn.execute(
+            "UPDATE entries SET last_access = MAX(?, (SELECT MAX(last_access) FROM entries) + 1) WHERE key = ?",
+            (time.time_ns(), key)
+        )
+
+    def set(self, key: str, item: Dict):
+        """
+        Adds or replaces an item, where `item["size"]` is its size.
+        """
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.conn.execute(
+            "INSERT INTO entries VALUES (?, ?, ?, "
+            "MAX(?, COALESCE((SELECT MAX(last_access) FROM entries), 0) + 1))",
+            (key, item["filename"], item["size"], time.time_ns())
+        )
+
+    def remove(self, key: str):
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def least_recently_used(self) -> Tuple[str, Dict]:
+        key, filename, size = self.conn.execute(
+            "SELECT key, filename, size FROM entries ORDER BY last_access LIMIT 1").fetchone()
+        return key, {"filename": filename, "size": size}
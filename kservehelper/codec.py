@@ -0,0 +1,115 @@
+import os
+import json
+import email.parser
+import email.policy
+import tempfile
+from typing import Dict, Iterable, List, Union
+
+import msgpack
+from kservehelper.types import Path
+
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+MULTIPART_CONTENT_TYPE = "multipart/form-data"
+
+
+def get_content_type(headers: Dict[str, str] = None) -> str:
+    """
+    Returns the media type of the request, e.g., "application/json", without parameters.
+    """
+    if not headers:
+        return ""
+    for key, value in headers.items():
+        if key.lower() == "content-type":
+            return value.split(";")[0].strip().lower()
+    return ""
+
+
+def is_binary_content_type(content_type: str) -> bool:
+    return content_type in MSGPACK_CONTENT_TYPES or content_type == MULTIPART_CONTENT_TYPE
+
+
+def decode_payload(
+        payload: Union[Dict, bytes],
+        headers: Dict[str, str] = None,
+        path_inputs: Iterable[str] = (),
+        temp_files: List[str] = None
+) -> Dict:
+    """
+    Decodes a request body according to its content type. JSON, msgpack and multipart/form-data
+    are supported. In a multipart body, file fields are mapped to `bytes`, or to `Path` if the input
+    is declared as `Path`, and the other fields are parsed as JSON values if possible.
+
+    :param payload: The request body.
+    :param headers: The request headers.
+    :param path_inputs: The names of the inputs with type `Path`.
+    :param temp_files: The list to append the paths of the temporary files created for the `Path` inputs,
+        which should be removed by the caller via `remove_files` once the request is finished.
+    :return: The decoded payload.
+    """
+    if isinstance(payload, dict):
+        return payload
+    content_type = get_content_type(headers)
+    if content_type in MSGPACK_CONTENT_TYPES:
+        payload = msgpack.unpackb(payload, raw=False)
+    elif content_type == MULTIPART_CONTENT_TYPE:
+        payload = _decode_multipart(payload, headers, path_inputs, temp_files)
+    else:
+        payload = json.loads(payload.decode("utf-8"))
+    assert isinstance(payload, dict), "The request body should be a map from input names to values"
+    return payload
+
+
+def _decode_multipart(
+        body: bytes,
+        headers: Dict[str, str],
+        path_inputs: Iterable[str],
+        temp_files: List[str] = None
+) -> Dict:
+    content_type = [v for k, v in headers.items() if k.lower() == "content-type"][0]
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    assert message.is_multipart(), "Invalid multipart/form-data request body"
+
+    payload = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name is None:
+            continue
+        filename = part.get_filename()
+        value = part.get_payload(decode=True)
+        if name in path_inputs:
+            payload[name] = _save_file(value, filename or name)
+            if temp_files is not None:
+                temp_files.append(str(payload[name]))
+        elif filename is not None or not _is_text(part):
+            payload[name] = value
+        else:
+            text = value.decode(part.get_content_charset() or "utf-8")
+            try:
+                payload[name] = json.loads(text)
+            except ValueError:
+                payload[name] = text
+    return payload
+
+
+def _is_text(part) -> bool:
+    return part.get_content_maintype() == "text" or part.get_content_type() == "application/json"
+
+
+def _save_file(data: bytes, filename: str) -> Path:
+    suffix = os.path.splitext(os.path.basename(filename))[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(data)
+    return Path(f.name)
+
+
+def remove_files(paths: Iterable[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def encode_msgpack(data) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
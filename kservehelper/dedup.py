@@ -0,0 +1,71 @@
+import os
+import hashlib
+import threading
+from typing import Optional, Union
+from collections import OrderedDict
+from kservehelper.types import Path, BytesFile
+
+
+class UploadDeduplicator:
+
+    def __init__(self, capacity: int = 1024, check_exists: bool = False, block_size: int = 1024 * 1024):
+        """
+        Remembers the URLs of the uploaded files by their content hashes, so that an output file
+        identical to one uploaded before via the same webhook is not uploaded again.
+
+        :param capacity: The maximum number of URLs to keep. The least recently used ones are removed first.
+        :param check_exists: Whether to send a `HEAD` request to a known URL before reusing it, in case
+            the file has been removed from the storage.
+        :param block_size: The block size for reading the files while hashing.
+        """
+        self.capacity = capacity
+        self.check_exists = check_exists
+        self.block_size = block_size
+        self.urls = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_env() -> Optional["UploadDeduplicator"]:
+        """
+        Creates a deduplicator if `UPLOAD_DEDUP_SIZE` > 0. `UPLOAD_DEDUP_CHECK=1` enables the `HEAD` check.
+        """
+        capacity = int(os.getenv("UPLOAD_DEDUP_SIZE", 0))
+        if capacity <= 0:
+            return None
+        return UploadDeduplicator(
+            capacity=capacity,
+            check_exists=os.getenv("UPLOAD_DEDUP_CHECK", "0").lower() in ("1", "true")
+        )
+
+    def digest(self, path: Union[Path, BytesFile]) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        if isinstance(path, BytesFile):
+            h.update(path.getbuffer())
+        else:
+            with open(str(path), "rb") as f:
+                while True:
+                    block = f.read(self.block_size)
+                    if not block:
+                        break
+                    h.update(block)
+        return h.hexdigest()
+
+    def get(self, webhook_url: str, digest: str) -> Optional[str]:
+        with self.lock:
+            key = (webhook_url, digest)
+            if key not in self.urls:
+                return None
+            self.urls.move_to_end(key)
+            return self.urls[key]
+
+    def set(self, webhook_url: str, digest: str, url: str):
+        with self.lock:
+            key = (webhook_url, digest)
+            self.urls[key] = url
+            self.urls.move_to_end(key)
+            while len(self.urls) > self.capacity:
+                self.urls.popitem(last=False)
+
+    def remove(self, webhook_url: str, digest: str):
+        with self.lock:
+            self.urls.pop((webhook_url, digest), None)
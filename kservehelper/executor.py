@@ -0,0 +1,131 @@
+import os
+import asyncio
+import inspect
+import functools
+import contextlib
+import concurrent.futures
+from typing import AsyncIterator, Callable, Iterator, Union
+from kservehelper.streaming import iterate_in_thread
+
+
+class ExecutorBusyError(RuntimeError):
+    pass
+
+
+class ModelExecutor:
+    MODES = ("inline", "thread")
+
+    def __init__(
+            self,
+            mode: str = "inline",
+            max_concurrency: int = None,
+            max_queue_size: int = None,
+            num_workers: int = None
+    ):
+        """
+        Runs the synchronous methods of a model (e.g., `predict`) without blocking the event loop.
+
+        :param mode: "inline" calls synchronous methods directly on the event loop, and "thread" runs
+            them in a thread pool so that the server keeps handling other requests.
+        :param max_concurrency: The maximum number of calls (and generators being iterated) running at
+            the same time. Default: 1, since a model instance (and its GPU) is usually not thread-safe.
+        :param max_queue_size: The maximum number of calls waiting for a free slot. New calls are rejected
+            with `ExecutorBusyError` if the queue is full. Default: unlimited.
+        :param num_workers: The number of threads in a dedicated thread pool. If it is not set, the default
+            executor of the event loop is used, i.e., the pool with `max_asyncio_workers` threads installed
+            by `ModelServer.start`.
+        """
+        if mode not in ModelExecutor.MODES:
+            raise ValueError(f"Invalid execution mode: {mode}, it should be one of {ModelExecutor.MODES}")
+        self.mode = mode
+        self.max_queue_size = max_queue_size
+        if max_concurrency is None:
+            max_concurrency = 1
+        self.max_concurrency = max_concurrency
+
+        self.pool = None
+        if mode == "thread" and num_workers:
+            self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+        self._loop = None
+        self._semaphore = None
+        self._num_waiting = 0
+
+    @classmethod
+    def from_env(cls) -> "ModelExecutor":
+        """
+        Creates an executor configured by the environment variables `EXECUTION_MODE`, `MAX_CONCURRENCY`,
+        `MAX_QUEUE_SIZE` and `EXECUTOR_WORKERS`.
+        """
+
+        def _getenv(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        return cls(
+            mode=os.getenv("EXECUTION_MODE", "inline"),
+            max_concurrency=_getenv("MAX_CONCURRENCY"),
+            max_queue_size=_getenv("MAX_QUEUE_SIZE"),
+            num_workers=_getenv("EXECUTOR_WORKERS")
+        )
+
+    @property
+    def num_waiting(self) -> int:
+        return self._num_waiting
+
+    def _get_semaphore(self, loop) -> asyncio.Semaphore:
+        if self._loop is not loop:
+            # The semaphore is bound to the event loop it is created in
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """
+        Waits for one of the `max_concurrency` slots and holds it inside the context.
+        """
+        semaphore = self._get_semaphore(asyncio.get_running_loop())
+        if semaphore.locked() and self.max_queue_size is not None \
+                and self._num_waiting >= self.max_queue_size:
+            raise ExecutorBusyError(f"The number of waiting requests exceeds {self.max_queue_size}")
+
+        self._num_waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._num_waiting -= 1
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        Calls `func` with the given arguments. Coroutine functions are awaited directly, and
+        synchronous functions are called according to the execution mode.
+        """
+        if inspect.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+        async with self.slot():
+            if self.mode == "inline":
+                return func(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, functools.partial(func, *args, **kwargs))
+
+    async def iterate(self, generator: Union[Iterator, AsyncIterator]) -> AsyncIterator:
+        """
+        Iterates the outputs of a generator `predict`, holding a slot until the generator is exhausted
+        or closed, so that it doesn't run at the same time as the other calls of the model. A synchronous
+        generator is stepped in a worker thread, so that the event loop is not blocked.
+        """
+        async with self.slot():
+            if isinstance(generator, AsyncIterator):
+                async for item in generator:
+                    yield item
+            else:
+                async for item in iterate_in_thread(generator, wait=True):
+                    yield item
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
@@ -14,6 +14,7 @@
 
 import argparse
 import asyncio
+import inspect
 import concurrent.futures
 import multiprocessing
 import signal
@@ -32,6 +33,7 @@ from kserve.protocol.dataplane import DataPlane, InferRequest
 from kserve.protocol.grpc.server import GRPCServer
 from kserve.protocol.model_repository_extension import ModelRepositoryExtension
 from kservehelper.kserve.rest.server import UvicornServer
+from kservehelper.codec import get_content_type, is_binary_content_type
 from kserve.utils import utils
 
 DEFAULT_HTTP_PORT = 8080
@@ -69,6 +71,12 @@ class CustomDataPlane(DataPlane):
     def __init__(self, model_registry: ModelRepository):
         super().__init__(model_registry)
 
+    def decode(self, body, headers) -> Tuple[Union[Dict, InferRequest], Dict]:
+        # Binary request bodies (e.g., msgpack or multipart) are decoded by the model
+        if isinstance(body, bytes) and is_binary_content_type(get_content_type(headers)):
+            return body, {}
+        return super().decode(body, headers)
+
     async def generate(
             self,
             model_name: str,
@@ -92,7 +100,11 @@ class CustomDataPlane(DataPlane):
         body = self.decode(body, headers)
 
         model = self.get_model(model_name)
-        response = model.generate(body, headers=headers)
+        response = (
+            await model.generate(body, headers=headers)
+            if inspect.iscoroutinefunction(model.generate)
+            else model.generate(body, headers=headers)
+        )
         return response, headers
 
 
@@ -19,6 +19,7 @@ from fastapi.responses import StreamingResponse
 from kserve.errors import ModelNotReady
 from kserve.protocol.dataplane import DataPlane
 from kserve.protocol.model_repository_extension import ModelRepositoryExtension
+from kservehelper.codec import MSGPACK_CONTENT_TYPES, encode_msgpack
 
 
 class V1Endpoints:
@@ -58,6 +59,9 @@ class V1Endpoints:
 
         It sends the request to the dataplane where the model will process the request body.
 
+        The request body can be JSON, msgpack (``application/msgpack``) or ``multipart/form-data``,
+        and the response is encoded as msgpack if the ``accept`` header asks for it.
+
         Args:
             model_name (str): Model name.
             request (Request): Raw request object.
@@ -71,6 +75,8 @@ class V1Endpoints:
 
         if not isinstance(response, dict):
             return Response(content=response, headers=response_headers)
+        if request.headers.get("accept", "").split(";")[0].strip() in MSGPACK_CONTENT_TYPES:
+            return Response(content=encode_msgpack(response), media_type="application/msgpack")
         return response
 
     async def generate(self, model_name: str, request: Request) -> StreamingResponse:
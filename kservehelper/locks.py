@@ -0,0 +1,42 @@
+import os
+import time
+import fcntl
+from contextlib import contextmanager
+from .metrics import LOCK_WAIT_SECONDS
+
+
+@contextmanager
+def flock(lock_path: str, timeout: float = 300, shared: bool = False):
+    """
+    Context manager that acquires and releases an advisory lock (`fcntl.flock`) on a lock file.
+    The lock is released by the kernel if the holding process dies, so the lock file is kept.
+
+    :param lock_path: The path of the lock file, which is created if it doesn't exist.
+    :param timeout: The maximum time (in seconds) to wait for the lock, or None to wait forever.
+    :param shared: Whether to acquire a shared (read) lock, which can be held by multiple holders
+        at the same time, instead of an exclusive (write) lock.
+    """
+    mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        start_time = time.monotonic()
+        if timeout is None:
+            fcntl.flock(fd, mode)
+        else:
+            # `flock` can't time out, so wait with a backoff instead of spinning
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    elapsed = time.monotonic() - start_time
+                    if elapsed >= timeout:
+                        raise TimeoutError(f"timeout occurred while waiting for lock {lock_path}")
+                    time.sleep(min(delay, timeout - elapsed))
+                    delay = min(delay * 2, 0.05)
+        LOCK_WAIT_SECONDS.labels(mode="shared" if shared else "exclusive").observe(time.monotonic() - start_time)
+        yield fd
+    finally:
+        # Closing the file releases the lock
+        os.close(fd)
@@ -0,0 +1,11 @@
+from prometheus_client import Counter, Histogram
+
+RESULT_CACHE_HITS = Counter(
+    "kservehelper_result_cache_hits", "The number of prediction result cache hits", ["name"])
+RESULT_CACHE_MISSES = Counter(
+    "kservehelper_result_cache_misses", "The number of prediction result cache misses", ["name"])
+RESULT_CACHE_EVICTIONS = Counter(
+    "kservehelper_result_cache_evictions", "The number of results evicted from the memory cache", ["name"])
+LOCK_WAIT_SECONDS = Histogram(
+    "kservehelper_lock_wait_seconds", "The time spent waiting for the file locks of the disk cache", ["mode"],
+    buckets=(0.0001, 0.001, 0.01, 0.1, 1, 10, 60, 300))
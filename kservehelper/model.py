@@ -6,12 +6,17 @@ import time
 import json
 import uuid
 import typing
+import asyncio
+import logging
+import pathlib
 import pydantic
 import inspect
+import contextvars
+import collections.abc
 from importlib.metadata import version
 
 from collections import OrderedDict
-from typing import Any, Dict, Callable, Union, Iterator, AsyncIterator
+from typing import Any, Dict, List, Callable, Union, Iterator, AsyncIterator
 from inspect import signature
 from datetime import datetime
 
@@ -22,8 +27,21 @@ if version("kserve") <= "0.10.2":
 else:
     from kserve import ModelServer
 
-from kservehelper.types import Path, validate
-from kservehelper.utils import upload_files
+from kservehelper.types import Path, BytesFile, compile_validator, PYDANTIC_V2
+from kservehelper.batching import BatchProcessor
+from kservehelper.executor import ModelExecutor
+from kservehelper.cache import ResultCache
+from kservehelper.streaming import iterate_in_thread, encode_chunk, coalesce, async_coalesce
+from kservehelper.utils import async_upload_files, notify_webhook, check_upload_target, upload_url_ttl, \
+    UploadTracker
+from kservehelper.codec import decode_payload, remove_files
+
+# The request context passed from `preprocess` to `postprocess` in the transformer. kserve calls both
+# in the same task, so each in-flight request sees its own context.
+REQUEST_CONTEXT = contextvars.ContextVar("request_context", default=None)
+
+# The output types that are uploaded via the webhook
+FILE_OUTPUT_TYPES = (Path, BytesFile)
 
 
 class ModelIOInfo:
@@ -32,6 +50,8 @@ class ModelIOInfo:
         self._input_info = None
         self._input_defaults = None
         self._is_batch_inputs = None
+        self._validation_plan = None
+        self._path_inputs = None
         self._output_info = None
 
     @staticmethod
@@ -49,6 +69,7 @@ class ModelIOInfo:
         input_info = OrderedDict()
         input_defaults = OrderedDict()
         is_batch_inputs = {}
+        path_inputs = set()
 
         for key, value in t.parameters.items():
             # A single parameter
@@ -56,6 +77,8 @@ class ModelIOInfo:
                 d = ModelIOInfo._fieldinfo2dict(value.default)
                 if value.annotation != inspect._empty:
                     d["type"] = value.annotation.__name__
+                    if inspect.isclass(value.annotation) and issubclass(value.annotation, pathlib.Path):
+                        path_inputs.add(key)
                 input_info[key] = d
                 input_defaults[key] = value.default
 
@@ -75,6 +98,64 @@ class ModelIOInfo:
         self._input_info = input_info
         self._input_defaults = input_defaults
         self._is_batch_inputs = is_batch_inputs
+        self._path_inputs = path_inputs
+        self._validation_plan = ModelIOInfo._compile_plan(input_defaults, is_batch_inputs)
+
+    @staticmethod
+    def _is_required(field) -> bool:
+        # pydantic 1 marks the required fields with `...` as the default value
+        return field.is_required() if PYDANTIC_V2 else field.default is Ellipsis
+
+    @staticmethod
+    def _compile_single_input(key, field):
+        default = field.default
+        required = ModelIOInfo._is_required(field)
+
+        def _fill(payload):
+            if key not in payload:
+                if required:
+                    raise ValueError(f"missing required input parameter {key}")
+                payload[key] = default
+
+        return compile_validator(key, field), _fill
+
+    @staticmethod
+    def _compile_batch_input(key, fields):
+        validators = {k: compile_validator(k, v) for k, v in fields.items()}
+        defaults = [(k, v.default, ModelIOInfo._is_required(v)) for k, v in fields.items()]
+
+        def _check(value):
+            assert isinstance(value, list), f"{key} should be a list of parameters"
+            for param in value:
+                assert isinstance(param, dict)
+                for k, v in param.items():
+                    if k not in validators:
+                        raise ValueError(f"model has no input parameter named {key}.{k}")
+                    validator = validators[k]
+                    if validator is not None:
+                        validator(v)
+
+        def _fill(payload):
+            if key not in payload:
+                raise ValueError(f"missing required input parameter {key}")
+            for param in payload[key]:
+                for k, default, required in defaults:
+                    if k not in param:
+                        if required:
+                            raise ValueError(f"missing required input parameter {key}.{k}")
+                        param[k] = default
+
+        return _check, _fill
+
+    @staticmethod
+    def _compile_plan(input_defaults, is_batch_inputs):
+        plan = OrderedDict()
+        for key, field in input_defaults.items():
+            if is_batch_inputs.get(key, False):
+                plan[key] = ModelIOInfo._compile_batch_input(key, field)
+            else:
+                plan[key] = ModelIOInfo._compile_single_input(key, field)
+        return plan
 
     def set_output_signatures(self, method: Callable):
         t = signature(method)
@@ -101,25 +182,69 @@ class ModelIOInfo:
     def outputs(self):
         return self._output_info
 
+    @property
+    def has_path_outputs(self):
+        """
+        Whether the outputs are files to upload, i.e., the output type is `Path`, `List[Path]` or `Iterator[Path]`,
+        or the same with `BytesFile`.
+        """
+        if self._output_info is None:
+            return False
+        if self._output_info["type"] in FILE_OUTPUT_TYPES:
+            return True
+        return self._output_info["type"] in (list, collections.abc.Iterator, collections.abc.Generator) \
+            and len(self._output_info["args"]) >= 1 and self._output_info["args"][0] in FILE_OUTPUT_TYPES
+
+    @property
+    def path_inputs(self):
+        return self._path_inputs
+
+    @property
+    def validation_plan(self):
+        """
+        The compiled input validation plan, i.e., a map from each input name to a
+        (checker, default filler) pair. The checker is None if the input has no constraints.
+        """
+        return self._validation_plan
+
     def is_batch_input(self, key: str):
         return self._is_batch_inputs.get(key, False)
 
 
 class KServeModel(Model):
-    MODEL_IO_INFO = ModelIOInfo()
-    HAS_PREPROCESS = False
-    HAS_PREDICT = False
-    HAS_POSTPROCESS = False
 
     def __init__(self, name: str, model_class: Any, **kwargs):
         super().__init__(name)
-        KServeModel._reset()
-        KServeModel._build_functions(model_class)
+        # The signatures and handlers are kept per instance, so that
+        # multiple models can be served in the same process
+        self.model_io_info = ModelIOInfo()
+        self.has_preprocess = False
+        self.has_predict = False
+        self.has_postprocess = False
+        self._build_functions(model_class)
         self.model = model_class(**kwargs)
 
-        # Only used for transforms
-        self.upload_webhook = None
-        self.predict_start_time = -1
+        # Synchronous model methods are called via the executor
+        self.executor = ModelExecutor.from_env()
+
+        # The prediction result cache is optional
+        self.result_cache = ResultCache.from_env(name)
+
+        # Dynamic batching is enabled if the model class implements `predict_batch`
+        self.batcher = None
+        if callable(getattr(self.model, "predict_batch", None)):
+            assert self.has_predict, \
+                "`predict` must be defined to specify the input parameters of `predict_batch`"
+            self.batcher = BatchProcessor(
+                lambda payloads: self.executor.run(self.model.predict_batch, payloads),
+                max_batch_size=int(os.getenv("MAX_BATCH_SIZE", 8)),
+                max_wait_time=float(os.getenv("MAX_BATCH_WAIT_TIME", 0.01))
+            )
+
+        # The status of the deferred uploads, i.e., requests with `"upload_mode": "deferred"`
+        self.upload_tracker = UploadTracker()
+        self._background_tasks = set()
+        self.logger = logging.getLogger(__name__)
         self.load()
 
     def load(self) -> bool:
@@ -144,27 +269,26 @@ class KServeModel(Model):
         return self.ready
 
     def docs(self):
-        return json.loads(json.dumps(KServeModel.MODEL_IO_INFO.inputs))
+        return json.loads(json.dumps(self.model_io_info.inputs))
 
-    @staticmethod
-    def _build_functions(model_class):
+    def _build_functions(self, model_class):
         # Predict function
         method = getattr(model_class, "predict", None)
         if callable(method):
-            KServeModel.MODEL_IO_INFO.set_input_signatures(method)
-            KServeModel.MODEL_IO_INFO.set_output_signatures(method)
-            setattr(KServeModel, "predict", KServeModel._predict)
-            KServeModel.HAS_PREDICT = True
+            self.model_io_info.set_input_signatures(method)
+            self.model_io_info.set_output_signatures(method)
+            self.predict = self._predict
+            self.has_predict = True
 
         # Streaming generation
         # Note that the streaming generation method doesn't support preprocess or postprocess function
         method = getattr(model_class, "generate", None)
         if callable(method):
-            if KServeModel.HAS_PREDICT:
+            if self.has_predict:
                 # Check if the input parameters are the same
                 input_info = ModelIOInfo()
                 input_info.set_input_signatures(method)
-                predict_inputs = KServeModel.MODEL_IO_INFO.inputs
+                predict_inputs = self.model_io_info.inputs
                 generate_inputs = input_info.inputs
                 assert len(predict_inputs) == len(generate_inputs), \
                     "The input parameters for `predict` and `generate` don't match"
@@ -173,178 +297,305 @@ class KServeModel(Model):
                         raise ValueError(f"The input parameters for `predict` and `generate` don't match, "
                                          f"`generate` doesn't have parameter {key}")
             else:
-                KServeModel.MODEL_IO_INFO.set_input_signatures(method)
-                KServeModel.MODEL_IO_INFO.set_output_signatures(method)
-                KServeModel.HAS_PREDICT = True
-            setattr(KServeModel, "generate", KServeModel._generate)
+                self.model_io_info.set_input_signatures(method)
+                self.model_io_info.set_output_signatures(method)
+                self.has_predict = True
+            self.generate = self._generate
 
         # Preprocess function
         method = getattr(model_class, "preprocess", None)
         if callable(method):
-            assert not KServeModel.HAS_PREDICT, \
+            assert not self.has_predict, \
                 "`predict` function has been defined already, cannot define `preprocess` separately"
-            KServeModel.MODEL_IO_INFO.set_input_signatures(method)
-            setattr(KServeModel, "preprocess", KServeModel._preprocess)
-            KServeModel.HAS_PREPROCESS = True
+            self.model_io_info.set_input_signatures(method)
+            self.preprocess = self._preprocess
+            self.has_preprocess = True
 
         # Postprocess function
         method = getattr(model_class, "postprocess", None)
         if callable(method):
-            assert not KServeModel.HAS_PREDICT, \
+            assert not self.has_predict, \
                 "`predict` function has been defined already, cannot define `postprocess` separately"
-            KServeModel.MODEL_IO_INFO.set_output_signatures(method)
-            setattr(KServeModel, "postprocess", KServeModel._postprocess)
-            KServeModel.HAS_POSTPROCESS = True
+            self.model_io_info.set_output_signatures(method)
+            self.postprocess = self._postprocess
+            self.has_postprocess = True
 
-        if KServeModel.HAS_PREPROCESS or KServeModel.HAS_POSTPROCESS:
-            assert KServeModel.HAS_PREPROCESS and KServeModel.HAS_POSTPROCESS, \
+        if self.has_preprocess or self.has_postprocess:
+            assert self.has_preprocess and self.has_postprocess, \
                 "`preprocess` and `postprocess` must be both defined"
 
-    @staticmethod
-    def _process_payload(payload: Dict):
+    def _process_payload(self, payload: Dict):
+        plan = self.model_io_info.validation_plan
         # Check if the parameter names in payload are correct
         for key, value in payload.items():
-            if key not in KServeModel.MODEL_IO_INFO.inputs:
+            if key not in plan:
                 raise ValueError(f"model has no input parameter named {key}")
-            if not isinstance(value, list):
-                validate(value, key, KServeModel.MODEL_IO_INFO.input_defaults[key])
-            else:
-                assert KServeModel.MODEL_IO_INFO.is_batch_input(key)
-                for param in value:
-                    assert isinstance(param, dict)
-                    for k, v in param.items():
-                        validate(v, k, KServeModel.MODEL_IO_INFO.input_defaults[key][k])
+            check = plan[key][0]
+            if check is not None:
+                check(value)
         # Set default values
-        for key, values in KServeModel.MODEL_IO_INFO.inputs.items():
-            if not KServeModel.MODEL_IO_INFO.is_batch_input(key):
-                if key not in payload:
-                    payload[key] = values["default"]
-            else:
-                params = payload[key]
-                for k, v in values.items():
-                    for param in params:
-                        if k not in param:
-                            param[k] = v["default"]
+        for _, fill in plan.values():
+            fill(payload)
         return payload
 
     @staticmethod
+    def _remove_after(outputs, temp_files: List[str]):
+        """
+        Removes the temporary files of the `Path` inputs once the outputs are computed, or once
+        the outputs are consumed if they are streamed.
+        """
+        if not temp_files:
+            return outputs
+        if isinstance(outputs, AsyncIterator):
+            async def _agen():
+                try:
+                    async for item in outputs:
+                        yield item
+                finally:
+                    remove_files(temp_files)
+
+            return _agen()
+        if isinstance(outputs, Iterator):
+            def _gen():
+                try:
+                    yield from outputs
+                finally:
+                    remove_files(temp_files)
+
+            return _gen()
+        remove_files(temp_files)
+        return outputs
+
     async def _predict(
             self,
             payload: Union[Dict, bytes],
             headers: Dict[str, str] = None
     ) -> Union[Dict, Iterator, AsyncIterator]:
         start_time = time.time()
-        if isinstance(payload, bytes):
-            payload = json.loads(payload.decode("utf-8"))
-        upload_webhook = payload.pop("upload_webhook", None)
-
-        payload = KServeModel._process_payload(payload)
-        if not inspect.iscoroutinefunction(self.model.predict):
-            outputs = self.model.predict(**payload)
-        else:
-            outputs = await self.model.predict(**payload)
-
-        if not isinstance(outputs, (Iterator, AsyncIterator)):
-            results = KServeModel._upload(upload_webhook, outputs)
-            if getattr(self.model, "after_predict", None) is not None:
-                results = self.model.after_predict(results)
-            results["running_time"] = f"{time.time() - start_time}s"
-            return results
-        else:
-            return outputs
-
-    @staticmethod
-    def _generate(self, payload: Union[Dict, bytes], headers: Dict[str, str] = None):
-        if isinstance(payload, bytes):
-            payload = json.loads(payload.decode("utf-8"))
-        payload.pop("upload_webhook", None)
-        payload = KServeModel._process_payload(payload)
-        generator = self.model.generate(**payload)
-        return generator
+        temp_files = []
+        payload = decode_payload(payload, headers, self.model_io_info.path_inputs, temp_files)
+        try:
+            outputs = await self._predict_payload(payload, start_time, temp_files)
+        except BaseException:
+            remove_files(temp_files)
+            raise
+        return self._remove_after(outputs, temp_files)
 
-    @staticmethod
-    def _preprocess(self, payload: Union[Dict, bytes], headers: Dict[str, str] = None) -> Dict:
-        self.predict_start_time = time.time()
-        if isinstance(payload, bytes):
-            payload = json.loads(payload.decode("utf-8"))
-        self.upload_webhook = payload.pop("upload_webhook", None)
-        payload = KServeModel._process_payload(payload)
-        return self.model.preprocess(**payload)
+    async def _predict_payload(
+            self,
+            payload: Dict,
+            start_time: float,
+            temp_files: List[str]
+    ) -> Union[Dict, Iterator, AsyncIterator]:
+        if "upload_status" in payload:
+            return self.upload_tracker.get(payload["upload_status"])
+        upload_webhook = payload.pop("upload_webhook", None)
+        upload_mode = payload.pop("upload_mode", None)
+        upload_callback = payload.pop("upload_callback", None)
+        assert upload_mode in (None, "deferred"), f"Unknown upload mode: {upload_mode}"
+        if self.model_io_info.has_path_outputs:
+            check_upload_target(upload_webhook)
+
+        payload = self._process_payload(payload)
+        cache_key, results = None, None
+        if self.result_cache is not None:
+            # The cached URLs of uploaded files are only valid for the same upload target
+            upload_target = upload_webhook if self.model_io_info.has_path_outputs else None
+            cache_key = ResultCache.make_key(payload, upload_target)
+            results = self.result_cache.get(cache_key)
+
+        if results is None:
+            if self.batcher is not None:
+                outputs = await self.batcher.submit(payload)
+            else:
+                outputs = await self.executor.run(self.model.predict, **payload)
+            if isinstance(outputs, (Iterator, AsyncIterator)) and not self.model_io_info.has_path_outputs:
+                return outputs
+            if upload_mode == "deferred" and self.model_io_info.has_path_outputs:
+                # The background upload may still read the inputs, so it removes the temporary files
+                upload_id = self._defer_upload(
+                    upload_webhook, upload_callback, outputs, cache_key, start_time, temp_files[:])
+                temp_files.clear()
+                return {"upload_id": upload_id, "status": "pending",
+                        "running_time": f"{time.time() - start_time}s"}
+            results = await self._upload_outputs(upload_webhook, outputs)
+            if cache_key is not None:
+                self.result_cache.set(cache_key, results, ttl=upload_url_ttl(upload_webhook))
+
+        if getattr(self.model, "after_predict", None) is not None:
+            results = self.model.after_predict(results)
+        results["running_time"] = f"{time.time() - start_time}s"
+        return results
 
-    @staticmethod
-    def _postprocess(self, infer_response: Dict, headers: Dict[str, str] = None) -> Dict:
-        outputs = self.model.postprocess(infer_response)
-        results = KServeModel._upload(self.upload_webhook, outputs)
-        results["running_time"] = f"{time.time() - self.predict_start_time}s"
-        self.upload_webhook = None
+    def _defer_upload(self, upload_webhook, upload_callback, outputs, cache_key, start_time, temp_files) -> str:
+        """
+        Uploads the outputs in a background task. The upload status can be polled by sending
+        `{"upload_status": upload_id}`, and it is also posted to `upload_callback` if specified.
+        The temporary files of the `Path` inputs are removed once the outputs are uploaded.
+
+        The status is kept in the memory of this process only, so it must be polled from the same
+        replica and worker process that returned the upload ID, and it is lost if the process restarts.
+        Behind a load balancer, `upload_callback` should be used instead of polling.
+        """
+        assert upload_webhook is not None, "`upload_webhook` must be set in the deferred upload mode"
+        upload_id = self.upload_tracker.create()
+
+        async def _run():
+            try:
+                results = await self._upload_outputs(upload_webhook, outputs)
+                if cache_key is not None:
+                    self.result_cache.set(cache_key, results, ttl=upload_url_ttl(upload_webhook))
+                if getattr(self.model, "after_predict", None) is not None:
+                    results = self.model.after_predict(results)
+                results["running_time"] = f"{time.time() - start_time}s"
+                status = self.upload_tracker.succeed(upload_id, results)
+            except Exception as e:
+                status = self.upload_tracker.fail(upload_id, str(e))
+            finally:
+                remove_files(temp_files)
+            if upload_callback:
+                try:
+                    await notify_webhook(upload_callback, status)
+                except Exception as e:
+                    self.logger.error(f"failed to call upload callback {upload_callback}: {e}")
+
+        task = asyncio.ensure_future(_run())
+        # Keep a reference to the task so that it is not garbage collected before it finishes
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return upload_id
+
+    async def _upload_outputs(self, upload_webhook, outputs) -> Dict:
+        if isinstance(outputs, (Iterator, AsyncIterator)):
+            return await self._upload_stream(upload_webhook, outputs)
+        return await self._upload(upload_webhook, outputs)
+
+    async def _generate(self, payload: Union[Dict, bytes], headers: Dict[str, str] = None):
+        temp_files = []
+        payload = decode_payload(payload, headers, self.model_io_info.path_inputs, temp_files)
+        try:
+            payload.pop("upload_webhook", None)
+            payload = self._process_payload(payload)
+            generator = await self.executor.run(self.model.generate, **payload)
+        except BaseException:
+            remove_files(temp_files)
+            raise
+        return self._remove_after(generator, temp_files)
+
+    async def _preprocess(self, payload: Union[Dict, bytes], headers: Dict[str, str] = None) -> Dict:
+        start_time = time.time()
+        temp_files = []
+        payload = decode_payload(payload, headers, self.model_io_info.path_inputs, temp_files)
+        REQUEST_CONTEXT.set({
+            "upload_webhook": payload.pop("upload_webhook", None),
+            "start_time": start_time
+        })
+        try:
+            payload = self._process_payload(payload)
+            return await self.executor.run(self.model.preprocess, **payload)
+        finally:
+            remove_files(temp_files)
+
+    async def _postprocess(self, infer_response: Dict, headers: Dict[str, str] = None) -> Dict:
+        outputs = await self.executor.run(self.model.postprocess, infer_response)
+        context = REQUEST_CONTEXT.get() or {}
+        REQUEST_CONTEXT.set(None)
+        results = await self._upload(context.get("upload_webhook"), outputs)
+        if "start_time" in context:
+            results["running_time"] = f"{time.time() - context['start_time']}s"
         return results
 
-    @staticmethod
-    def _upload(upload_webhook, model_outputs):
-        if KServeModel.MODEL_IO_INFO.outputs is None:
+    async def _upload(self, upload_webhook, model_outputs):
+        if self.model_io_info.outputs is None:
             assert isinstance(model_outputs, dict), "Model output must be a dict"
             return model_outputs
 
-        if KServeModel.MODEL_IO_INFO.outputs["type"] == Path:
+        if self.model_io_info.outputs["type"] in FILE_OUTPUT_TYPES:
             assert upload_webhook is not None, \
                 "Model output type is `Path`, but `upload_webhook` is not set"
-            assert isinstance(model_outputs, Path), \
-                "Model output type is `Path`, but the actual output is not `Path`"
-            return upload_files(upload_webhook, [model_outputs])
+            assert isinstance(model_outputs, FILE_OUTPUT_TYPES), \
+                "Model output type is `Path`, but the actual output is not `Path` or `BytesFile`"
+            return await async_upload_files(upload_webhook, [model_outputs])
 
-        if KServeModel.MODEL_IO_INFO.outputs["type"] == list:
-            if len(KServeModel.MODEL_IO_INFO.outputs["args"]) == 1 and \
-                    KServeModel.MODEL_IO_INFO.outputs["args"][0] == Path:
+        if self.model_io_info.outputs["type"] == list:
+            if len(self.model_io_info.outputs["args"]) == 1 and \
+                    self.model_io_info.outputs["args"][0] in FILE_OUTPUT_TYPES:
                 assert upload_webhook is not None, \
                     "Model output type is `Path`, but `upload_webhook` is not set"
                 assert isinstance(model_outputs, (list, tuple)), \
                     "Model output type is `List[Path]`, but the actual output is not a List"
-                return upload_files(upload_webhook, model_outputs)
+                return await async_upload_files(upload_webhook, model_outputs)
 
         assert isinstance(model_outputs, dict), "Model output must be a dict"
         return model_outputs
 
-    @staticmethod
-    def _reset():
-        KServeModel.MODEL_IO_INFO = ModelIOInfo()
-        if KServeModel.HAS_PREPROCESS:
-            KServeModel.HAS_PREPROCESS = False
-            method = getattr(KServeModel, "preprocess", None)
-            if callable(method):
-                delattr(KServeModel, "preprocess")
-        if KServeModel.HAS_PREDICT:
-            KServeModel.HAS_PREDICT = False
-            method = getattr(KServeModel, "predict", None)
-            if callable(method):
-                delattr(KServeModel, "predict")
-            method = getattr(KServeModel, "generate", None)
-            if callable(method):
-                delattr(KServeModel, "generate")
-        if KServeModel.HAS_POSTPROCESS:
-            KServeModel.HAS_POSTPROCESS = False
-            method = getattr(KServeModel, "postprocess", None)
-            if callable(method):
-                delattr(KServeModel, "postprocess")
+    async def _upload_stream(self, upload_webhook, model_outputs):
+        """
+        Uploads the files yielded by `predict` one by one as soon as they are generated,
+        and returns their URLs in order after all the uploads finish.
+        """
+        assert upload_webhook is not None, \
+            "Model output type is `Path`, but `upload_webhook` is not set"
+        tasks = []
+        try:
+            # The generator holds an executor slot, so it doesn't run concurrently with the other requests
+            async for path in self.executor.iterate(model_outputs):
+                assert isinstance(path, FILE_OUTPUT_TYPES), \
+                    "Model output type is `Iterator[Path]`, but the actual output is not `Path` or `BytesFile`"
+                tasks.append(asyncio.ensure_future(async_upload_files(upload_webhook, [path])))
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return {"output": [r["output"][0] for r in results]}
 
     @staticmethod
     def generate_filepath(filename: str) -> str:
         return f"/tmp/{str(uuid.uuid4())}-{filename}"
 
     @staticmethod
-    def wrap_generator(g):
-
+    def wrap_generator(g, max_queue_size: int = 8, flush_items: int = 1, flush_interval: float = 0):
+        """
+        Wraps a generator function for streaming outputs. `g` can be a synchronous generator function
+        or an async generator function. For KServe >= 0.13.1, synchronous generators run in a worker
+        thread so that they don't block the event loop, and at most `max_queue_size` items are
+        produced ahead of the client.
+
+        Each item is sent as one line of NDJSON, except bytes which are sent as they are. To reduce the
+        number of writes, the lines are merged and sent once there are `flush_items` of them or
+        `flush_interval` seconds have passed since the first one.
+        """
         if version("kserve") <= "0.10.2":
+            if inspect.isasyncgenfunction(g):
+                async def _ag():
+                    async def _chunks():
+                        i = 0
+                        async for data in g():
+                            yield encode_chunk(i, data)
+                            i += 1
+
+                    async for chunk in async_coalesce(_chunks(), flush_items, flush_interval):
+                        yield chunk
+
+                return _ag
+
             def _g():
-                for i, data in enumerate(g()):
-                    yield json.dumps({"id": i, "data": data}, ensure_ascii=False) + "\n"
+                chunks = (encode_chunk(i, data) for i, data in enumerate(g()))
+                yield from coalesce(chunks, flush_items, flush_interval)
 
             return _g
         else:
-            async def _g():
-                for i, data in enumerate(g()):
-                    yield json.dumps({"id": i, "data": data}, ensure_ascii=False) + "\n"
-
-            return _g()
+            async def _chunks():
+                items = g()
+                if not isinstance(items, AsyncIterator):
+                    items = iterate_in_thread(items, max_queue_size=max_queue_size)
+                i = 0
+                async for data in items:
+                    yield encode_chunk(i, data)
+                    i += 1
+
+            return async_coalesce(_chunks(), flush_items, flush_interval)
 
     @staticmethod
     def serve(name: str, model_class: Any, num_replicas: int = 1, **kwargs):
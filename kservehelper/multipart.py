@@ -0,0 +1,70 @@
+import os
+import uuid
+from typing import Any, List, Optional, Tuple
+
+
+class MultipartEncoder:
+
+    def __init__(self, fields: List[Tuple[str, str, Any, Optional[str]]], boundary: str = None):
+        """
+        Encodes files as a multipart/form-data body which is read in small blocks, so that the files
+        are streamed to the server instead of being loaded into memory. The body length is computed
+        in advance, so that `requests` sends it with `Content-Length` instead of chunked encoding.
+
+        :param fields: A list of (field name, filename, content, content type). The content is either
+            an opened binary file, which is read from its current position, or a bytes-like object.
+        :param boundary: The multipart boundary, which is randomly generated if not set.
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.parts = []
+        for name, filename, data, content_type in fields:
+            filename = filename.replace('"', "%22")
+            header = f"--{self.boundary}\r\n" \
+                     f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n' \
+                     f"Content-Type: {content_type or 'application/octet-stream'}\r\n\r\n"
+            self.parts.append(memoryview(header.encode()))
+            self.parts.append(data if hasattr(data, "read") else memoryview(data).cast("B"))
+            self.parts.append(memoryview(b"\r\n"))
+        self.parts.append(memoryview(f"--{self.boundary}--\r\n".encode()))
+        self.length = sum(self._size(part) for part in self.parts)
+        self._index = 0
+        self._offset = 0
+
+    @staticmethod
+    def _size(part) -> int:
+        if isinstance(part, memoryview):
+            return part.nbytes
+        return os.fstat(part.fileno()).st_size - part.tell()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while self._index < len(self.parts) and size != 0:
+            part = self.parts[self._index]
+            if isinstance(part, memoryview):
+                end = part.nbytes if size < 0 else min(part.nbytes, self._offset + size)
+                chunk = part[self._offset:end].tobytes()
+                self._offset = end
+                if self._offset >= part.nbytes:
+                    self._index, self._offset = self._index + 1, 0
+            else:
+                chunk = part.read(size)
+                if size < 0 or len(chunk) < size:
+                    self._index, self._offset = self._index + 1, 0
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(65536)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,284 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+import requests
+import threading
+import concurrent.futures
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import urlparse
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised without calling the webhook while its circuit breaker is open.
+    """
+    pass
+
+
+class WebhookError(RuntimeError):
+    """
+    Raised when a webhook responds with an error status code.
+    """
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        Fails fast after `failure_threshold` consecutive failures. Once `reset_timeout` seconds
+        have passed, one trial call is let through, and the breaker closes if it succeeds.
+
+        :param failure_threshold: The number of consecutive failures to open the breaker.
+        :param reset_timeout: The time (in seconds) before a trial call is allowed.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let one call through, and wait another `reset_timeout` for the next one
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+
+class RetryPolicy:
+
+    def __init__(
+            self,
+            max_attempts: int = 3,
+            base_delay: float = 0.5,
+            max_delay: float = 8,
+            attempt_timeout: float = 0,
+            hedge_delay: float = 0,
+            breaker_threshold: int = 5,
+            breaker_reset_timeout: float = 30
+    ):
+        """
+        Retries webhook calls with exponential backoff and full jitter, optionally sends a hedged
+        second request for slow calls, and keeps a circuit breaker per host.
+
+        :param max_attempts: The maximum number of attempts of one call.
+        :param base_delay: The backoff delay (in seconds) before the first retry, doubled for each retry.
+        :param max_delay: The maximum backoff delay (in seconds).
+        :param attempt_timeout: The timeout (in seconds) of one attempt, or 0 to use the timeout of the call.
+        :param hedge_delay: If > 0, a second request is sent if the first one hasn't finished after
+            `hedge_delay` seconds, and the first successful response is used (only for the idempotent
+            calls, see `hedge`).
+        :param breaker_threshold: The number of consecutive failures to open the circuit breaker of a host,
+            or 0 to disable circuit breaking.
+        :param breaker_reset_timeout: The time (in seconds) before an open circuit breaker allows a trial call.
+        """
+        assert max_attempts >= 1, "`max_attempts` should be >= 1"
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.hedge_delay = hedge_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.logger = logging.getLogger(__name__)
+
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self._executor = None
+
+    @staticmethod
+    def from_env() -> "RetryPolicy":
+        return RetryPolicy(
+            max_attempts=int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 3)),
+            base_delay=float(os.getenv("WEBHOOK_RETRY_BASE_DELAY", 0.5)),
+            max_delay=float(os.getenv("WEBHOOK_RETRY_MAX_DELAY", 8)),
+            attempt_timeout=float(os.getenv("WEBHOOK_ATTEMPT_TIMEOUT", 0)),
+            hedge_delay=float(os.getenv("WEBHOOK_HEDGE_DELAY", 0)),
+            breaker_threshold=int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", 5)),
+            breaker_reset_timeout=float(os.getenv("WEBHOOK_BREAKER_RESET_TIMEOUT", 30))
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns a random delay in [0, min(max_delay, base_delay * 2 ** attempt)] before the next attempt.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def timeout(self, timeout: float) -> float:
+        """
+        Returns the timeout of one attempt of a call with the given timeout.
+        """
+        if self.attempt_timeout > 0:
+            return min(self.attempt_timeout, timeout) if timeout else self.attempt_timeout
+        return timeout
+
+    def breaker(self, url: str) -> Optional[CircuitBreaker]:
+        if self.breaker_threshold <= 0:
+            return None
+        r = urlparse(url)
+        host = f"{r.scheme}://{r.netloc}"
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset_timeout)
+            return self.breakers[host]
+
+    def check(self, url: str):
+        """
+        Raises `CircuitOpenError` if the circuit breaker of the host of `url` is open.
+        """
+        breaker = self.breaker(url)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"the circuit breaker of {url} is open")
+
+    def record(self, url: str, success: bool):
+        breaker = self.breaker(url)
+        if breaker is not None:
+            if success:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """
+        Returns whether a failed attempt can be retried, i.e., it failed because of the network or
+        a server error (5xx) of the webhook. The other errors, e.g., a missing local file or a bad
+        request, are not retried and don't count towards the circuit breaker.
+        """
+        if isinstance(error, WebhookError):
+            return error.status >= 500
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500
+        if isinstance(error, requests.HTTPError):
+            return error.response is None or error.response.status_code >= 500
+        return isinstance(error, (aiohttp.ClientError, requests.RequestException,
+                                  asyncio.TimeoutError, ConnectionError))
+
+    def retry_delay(self, url: str, attempt: int, error: Exception) -> float:
+        """
+        Records a failed attempt, and returns the backoff delay before the next one. It re-raises
+        `error` if it is not retryable, no more attempts are allowed or the circuit breaker is open.
+
+        :param url: The webhook URL.
+        :param attempt: The index of the failed attempt, starting from 0.
+        :param error: The exception raised by the failed attempt.
+        """
+        if isinstance(error, CircuitOpenError) or not self.is_retryable(error):
+            raise error
+        self.record(url, False)
+        if attempt + 1 >= self.max_attempts:
+            raise error
+        delay = self.backoff(attempt)
+        self.logger.warning(f"webhook call to {url} failed ({attempt + 1}/{self.max_attempts}): {error}, "
+                            f"retrying in {delay:.2f}s")
+        return delay
+
+    def call(self, url: str, func: Callable[[], Any], hedge: bool = False) -> Any:
+        """
+        Calls `func` with retries, where `func` makes one request to `url`.
+
+        :param url: The webhook URL, whose host determines the circuit breaker.
+        :param func: The function making one attempt, which should raise an exception on failure.
+        :param hedge: Whether the call can be hedged, i.e., it is idempotent so that it is safe to make two
+            attempts at the same time. It shouldn't be set for uploads, since each attempt may store the file
+            under a different URL.
+        :return: The return value of `func`.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                self.check(url)
+                result = self.hedge(func) if hedge else func()
+            except Exception as e:
+                time.sleep(self.retry_delay(url, attempt, e))
+            else:
+                self.record(url, True)
+                return result
+
+    async def acall(self, url: str, func: Callable[[], Awaitable], hedge: bool = False) -> Any:
+        """
+        The async version of `call`, where `func` returns an awaitable.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                self.check(url)
+                result = await self.ahedge(func) if hedge else await func()
+            except Exception as e:
+                await asyncio.sleep(self.retry_delay(url, attempt, e))
+            else:
+                self.record(url, True)
+                return result
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="hedge")
+            return self._executor
+
+    def hedge(self, func: Callable[[], Any]) -> Any:
+        """
+        Makes one attempt of an idempotent call, e.g., a `GET` request. If `hedge_delay` > 0 and the
+        request hasn't finished after `hedge_delay` seconds, a second one is sent and the first
+        successful response is used.
+        """
+        if self.hedge_delay <= 0:
+            return func()
+        executor = self._get_executor()
+        first = executor.submit(func)
+        done, _ = concurrent.futures.wait([first], timeout=self.hedge_delay)
+        if done:
+            return first.result()
+        # The slower request keeps running in the background, since `requests` can't be cancelled
+        error = None
+        for future in concurrent.futures.as_completed([first, executor.submit(func)]):
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+        raise error
+
+    async def ahedge(self, func: Callable[[], Awaitable]) -> Any:
+        """
+        The async version of `hedge`, where `func` returns an awaitable.
+        """
+        if self.hedge_delay <= 0:
+            return await func()
+        first = asyncio.ensure_future(func())
+        done, _ = await asyncio.wait([first], timeout=self.hedge_delay)
+        if done:
+            return first.result()
+        pending, error = {first, asyncio.ensure_future(func())}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -20,19 +20,38 @@ class Storage:
 
 class S3Storage(Storage):
 
-    def __init__(self, bucket, region_name, aws_access_key_id, aws_secret_access_key):
+    def __init__(
+            self,
+            bucket,
+            region_name,
+            aws_access_key_id,
+            aws_secret_access_key,
+            endpoint_url=None
+    ):
+        """
+        :param bucket: The S3 bucket name.
+        :param region_name: The AWS region.
+        :param aws_access_key_id: The access key ID, or None to use the default credential chain.
+        :param aws_secret_access_key: The secret access key, or None to use the default credential chain.
+        :param endpoint_url: The endpoint of an S3-compatible service, e.g., MinIO. The AWS endpoint is
+            used if not set.
+        """
         self.bucket = bucket
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
         self.s3 = boto3.client(
             "s3",
             region_name=region_name,
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
+            endpoint_url=endpoint_url
         )
         self.s3_resource = boto3.resource(
             "s3",
             region_name=region_name,
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
+            endpoint_url=endpoint_url
         )
         self.config = TransferConfig(
             multipart_threshold=16 * 1024 * 1024,
@@ -47,9 +66,9 @@ class S3Storage(Storage):
     def _upload_simple(self, filename: str, key: str) -> bool:
         try:
             self.s3.upload_file(
-                filename=filename,
-                bucket=self.bucket,
-                key=key
+                Filename=filename,
+                Bucket=self.bucket,
+                Key=key
             )
         except Exception as e:
             logging.error(e)
@@ -72,9 +91,9 @@ class S3Storage(Storage):
     def _download_simple(self, key: str, filename: str) -> bool:
         try:
             self.s3.download_file(
-                bucket=self.bucket,
-                key=key,
-                filename=filename
+                Bucket=self.bucket,
+                Key=key,
+                Filename=filename
             )
         except Exception as e:
             logging.error(e)
@@ -101,6 +120,40 @@ class S3Storage(Storage):
         else:
             return self._upload_simple(filename=filename, key=key)
 
+    def upload_fileobj(self, fileobj, key: str, content_type: str = None) -> bool:
+        """
+        Uploads the content of a binary file-like object, e.g., an opened file or `io.BytesIO`.
+        Large objects are uploaded in parts according to `self.config`. Unlike `upload`, it only uses
+        the S3 client, so it can be called from multiple threads.
+        """
+        try:
+            self.s3.upload_fileobj(
+                fileobj,
+                self.bucket,
+                key,
+                ExtraArgs={"ContentType": content_type} if content_type else None,
+                Config=self.config
+            )
+        except Exception as e:
+            logging.error(e)
+            return False
+        return True
+
+    def get_url(self, key: str, expires_in: int = 0) -> str:
+        """
+        Returns the URL of an object. If `expires_in` > 0, it returns a presigned GET URL that
+        expires in `expires_in` seconds, otherwise the object URL.
+        """
+        if expires_in > 0:
+            return self.s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": key},
+                ExpiresIn=expires_in
+            )
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.{self.region_name}.amazonaws.com/{key}"
+
     def download(self, key: str, filename: str, **kwargs):
         mode = kwargs.get("method", "multipart")
         if mode == "multipart":
@@ -0,0 +1,158 @@
+import time
+import orjson
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, AsyncIterator, Iterator
+
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+
+_END = object()
+
+
+async def iterate_in_thread(generator: Iterator, max_queue_size: int = 8, wait: bool = False) -> AsyncIterator:
+    """
+    Iterates a synchronous generator in a worker thread and yields its items in the event loop.
+
+    The items are passed through a bounded queue, so the worker thread stops producing new items
+    when the consumer (e.g., a slow client) falls behind. If the consumer stops early, e.g., the client
+    disconnects, the worker thread stops and closes the generator after the item in progress.
+
+    :param generator: A synchronous generator or iterator.
+    :param max_queue_size: The maximum number of items produced but not consumed yet.
+    :param wait: Whether to wait for the worker thread to close the generator when the iteration stops,
+        e.g., so that the generator doesn't run after the caller releases the model.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_queue_size)
+    stopped = threading.Event()
+    finished = asyncio.Event()
+
+    def _put(item: Any) -> bool:
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:
+            # The event loop has been closed
+            return False
+        while not stopped.is_set():
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                continue
+        future.cancel()
+        return False
+
+    def _produce():
+        try:
+            for item in generator:
+                if stopped.is_set() or not _put((item, None)):
+                    break
+            else:
+                _put((_END, None))
+        except Exception as e:
+            _put((_END, e))
+        finally:
+            close = getattr(generator, "close", None)
+            if callable(close):
+                close()
+            try:
+                loop.call_soon_threadsafe(finished.set)
+            except RuntimeError:
+                # The event loop has been closed
+                pass
+
+    thread = threading.Thread(target=_produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stopped.set()
+        if wait:
+            await finished.wait()
+
+
+def encode_chunk(i: int, data: Any) -> bytes:
+    """
+    Encodes a streaming output as one line of NDJSON, i.e., `{"id": i, "data": data}`.
+    Binary outputs (bytes, bytearray or memoryview) are returned as they are, and numpy arrays
+    are serialized directly by orjson.
+    """
+    if isinstance(data, (bytes, memoryview)):
+        return data
+    if isinstance(data, bytearray):
+        return bytes(data)
+    return orjson.dumps({"id": i, "data": data}, option=JSON_OPTIONS)
+
+
+def coalesce(chunks: Iterator[bytes], max_items: int = 1, max_interval: float = 0) -> Iterator[bytes]:
+    """
+    Merges consecutive chunks so that they are written together. The buffered chunks are flushed
+    once there are `max_items` of them, or once `max_interval` seconds have passed since the first one.
+    Note that the interval is only checked when a new chunk arrives.
+    """
+    if max_items <= 1:
+        yield from chunks
+        return
+    buffer, deadline = [], None
+    for chunk in chunks:
+        if not buffer:
+            deadline = time.monotonic() + max_interval
+        buffer.append(chunk)
+        if len(buffer) >= max_items or (max_interval and time.monotonic() >= deadline):
+            yield b"".join(buffer)
+            buffer = []
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def async_coalesce(
+        chunks: AsyncIterator[bytes],
+        max_items: int = 1,
+        max_interval: float = 0
+) -> AsyncIterator[bytes]:
+    """
+    The async version of `coalesce`. The buffered chunks are also flushed when no new chunk
+    arrives within `max_interval` seconds, so a slow producer doesn't delay the buffered chunks.
+    """
+    if max_items <= 1:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    buffer, deadline, pending = [], None, None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if buffer and max_interval else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield b"".join(buffer)
+                buffer = []
+                continue
+
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            if not buffer:
+                deadline = loop.time() + max_interval
+            buffer.append(chunk)
+            if len(buffer) >= max_items or (max_interval and loop.time() >= deadline):
+                yield b"".join(buffer)
+                buffer = []
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
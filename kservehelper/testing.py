@@ -0,0 +1,170 @@
+import os
+import random
+import asyncio
+import threading
+from typing import List
+from aiohttp import web
+from kservehelper.types import Path
+
+
+def make_files(n: int, prefix: str = "file") -> List[Path]:
+    """
+    Writes `n` small text files with contents "{prefix} {i}" at the paths of the model outputs,
+    i.e., the files that are removed after they are uploaded.
+
+    :param n: The number of files.
+    :param prefix: The prefix of the file contents.
+    :return: The paths of the files, with the filenames ending with "{i}.txt".
+    """
+    from kservehelper.model import KServeModel
+
+    paths = []
+    for i in range(n):
+        path = KServeModel.generate_filepath(f"{i}.txt")
+        with open(path, "w") as f:
+            f.write(f"{prefix} {i}")
+        paths.append(Path(path))
+    return paths
+
+
+class LocalWebhook:
+
+    def __init__(
+            self,
+            latency: float = 0,
+            failure_rate: float = 0,
+            keep_files: bool = True,
+            offset_delays: List[float] = ()
+    ):
+        """
+        A local upload webhook running in a background thread for tests and benchmarks. It implements
+        "/upload", "/upload_batch", "/upload_chunked" (the protocol described in
+        `kservehelper.utils.async_upload_files`) and "/callback" for the deferred uploads.
+
+        :param latency: The delay in seconds before each upload is acknowledged.
+        :param failure_rate: The probability that an upload fails with HTTP 500 after the files are read.
+        :param keep_files: Whether to keep the contents of the uploaded files in `files`.
+        :param offset_delays: The delays in seconds of the first offset queries of the chunked uploads.
+        """
+        self.url = None
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.keep_files = keep_files
+
+        self.files = {}
+        self.callbacks = []
+        self.chunks = {}
+        self.connections = set()
+        self.num_requests = 0
+        self.num_failures = 0
+        self.received_bytes = 0
+        # The chunk requests that fail after the data is stored, i.e., the acknowledgements are lost
+        self.failed_chunks = set()
+        self.num_chunks = 0
+        self.num_offset_requests = 0
+        self._offset_delays = list(offset_delays)
+
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _read_files(self, request):
+        self.connections.add(request.transport.get_extra_info("peername"))
+        self.num_requests += 1
+        reader = await request.multipart()
+        names = []
+        async for part in reader:
+            name = os.path.basename(part.filename)
+            data = await part.read()
+            if self.keep_files:
+                self.files[name] = data
+            names.append(name)
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.num_failures += 1
+            raise web.HTTPInternalServerError()
+        return names
+
+    async def _upload(self, request):
+        names = await self._read_files(request)
+        return web.json_response({"url": f"https://storage/{names[0]}"})
+
+    async def _upload_batch(self, request):
+        names = await self._read_files(request)
+        assert len(names) == int(request.headers["NUM_FILES"])
+        return web.json_response({"urls": [f"https://storage/{name}" for name in names]})
+
+    async def _callback(self, request):
+        self.callbacks.append(await request.json())
+        return web.json_response({})
+
+    async def _upload_chunked_start(self, request):
+        r = await request.json()
+        upload_id = str(len(self.chunks))
+        self.chunks[upload_id] = {"filename": os.path.basename(r["filename"]), "size": r["size"], "data": b""}
+        return web.json_response({"upload_id": upload_id})
+
+    async def _upload_chunked_offset(self, request):
+        self.num_offset_requests += 1
+        if self._offset_delays:
+            await asyncio.sleep(self._offset_delays.pop(0))
+        upload = self.chunks[request.query["upload_id"]]
+        return web.json_response({"offset": len(upload["data"])})
+
+    async def _upload_chunked(self, request):
+        upload = self.chunks[request.query["upload_id"]]
+        data = await request.read()
+        start = int(request.headers["Content-Range"].split(" ")[1].split("-")[0])
+        assert start == len(upload["data"])
+        upload["data"] += data
+        self.received_bytes += len(data)
+        self.num_chunks += 1
+        if self.num_chunks in self.failed_chunks:
+            return web.json_response({}, status=500)
+        r = {"offset": len(upload["data"])}
+        if len(upload["data"]) == upload["size"]:
+            if self.keep_files:
+                self.files[upload["filename"]] = upload["data"]
+            r["url"] = f"https://storage/{upload['filename']}"
+        return web.json_response(r)
+
+    async def _start(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/upload", self._upload)
+        app.router.add_post("/upload_batch", self._upload_batch)
+        app.router.add_post("/callback", self._callback)
+        app.router.add_post("/upload_chunked", self._upload_chunked_start)
+        app.router.add_get("/upload_chunked", self._upload_chunked_offset)
+        app.router.add_put("/upload_chunked", self._upload_chunked)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+
+    async def _stop(self):
+        await self._runner.cleanup()
+        # Cancel the handlers still running, e.g., the slow requests abandoned by hedging
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -7,7 +7,8 @@ import pathlib
 import shutil
 import tempfile
 import urllib
-from typing import Any, Dict, Iterator, List, Optional, TypeVar, Union
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar, Union
 from packaging.version import Version
 
 import requests
@@ -19,6 +20,8 @@ try:
 except:
     pass
 
+PYDANTIC_V2 = Version(pydantic.version.VERSION) >= Version("2.0")
+
 FILENAME_ILLEGAL_CHARS = set("\u0000/")
 
 # Linux allows files up to 255 bytes long. We enforce a slightly shorter
@@ -116,12 +119,85 @@ def validate_new(value, name: str, field: pydantic.fields.FieldInfo):
 
 
 def validate(value, name: str, field: pydantic.fields.FieldInfo):
-    if Version(pydantic.version.VERSION) >= Version("2.0"):
+    if PYDANTIC_V2:
         validate_new(value, name, field)
     else:
         validate_old(value, name, field)
 
 
+def _compile_old(name: str, field: pydantic.fields.FieldInfo):
+    str_checks, seq_checks, num_checks = [], [], []
+    if field.min_length:
+        str_checks.append((lambda v, n=field.min_length: len(v) >= n,
+                           f"the length of {name} should be >= {field.min_length}"))
+    if field.max_length:
+        str_checks.append((lambda v, n=field.max_length: len(v) <= n,
+                           f"the length of {name} should be <= {field.max_length}"))
+    if field.min_items:
+        seq_checks.append((lambda v, n=field.min_items: len(v) >= n,
+                           f"the number of items in {name} should be >= {field.min_items}"))
+    if field.max_items:
+        seq_checks.append((lambda v, n=field.max_items: len(v) <= n,
+                           f"the number of items in {name} should be <= {field.max_items}"))
+    if field.ge:
+        num_checks.append((lambda v, n=field.ge: v >= n,
+                           f"the value of {name} should be >= {field.ge}"))
+    if field.le:
+        num_checks.append((lambda v, n=field.le: v <= n,
+                           f"the value of {name} should be <= {field.le}"))
+    return str_checks, seq_checks, num_checks
+
+
+def _compile_new(name: str, field: pydantic.fields.FieldInfo):
+    str_checks, seq_checks, num_checks = [], [], []
+    for constraint in field.metadata:
+        if isinstance(constraint, MinLen):
+            n = constraint.min_length
+            str_checks.append((lambda v, n=n: len(v) >= n, f"the length of {name} should be >= {n}"))
+            seq_checks.append((lambda v, n=n: len(v) >= n, f"the number of items in {name} should be >= {n}"))
+        elif isinstance(constraint, MaxLen):
+            n = constraint.max_length
+            str_checks.append((lambda v, n=n: len(v) <= n, f"the length of {name} should be <= {n}"))
+            seq_checks.append((lambda v, n=n: len(v) <= n, f"the number of items in {name} should be <= {n}"))
+        elif isinstance(constraint, Ge):
+            n = constraint.ge
+            str_checks.append((lambda v, n=n: v >= n, f"the value of {name} should be >= {n}"))
+            num_checks.append((lambda v, n=n: v >= n, f"the value of {name} should be >= {n}"))
+        elif isinstance(constraint, Le):
+            n = constraint.le
+            str_checks.append((lambda v, n=n: v <= n, f"the value of {name} should be <= {n}"))
+            num_checks.append((lambda v, n=n: v <= n, f"the value of {name} should be <= {n}"))
+    return str_checks, seq_checks, num_checks
+
+
+def compile_validator(name: str, field: pydantic.fields.FieldInfo) -> Optional[Callable[[Any], None]]:
+    """
+    Compiles the constraints of `field` into a single checker with the same semantics as `validate`.
+    The constraints are resolved once here so that validating a value doesn't need to inspect
+    the field again. Returns None if the field has no constraints to check.
+    """
+    if PYDANTIC_V2:
+        str_checks, seq_checks, num_checks = _compile_new(name, field)
+    else:
+        str_checks, seq_checks, num_checks = _compile_old(name, field)
+    if not (str_checks or seq_checks or num_checks):
+        return None
+
+    def _validator(value):
+        if isinstance(value, str):
+            checks = str_checks
+        elif isinstance(value, (list, tuple)):
+            checks = seq_checks
+        elif isinstance(value, (int, float)):
+            checks = num_checks
+        else:
+            return
+        for check, message in checks:
+            assert check(value), message
+
+    return _validator
+
+
 class File(io.IOBase):
     validate_always = True
 
@@ -152,6 +228,41 @@ class File(io.IOBase):
         field_schema.update(type="string", format="uri")
 
 
+class BytesFile:
+    """
+    An in-memory output file. `predict` can return `BytesFile`, `List[BytesFile]` or `Iterator[BytesFile]`
+    instead of `Path`, so that the outputs are uploaded from memory without being written to disk.
+    """
+
+    def __init__(
+            self,
+            data: Union[bytes, bytearray, memoryview, io.BytesIO],
+            filename: str,
+            content_type: str = None
+    ):
+        """
+        :param data: The file content. A `BytesIO` is not copied, but it shouldn't be resized until uploaded.
+        :param filename: The file name, e.g., "output.png". A unique prefix is added like `generate_filepath`.
+        :param content_type: The content type, which is guessed from `filename` if not set.
+        """
+        if isinstance(data, io.BytesIO):
+            data = data.getbuffer()
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError(f"BytesFile doesn't support data of type {type(data).__name__}")
+        self.data = data
+        self.filename = f"{uuid.uuid4()}-{os.path.basename(filename)}"
+        self.content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self.data)
+
+    def __len__(self) -> int:
+        return memoryview(self.data).nbytes
+
+    def __str__(self) -> str:
+        return self.filename
+
+
 class Path(pathlib.PosixPath):
     validate_always = True
 
@@ -1,166 +1,664 @@
+import io
 import os
 import json
 import time
+import uuid
 import aiohttp
 import asyncio
-import aiofiles
 import requests
+import threading
+import mimetypes
 import concurrent.futures
-from typing import List
-from contextlib import contextmanager
-from kservehelper.types import Path
+from typing import Dict, List, Union
+from urllib.parse import urlparse
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from kservehelper.types import Path, BytesFile
+from kservehelper.multipart import MultipartEncoder
+from kservehelper.storage import S3Storage
+from kservehelper.dedup import UploadDeduplicator
+from kservehelper.batching import UploadAggregator
+from kservehelper.retry import RetryPolicy, WebhookError
+from kservehelper.locks import flock
 
 
-def upload_files(webhook_url: str, paths: List[Path], timeout=60):
+# The size of the connection pool for the upload webhook
+UPLOAD_POOL_SIZE = int(os.getenv("UPLOAD_POOL_SIZE", 16))
+# The time in seconds an idle connection to the upload webhook is kept alive, and the TTL of the DNS cache
+UPLOAD_KEEPALIVE_TIMEOUT = float(os.getenv("UPLOAD_KEEPALIVE_TIMEOUT", 60))
+UPLOAD_DNS_CACHE_TTL = int(os.getenv("UPLOAD_DNS_CACHE_TTL", 300))
+# The number of threads for uploading files with `requests`
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 4))
+# The chunk size for the resumable uploads, i.e., the webhook URL ends with "upload_chunked"
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+# The settings of the direct uploads to S3, i.e., the webhook URL is "s3://bucket/prefix". The credentials
+# are read by boto3 from the environment, e.g., `AWS_ACCESS_KEY_ID` and `AWS_SECRET_ACCESS_KEY`
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", None)
+S3_REGION_NAME = os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+# The expiration time in seconds of the returned presigned URLs, or 0 to return the object URLs
+S3_URL_EXPIRES = int(os.getenv("S3_URL_EXPIRES", 3600))
+# The comma-separated buckets the outputs can be uploaded to directly. The other buckets are rejected,
+# so that the requests cannot write to the buckets of the server, e.g., the one of the model files
+S3_UPLOAD_BUCKETS = {b.strip() for b in os.getenv("S3_UPLOAD_BUCKETS", "").split(",") if b.strip()}
+# The time window in seconds for merging the files of concurrent requests into one "upload_batch" call
+# (0 to disable), and the maximum total size and number of files of one merged call
+UPLOAD_AGGREGATE_WAIT = float(os.getenv("UPLOAD_AGGREGATE_WAIT", 0))
+UPLOAD_AGGREGATE_BYTES = int(os.getenv("UPLOAD_AGGREGATE_BYTES", 8 * 1024 * 1024))
+UPLOAD_AGGREGATE_FILES = int(os.getenv("UPLOAD_AGGREGATE_FILES", 64))
+
+_http_session = None
+_upload_executor = None
+_storages = {}
+# The optional dedup of the uploaded files, enabled by `UPLOAD_DEDUP_SIZE`
+_deduplicator = UploadDeduplicator.from_env()
+_upload_lock = threading.Lock()
+# The retry policy of all the webhook calls
+_retry_policy = RetryPolicy.from_env()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the process-wide `requests` session for calling webhooks, which keeps
+    up to `UPLOAD_POOL_SIZE` connections alive per host.
+    """
+    global _http_session
+    with _upload_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=UPLOAD_POOL_SIZE, pool_maxsize=UPLOAD_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def _get_upload_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _upload_executor
+    with _upload_lock:
+        if _upload_executor is None:
+            _upload_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+        return _upload_executor
+
+
+def check_upload_target(webhook_url: str):
+    """
+    Raises ValueError if the upload webhook is an S3 bucket not listed in `S3_UPLOAD_BUCKETS`.
+    """
+    if webhook_url is None or not webhook_url.startswith("s3://"):
+        return
+    bucket = urlparse(webhook_url).netloc
+    if bucket not in S3_UPLOAD_BUCKETS:
+        raise ValueError(f"uploading to bucket {bucket} is not allowed, the allowed buckets "
+                         f"are set by S3_UPLOAD_BUCKETS")
+
+
+def upload_url_ttl(webhook_url: str) -> Union[float, None]:
+    """
+    Returns the time in seconds the returned URLs of an upload target can be reused, or None if
+    they don't expire. The presigned URLs of the direct S3 uploads expire in `S3_URL_EXPIRES`
+    seconds, so they are reused for half of it to stay valid for a while after being returned.
+    """
+    if webhook_url is not None and webhook_url.startswith("s3://") and S3_URL_EXPIRES > 0:
+        return S3_URL_EXPIRES / 2
+    return None
+
+
+def _get_storage(bucket: str) -> S3Storage:
+    check_upload_target(f"s3://{bucket}")
+    with _upload_lock:
+        if bucket not in _storages:
+            _storages[bucket] = S3Storage(
+                bucket=bucket,
+                region_name=S3_REGION_NAME,
+                aws_access_key_id=None,
+                aws_secret_access_key=None,
+                endpoint_url=S3_ENDPOINT_URL
+            )
+        return _storages[bucket]
+
+
+def _open_file(path: Union[Path, BytesFile]):
+    """
+    Returns the upload name, the content, the content type and the opened file (to close after uploading)
+    of an output file. The content of a `BytesFile` is sent from memory without copying.
+    """
+    if isinstance(path, BytesFile):
+        return path.filename, path.getbuffer(), path.content_type, None
+    filepath = str(path)
+    f = open(filepath, "rb")
+    return filepath, f, None, f
+
+
+def _remove_files(paths: List[Union[Path, BytesFile]]):
+    for path in paths:
+        if isinstance(path, BytesFile):
+            continue
+        file = str(path)
+        if os.path.exists(file):
+            os.remove(file)
+
+
+def _file_size(data) -> int:
+    if isinstance(data, memoryview):
+        return data.nbytes
+    return os.fstat(data.fileno()).st_size
+
+
+def _read_chunk(data, offset: int, size: int) -> bytes:
+    if isinstance(data, memoryview):
+        return data.cast("B")[offset:offset + size].tobytes()
+    data.seek(offset)
+    return data.read(size)
+
+
+def _content_range(offset: int, length: int, size: int) -> str:
+    if length == 0:
+        return f"bytes */{size}"
+    return f"bytes {offset}-{offset + length - 1}/{size}"
+
+
+def _post_files(webhook_url: str, fields: List, timeout, headers: Dict = None) -> requests.Response:
+    """
+    Posts files as a streamed multipart/form-data body, so that only a small block of
+    each file is kept in memory at a time.
+    """
+    encoder = MultipartEncoder(fields)
+    headers = {**(headers or {}), "Content-Type": encoder.content_type}
+    return get_http_session().post(webhook_url, data=encoder, headers=headers, timeout=timeout)
+
+
+def _find_uploaded(webhook_url: str, path: Union[Path, BytesFile]):
+    """
+    Returns the content hash of a file, and the URL of an identical file uploaded before via the same
+    webhook (or None).
+    """
+    digest = _deduplicator.digest(path)
+    url = _deduplicator.get(webhook_url, digest)
+    if url is not None and _deduplicator.check_exists:
+        try:
+            # `HEAD` is idempotent, so it is hedged if `WEBHOOK_HEDGE_DELAY` is set
+            response = _retry_policy.hedge(lambda: get_http_session().head(url, timeout=10, allow_redirects=True))
+            exists = response.status_code == 200
+        except Exception:
+            exists = False
+        if not exists:
+            _deduplicator.remove(webhook_url, digest)
+            url = None
+    return digest, url
+
+
+def _removes_files(webhook_url: str) -> bool:
+    """
+    Returns whether the files are removed once they are uploaded to the webhook, which is the case
+    except for "upload_batch".
+    """
+    return webhook_url.startswith("s3://") or not webhook_url.endswith("upload_batch")
+
+
+def _merge_uploaded(webhook_url: str, paths: List, found: List, urls: List[str]) -> List[str]:
+    """
+    Merges the known URLs of the skipped files with the URLs of the uploaded ones, and records the latter.
+    """
+    outputs, urls = [], iter(urls)
+    for path, (digest, url) in zip(paths, found):
+        if url is None:
+            url = next(urls)
+            _deduplicator.set(webhook_url, digest, url)
+        outputs.append(url)
+    # The skipped files are removed (or kept) as the uploaded ones
+    if _removes_files(webhook_url):
+        _remove_files([path for path, (_, url) in zip(paths, found) if url is not None])
+    return outputs
+
+
+def upload_files(webhook_url: str, paths: List[Union[Path, BytesFile]], timeout=60):
     # outputs = asyncio.run(_upload_v2(webhook_url, paths, timeout))
     # return outputs
-    if webhook_url.endswith("upload"):
+    # The expiring URLs are not remembered by the deduplicator
+    if _deduplicator is None or upload_url_ttl(webhook_url) is not None:
+        return {"output": _upload_files(webhook_url, paths, timeout)}
+    found = list(_get_upload_executor().map(lambda path: _find_uploaded(webhook_url, path), paths))
+    missing = [path for path, (_, url) in zip(paths, found) if url is None]
+    urls = _upload_files(webhook_url, missing, timeout) if missing else []
+    return {"output": _merge_uploaded(webhook_url, paths, found, urls)}
+
+
+def _upload_files(webhook_url: str, paths: List[Union[Path, BytesFile]], timeout) -> List[str]:
+    if webhook_url.startswith("s3://"):
+        outputs = _upload_s3(webhook_url, paths)
+    elif webhook_url.endswith("upload"):
         outputs = _upload_multithread(webhook_url, paths, timeout)
     elif webhook_url.endswith("upload_batch"):
         outputs = _upload_batch(webhook_url, paths, timeout)
+    elif webhook_url.endswith("upload_chunked"):
+        outputs = _upload_chunked(webhook_url, paths, timeout)
     else:
         raise RuntimeError(f"Invalid webhook URL: {webhook_url}")
-    return {"output": outputs}
+    return outputs
 
 
-def _upload(webhook_url: str, paths: List[Path], timeout):
-    outputs = []
-    for path in paths:
-        filepath = str(path)
-        with open(filepath, "rb") as f:
-            files = {"file": (filepath, f)}
-            response = requests.post(webhook_url, files=files, timeout=timeout)
-        if response.status_code != 200:
-            raise RuntimeError("failed to call upload webhook")
-        r = json.loads(response.text)
-        outputs.append(r["url"])
-    return outputs
+def _post_file(webhook_url: str, path: Union[Path, BytesFile], timeout) -> str:
+    filepath, data, content_type, f = _open_file(path)
+    try:
+        response = _post_files(
+            webhook_url, [("file", filepath, data, content_type)], _retry_policy.timeout(timeout))
+    finally:
+        if f is not None:
+            f.close()
+    if response.status_code != 200:
+        raise WebhookError(f"response status code is {response.status_code}", response.status_code)
+    r = json.loads(response.text)
+    return r["url"]
 
 
-def _upload_batch(webhook_url: str, paths: List[Path], timeout, retires=3):
-    error = None
-    result = {}
+def _upload(webhook_url: str, paths: List[Path], timeout):
+    return [_retry_policy.call(webhook_url, lambda p=path: _post_file(webhook_url, p, timeout))
+            for path in paths]
+
 
-    for retry in range(retires):
+def _upload_batch(webhook_url: str, paths: List[Path], timeout):
+    def _make_request():
         # Open a list of files
-        files, file_list = {}, []
+        fields, file_list = [], []
         for i, path in enumerate(paths):
-            filepath = str(path)
-            f = open(filepath, "rb")
-            files[f"file_{i}"] = (filepath, f)
-            file_list.append(f)
+            filepath, data, content_type, f = _open_file(path)
+            fields.append((f"file_{i}", filepath, data, content_type))
+            if f is not None:
+                file_list.append(f)
 
-        # Send a batch of files
+        # Send a batch of files, which are streamed instead of being loaded into memory
         try:
-            response = requests.post(
-                webhook_url,
-                headers={"NUM_FILES": str(len(file_list))},
-                files=files,
-                timeout=timeout
-            )
-            if response.status_code != 200:
-                raise RuntimeError(f"response status code is {response.status_code}")
-            error = None
-            result = json.loads(response.text)
-        except Exception as e:
-            print(f"UPLOAD ERROR: {str(e)}")
-            error = e
-            time.sleep(2 * (retry + 1))
-
-        # Close the files
-        for f in file_list:
+            response = _post_files(webhook_url, fields, _retry_policy.timeout(timeout),
+                                   headers={"NUM_FILES": str(len(paths))})
+        finally:
+            for f in file_list:
+                f.close()
+        if response.status_code != 200:
+            raise WebhookError(f"response status code is {response.status_code}", response.status_code)
+        return json.loads(response.text)["urls"]
+
+    return _retry_policy.call(webhook_url, _make_request)
+
+
+def _upload_multithread(webhook_url: str, paths: List[Path], timeout):
+    def _make_request(path):
+        return _retry_policy.call(webhook_url, lambda: _post_file(webhook_url, path, timeout))
+
+    executor = _get_upload_executor()
+    jobs = [executor.submit(_make_request, path) for path in paths]
+    concurrent.futures.wait(jobs)
+    _remove_files(paths)
+    return [job.result() for job in jobs]
+
+
+def _upload_chunked(webhook_url: str, paths: List[Path], timeout):
+    executor = _get_upload_executor()
+    jobs = [executor.submit(_upload_chunked_file, webhook_url, path, timeout) for path in paths]
+    concurrent.futures.wait(jobs)
+    _remove_files(paths)
+    return [job.result() for job in jobs]
+
+
+def _upload_chunked_file(webhook_url: str, path: Union[Path, BytesFile], timeout):
+    """
+    Uploads a file in chunks with the resumable protocol (see `async_upload_files`). After a failure,
+    the upload continues from the offset acknowledged by the webhook instead of starting over.
+    """
+    session = get_http_session()
+    timeout = _retry_policy.timeout(timeout)
+    filepath, data, content_type, f = _open_file(path)
+    try:
+        size = _file_size(data)
+        upload_id, offset, url, failures = None, 0, None, 0
+        while url is None:
+            try:
+                _retry_policy.check(webhook_url)
+                if upload_id is None:
+                    response = session.post(webhook_url, json={
+                        "filename": filepath, "size": size, "content_type": content_type}, timeout=timeout)
+                    response.raise_for_status()
+                    upload_id = response.json()["upload_id"]
+                if offset is None:
+                    # Querying the offset is idempotent, so it is hedged if `WEBHOOK_HEDGE_DELAY` is set
+                    response = _retry_policy.hedge(
+                        lambda: session.get(webhook_url, params={"upload_id": upload_id}, timeout=timeout))
+                    response.raise_for_status()
+                    offset = response.json()["offset"]
+                chunk = _read_chunk(data, offset, UPLOAD_CHUNK_SIZE)
+                response = session.put(
+                    webhook_url,
+                    params={"upload_id": upload_id},
+                    headers={"Content-Range": _content_range(offset, len(chunk), size)},
+                    data=chunk,
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                r = response.json()
+                offset, url, failures = r["offset"], r.get("url", None), 0
+                _retry_policy.record(webhook_url, True)
+            except Exception as e:
+                # The retries are counted from the last chunk acknowledged by the webhook
+                time.sleep(_retry_policy.retry_delay(webhook_url, failures, e))
+                failures += 1
+                offset = None
+        return url
+    finally:
+        if f is not None:
             f.close()
-        if error is None:
-            break
-
-    if error is not None:
-        raise error
-    return result["urls"]
-
-
-def _upload_multithread(webhook_url: str, paths: List[Path], timeout, retires=3):
-    def _make_request(filepath):
-        for i in range(retires):
-            with open(filepath, "rb") as f:
-                files = {"file": (filepath, f)}
-                try:
-                    response = requests.post(webhook_url, files=files, timeout=timeout)
-                    if response.status_code != 200:
-                        raise RuntimeError(f"response status code is {response.status_code}")
-                    r = json.loads(response.text)
-                    return filepath, r["url"]
-                except Exception as e:
-                    print(f"ERROR: {e}")
-                    print(f"Retrying {i + 1}...")
-                    time.sleep((i + 1) * 2)
-        return None
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        jobs = [executor.submit(_make_request, str(path)) for path in paths]
-        outputs = [job.result() for job in concurrent.futures.as_completed(jobs)]
-        for path in paths:
-            file = str(path)
-            if os.path.exists(file):
-                os.remove(file)
-        if None in outputs:
-            raise RuntimeError("failed to upload files")
-
-    filename2url = dict(outputs)
-    return [filename2url[str(path)] for path in paths]
-
-
-async def _async_upload_v1(webhook_url: str, paths: List[Path], timeout):
-    outputs = []
-    async with aiohttp.ClientSession() as session:
-        for path in paths:
-            filepath = str(path)
-            with open(filepath, "rb") as f:
-                data = aiohttp.FormData()
-                data.add_field("file", f, filename=filepath)
-                async with session.post(webhook_url, data=data, timeout=timeout) as response:
-                    if not response.ok:
-                        raise RuntimeError("failed to call upload webhook")
-                    text = await response.text()
-                    r = json.loads(text)
-                    outputs.append(r["url"])
-    return outputs
 
 
-async def _async_upload_v2(webhook_url, paths, timeout):
-    async def _upload_file(session, local_path):
-        async with aiofiles.open(local_path, "rb") as f:
-            data = aiohttp.FormData()
-            data.add_field("file", f, filename=local_path)
-            async with session.post(webhook_url, data=data, timeout=timeout) as response:
-                if not response.ok:
-                    raise RuntimeError("failed to call upload webhook")
-                text = await response.text()
-                r = json.loads(text)
-                return local_path, r["url"]
+def _upload_s3_file(url: str, path: Union[Path, BytesFile]) -> str:
+    """
+    Uploads a file directly to S3 without going through the webhook, and returns its presigned URL
+    (or the object URL if `S3_URL_EXPIRES` is 0).
+    """
+    r = urlparse(url)
+    storage = _get_storage(r.netloc)
+    filepath, data, content_type, f = _open_file(path)
+    try:
+        # The random ID keeps the files of different requests with the same name apart
+        key = "/".join(p for p in [r.path.strip("/"), uuid.uuid4().hex, os.path.basename(filepath)] if p)
+        if content_type is None:
+            content_type = mimetypes.guess_type(filepath)[0]
+        fileobj = f if f is not None else io.BytesIO(data)
+        if not storage.upload_fileobj(fileobj, key, content_type=content_type):
+            raise RuntimeError(f"failed to upload {filepath} to {url}")
+        return storage.get_url(key, expires_in=S3_URL_EXPIRES)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def _upload_s3(url: str, paths: List[Path]):
+    executor = _get_upload_executor()
+    jobs = [executor.submit(_upload_s3_file, url, path) for path in paths]
+    try:
+        return [job.result() for job in jobs]
+    finally:
+        _remove_files(paths)
+
+
+# The client sessions of the async uploads, one per event loop, and the tasks closing them
+_sessions = {}
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """
+    Returns the client session shared by all the async uploads in the current event loop,
+    so that connections to the upload webhook are reused across requests. The session is
+    closed when the event loop shuts down, e.g., at the end of `asyncio.run`.
+    """
+    loop = asyncio.get_running_loop()
+    with _upload_lock:
+        session, _ = _sessions.get(loop, (None, None))
+        if session is None or session.closed:
+            # Forget the sessions of the event loops that have been closed
+            for other in [other for other in _sessions if other.is_closed()]:
+                _sessions.pop(other)
+            session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+                limit_per_host=UPLOAD_POOL_SIZE,
+                keepalive_timeout=UPLOAD_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=UPLOAD_DNS_CACHE_TTL
+            ))
+            # The task is kept referenced, since the event loop only holds weak references to its tasks
+            _sessions[loop] = (session, loop.create_task(_close_on_shutdown(session)))
+        return session
+
+
+async def _close_on_shutdown(session: aiohttp.ClientSession):
+    # Waits until it is cancelled by `close_session` or by the shutdown of the event loop
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await session.close()
+
 
-    async with aiohttp.ClientSession() as sess:
-        urls = await asyncio.gather(*[_upload_file(sess, str(path)) for path in paths])
-        filename2url = dict(urls)
-        return [filename2url[str(path)] for path in paths]
+async def close_session():
+    """
+    Closes the client session of the current event loop.
+    """
+    with _upload_lock:
+        session, closer = _sessions.pop(asyncio.get_running_loop(), (None, None))
+    if session is not None:
+        closer.cancel()
+        await session.close()
 
 
-@contextmanager
-def flock(lock_path, timeout=300):
+async def async_upload_files(webhook_url: str, paths: List[Union[Path, BytesFile]], timeout=60):
     """
-    Context manager that acquires and releases a file-based lock.
+    Uploads files via the webhook. The protocol depends on the suffix of the webhook URL:
+
+    - "upload": one multipart/form-data request per file, and the response is `{"url": ...}`.
+    - "upload_batch": one request with all the files, and the response is `{"urls": [...]}`. If
+      `UPLOAD_AGGREGATE_WAIT` > 0, the files of concurrent calls are merged into one request.
+    - "upload_chunked": a resumable upload per file. `POST` with `{"filename", "size", "content_type"}`
+      returns `{"upload_id": ...}`. Each chunk is sent by `PUT ?upload_id=...` with a `Content-Range`
+      header, and the response is `{"offset": ...}` with the number of bytes received so far, plus
+      `"url"` once the file is complete. `GET ?upload_id=...` returns the current `{"offset": ...}`,
+      from which the upload resumes after a failure.
+
+    If the webhook URL is "s3://bucket/prefix", the files are uploaded directly to the S3 bucket instead
+    (see `S3_UPLOAD_BUCKETS`, `S3_ENDPOINT_URL` and `S3_URL_EXPIRES`), with the keys
+    "prefix/<random ID>/<filename>".
+
+    If `UPLOAD_DEDUP_SIZE` > 0, the files identical to the ones uploaded before are skipped, and the
+    known URLs are returned (except for the presigned URLs of S3, which expire).
     """
-    start_time = time.time()
-    while True:
+    if _deduplicator is None or upload_url_ttl(webhook_url) is not None:
+        return {"output": await _async_upload_files(webhook_url, paths, timeout)}
+    # Hashing reads the files, so it runs in the upload thread pool
+    loop = asyncio.get_running_loop()
+    found = await asyncio.gather(*[
+        loop.run_in_executor(_get_upload_executor(), _find_uploaded, webhook_url, path) for path in paths])
+    missing = [path for path, (_, url) in zip(paths, found) if url is None]
+    urls = await _async_upload_files(webhook_url, missing, timeout) if missing else []
+    return {"output": _merge_uploaded(webhook_url, paths, found, urls)}
+
+
+async def _async_upload_files(webhook_url: str, paths: List[Union[Path, BytesFile]], timeout) -> List[str]:
+    if webhook_url.startswith("s3://"):
+        outputs = await _async_upload_s3(webhook_url, paths)
+    elif webhook_url.endswith("upload"):
+        outputs = await _async_upload_multiple(webhook_url, paths, timeout)
+    elif webhook_url.endswith("upload_batch"):
+        if _aggregator is not None:
+            outputs = await _aggregator.submit(webhook_url, paths)
+        else:
+            outputs = await _async_upload_batch(webhook_url, paths, timeout)
+    elif webhook_url.endswith("upload_chunked"):
+        outputs = await _async_upload_chunked(webhook_url, paths, timeout)
+    else:
+        raise RuntimeError(f"Invalid webhook URL: {webhook_url}")
+    return outputs
+
+
+async def _async_upload_s3(url: str, paths: List[Path]):
+    # boto3 is blocking, so the uploads run in the upload thread pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.gather(*[
+            loop.run_in_executor(_get_upload_executor(), _upload_s3_file, url, path) for path in paths])
+    finally:
+        _remove_files(paths)
+
+
+async def _async_post_file(webhook_url: str, path: Union[Path, BytesFile], timeout) -> str:
+    session = _get_session()
+    filepath, value, content_type, f = _open_file(path)
+    data = aiohttp.FormData(quote_fields=False)
+    data.add_field("file", value, filename=filepath, content_type=content_type)
+    try:
+        async with session.post(
+                webhook_url,
+                data=data,
+                timeout=aiohttp.ClientTimeout(total=_retry_policy.timeout(timeout))
+        ) as response:
+            if response.status != 200:
+                raise WebhookError(f"response status code is {response.status}", response.status)
+            r = json.loads(await response.text())
+            return r["url"]
+    finally:
+        if f is not None:
+            f.close()
+
+
+async def _async_upload_batch(webhook_url: str, paths: List[Path], timeout):
+    async def _make_request():
+        session = _get_session()
+        # Open a list of files, which are read by aiohttp in the default executor
+        data, file_list = aiohttp.FormData(quote_fields=False), []
+        for i, path in enumerate(paths):
+            filepath, value, content_type, f = _open_file(path)
+            data.add_field(f"file_{i}", value, filename=filepath, content_type=content_type)
+            if f is not None:
+                file_list.append(f)
         try:
-            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL)
-            break
-        except OSError:
-            if (time.time() - start_time) >= timeout:
-                raise Exception("Timeout occurred.")
+            async with session.post(
+                    webhook_url,
+                    headers={"NUM_FILES": str(len(paths))},
+                    data=data,
+                    timeout=aiohttp.ClientTimeout(total=_retry_policy.timeout(timeout))
+            ) as response:
+                if response.status != 200:
+                    raise WebhookError(f"response status code is {response.status}", response.status)
+                return json.loads(await response.text())["urls"]
+        finally:
+            for f in file_list:
+                f.close()
+
+    return await _retry_policy.acall(webhook_url, _make_request)
+
+
+async def _async_upload_multiple(webhook_url: str, paths: List[Path], timeout):
+    async def _make_request(path):
+        return await _retry_policy.acall(webhook_url, lambda: _async_post_file(webhook_url, path, timeout))
+
+    outputs = await asyncio.gather(*[_make_request(path) for path in paths], return_exceptions=True)
+    _remove_files(paths)
+    for output in outputs:
+        if isinstance(output, BaseException):
+            raise output
+    return outputs
+
+
+async def _async_upload_chunked(webhook_url: str, paths: List[Path], timeout):
+    try:
+        return await asyncio.gather(*[
+            _async_upload_chunked_file(webhook_url, path, timeout) for path in paths])
+    finally:
+        _remove_files(paths)
+
+
+async def _async_get_offset(session: aiohttp.ClientSession, webhook_url: str, upload_id: str, timeout) -> int:
+    async with session.get(webhook_url, params={"upload_id": upload_id}, timeout=timeout) as response:
+        response.raise_for_status()
+        return (await response.json())["offset"]
 
+
+async def _async_upload_chunked_file(webhook_url: str, path: Union[Path, BytesFile], timeout):
+    session = _get_session()
+    loop = asyncio.get_running_loop()
+    client_timeout = aiohttp.ClientTimeout(total=_retry_policy.timeout(timeout))
+    filepath, data, content_type, f = _open_file(path)
     try:
-        yield fd
+        size = _file_size(data)
+        upload_id, offset, url, failures = None, 0, None, 0
+        while url is None:
+            try:
+                _retry_policy.check(webhook_url)
+                if upload_id is None:
+                    async with session.post(webhook_url, json={
+                        "filename": filepath, "size": size, "content_type": content_type
+                    }, timeout=client_timeout) as response:
+                        response.raise_for_status()
+                        upload_id = (await response.json())["upload_id"]
+                if offset is None:
+                    # Querying the offset is idempotent, so it is hedged if `WEBHOOK_HEDGE_DELAY` is set
+                    offset = await _retry_policy.ahedge(
+                        lambda: _async_get_offset(session, webhook_url, upload_id, client_timeout))
+                chunk = await loop.run_in_executor(None, _read_chunk, data, offset, UPLOAD_CHUNK_SIZE)
+                async with session.put(
+                        webhook_url,
+                        params={"upload_id": upload_id},
+                        headers={"Content-Range": _content_range(offset, len(chunk), size)},
+                        data=chunk,
+                        timeout=client_timeout
+                ) as response:
+                    response.raise_for_status()
+                    r = await response.json()
+                offset, url, failures = r["offset"], r.get("url", None), 0
+                _retry_policy.record(webhook_url, True)
+            except Exception as e:
+                # The retries are counted from the last chunk acknowledged by the webhook
+                await asyncio.sleep(_retry_policy.retry_delay(webhook_url, failures, e))
+                failures += 1
+                offset = None
+        return url
     finally:
-        if fd:
-            os.close(fd)
-            os.remove(lock_path)
+        if f is not None:
+            f.close()
+
+
+# The optional merging of concurrent "upload_batch" calls, enabled by `UPLOAD_AGGREGATE_WAIT`
+_aggregator = UploadAggregator(
+    lambda webhook_url, paths: _async_upload_batch(webhook_url, paths, timeout=60),
+    max_wait_time=UPLOAD_AGGREGATE_WAIT,
+    max_batch_bytes=UPLOAD_AGGREGATE_BYTES,
+    max_batch_files=UPLOAD_AGGREGATE_FILES
+) if UPLOAD_AGGREGATE_WAIT > 0 else None
+
+
+async def notify_webhook(webhook_url: str, data: Dict, timeout=60):
+    """
+    Posts a JSON message to a webhook, e.g., the completion callback of deferred uploads.
+    """
+    async def _make_request():
+        session = _get_session()
+        async with session.post(
+                webhook_url,
+                json=data,
+                timeout=aiohttp.ClientTimeout(total=_retry_policy.timeout(timeout))
+        ) as response:
+            if response.status != 200:
+                raise WebhookError(f"response status code is {response.status}", response.status)
+
+    await _retry_policy.acall(webhook_url, _make_request)
+
+
+class UploadTracker:
+
+    def __init__(self, capacity: int = 10000):
+        """
+        Records the status of deferred uploads, which can be polled by upload IDs. The status is
+        kept in the process memory, i.e., it is not shared by the worker processes or replicas.
+
+        :param capacity: The maximum number of uploads to keep. The oldest ones are removed first.
+        """
+        self.capacity = capacity
+        self.uploads = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _update(self, upload_id: str, status: Dict) -> Dict:
+        with self.lock:
+            self.uploads[upload_id] = status
+            while len(self.uploads) > self.capacity:
+                self.uploads.popitem(last=False)
+        return status
+
+    def create(self) -> str:
+        upload_id = uuid.uuid4().hex
+        self._update(upload_id, {"upload_id": upload_id, "status": "pending"})
+        return upload_id
+
+    def succeed(self, upload_id: str, results: Dict) -> Dict:
+        return self._update(upload_id, {"upload_id": upload_id, "status": "succeeded", **results})
+
+    def fail(self, upload_id: str, error: str) -> Dict:
+        return self._update(upload_id, {"upload_id": upload_id, "status": "failed", "error": error})
+
+    def get(self, upload_id: str) -> Dict:
+        with self.lock:
+            if upload_id not in self.uploads:
+                raise ValueError(f"upload {upload_id} doesn't exist")
+            return dict(self.uploads[upload_id])
@@ -21,13 +21,14 @@ setup(
         "kserve==0.13.1",
         "requests==2.29.0",
         "aiohttp==3.8.3",
-        "aiofiles==23.2.1",
         "schema",
         "pyyaml",
         "click",
         "pytest",
         "mmh3",
-        "boto3"
+        "boto3",
+        "orjson",
+        "msgpack"
     ],
     python_requires=">=3.8,<4",
     zip_safe=False,
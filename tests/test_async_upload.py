@@ -0,0 +1,419 @@
+import os
+import time
+import unittest
+import io
+import asyncio
+import threading
+from typing import List, Iterator
+from kservehelper.model import KServeModel
+from kservehelper.types import Input, Path, BytesFile
+from unittest import mock
+from kservehelper import utils
+from kservehelper.dedup import UploadDeduplicator
+from kservehelper.batching import UploadAggregator
+from kservehelper.utils import async_upload_files
+from kservehelper.testing import LocalWebhook, make_files
+
+
+class CustomModel:
+
+    def load(self):
+        pass
+
+    def predict(
+            self,
+            num_files: int = Input(
+                description="The number of output files",
+                default=2
+            ),
+            prefix: str = Input(
+                description="The prefix of the file contents",
+                default="file"
+            )
+    ) -> List[Path]:
+        return make_files(num_files, prefix)
+
+
+class StreamingModel:
+
+    def __init__(self):
+        self.webhook = None
+        # Whether each file is received by the webhook before the next one is generated
+        self.uploaded = []
+
+    def load(self):
+        pass
+
+    def predict(
+            self,
+            num_files: int = Input(
+                description="The number of output files",
+                default=3
+            )
+    ) -> Iterator[Path]:
+        for i in range(num_files):
+            path = KServeModel.generate_filepath(f"{i}.txt")
+            with open(path, "w") as f:
+                f.write(f"file {i}")
+            yield Path(path)
+            name = os.path.basename(path)
+            deadline = time.monotonic() + 5
+            while name not in self.webhook.files and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.uploaded.append(name in self.webhook.files)
+
+
+class ExclusiveModel:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def predict(
+            self,
+            num_files: int = Input(
+                description="The number of output files",
+                default=3
+            )
+    ) -> Iterator[Path]:
+        for i in range(num_files):
+            with self.lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            time.sleep(0.02)
+            path = KServeModel.generate_filepath(f"{i}.txt")
+            with open(path, "w") as f:
+                f.write(f"file {i}")
+            with self.lock:
+                self.active -= 1
+            yield Path(path)
+
+
+class BytesModel:
+
+    def load(self):
+        pass
+
+    def predict(
+            self,
+            num_files: int = Input(
+                description="The number of output files",
+                default=2
+            )
+    ) -> List[BytesFile]:
+        outputs = []
+        for i in range(num_files):
+            buffer = io.BytesIO()
+            buffer.write(f"file {i}".encode())
+            outputs.append(BytesFile(buffer, f"{i}.txt"))
+        return outputs
+
+
+class TestAsyncUpload(unittest.TestCase):
+
+    @staticmethod
+    def _upload(webhook, suffix, files):
+        async def _run():
+            return await async_upload_files(f"{webhook.url}/{suffix}", files)
+
+        webhook.start()
+        try:
+            return asyncio.run(_run())
+        finally:
+            webhook.stop()
+
+    def test_upload(self):
+        webhook = LocalWebhook()
+        paths = make_files(3)
+        outputs = self._upload(webhook, "upload", paths)
+        names = [os.path.basename(str(path)) for path in paths]
+        self.assertListEqual(outputs["output"], [f"https://storage/{name}" for name in names])
+        self.assertEqual(webhook.files[names[1]], b"file 1")
+        # One webhook call per file, and the uploaded files are removed
+        self.assertEqual(webhook.num_requests, 3)
+        self.assertFalse(any(os.path.exists(str(path)) for path in paths))
+
+    def test_session(self):
+        async def _run():
+            return utils._get_session(), utils._get_session()
+
+        first, same = asyncio.run(_run())
+        self.assertIs(first, same)
+        # The session is closed with its event loop, and a new loop gets a new session
+        self.assertTrue(first.closed)
+        second, _ = asyncio.run(_run())
+        self.assertIsNot(second, first)
+        self.assertTrue(second.closed)
+
+    def test_connection_reuse(self):
+        model = KServeModel("test", CustomModel)
+
+        async def _run():
+            for _ in range(5):
+                await model.predict({"num_files": 2, "upload_webhook": f"{webhook.url}/upload"})
+
+        webhook = LocalWebhook()
+        webhook.start()
+        try:
+            asyncio.run(_run())
+        finally:
+            webhook.stop()
+        # The connections of the serving path are kept alive and shared across the requests
+        self.assertEqual(webhook.num_requests, 10)
+        self.assertLessEqual(len(webhook.connections), 2)
+
+    def test_upload_batch(self):
+        webhook = LocalWebhook()
+        paths = make_files(3)
+        outputs = self._upload(webhook, "upload_batch", paths)
+        # All the files are sent in one webhook call, and the returned URLs keep the order of the files
+        self.assertEqual(webhook.num_requests, 1)
+        for i, url in enumerate(outputs["output"]):
+            self.assertEqual(url, f"https://storage/{os.path.basename(str(paths[i]))}")
+            self.assertEqual(webhook.files[os.path.basename(url)], f"file {i}".encode())
+
+    def test_upload_chunked(self):
+        webhook = LocalWebhook()
+        webhook.failed_chunks = {2}
+        paths = make_files(2)
+        data = os.urandom(1000)
+        with open(str(paths[1]), "wb") as f:
+            f.write(data)
+        files = paths + [BytesFile(b"x" * 250, "bytes.bin")]
+        with mock.patch("kservehelper.utils.UPLOAD_CHUNK_SIZE", 100):
+            outputs = self._upload(webhook, "upload_chunked", files)
+
+        names = [os.path.basename(url) for url in outputs["output"]]
+        self.assertListEqual([webhook.files[name] for name in names], [b"file 0", data, b"x" * 250])
+        # The files are split into 1 + 10 + 3 chunks. The failed chunk is not sent again, since
+        # the upload queries the stored offset once and resumes from it
+        self.assertEqual(webhook.num_chunks, 14)
+        self.assertEqual(webhook.num_offset_requests, 1)
+        self.assertEqual(webhook.received_bytes, 6 + 1000 + 250)
+        self.assertFalse(any(os.path.exists(str(path)) for path in paths))
+
+    def test_hedged_offset(self):
+        async def _run():
+            # The first offset query after the failed chunk is slow, so a second one is sent
+            webhook = LocalWebhook(offset_delays=[1])
+            webhook.failed_chunks = {1}
+            webhook.start()
+            try:
+                files = [BytesFile(b"x" * 250, "bytes.bin")]
+                with mock.patch("kservehelper.utils.UPLOAD_CHUNK_SIZE", 100), \
+                        mock.patch.object(utils._retry_policy, "hedge_delay", 0.05), \
+                        mock.patch.object(utils._retry_policy, "base_delay", 0.01):
+                    outputs = await async_upload_files(f"{webhook.url}/upload_chunked", files)
+                return webhook, outputs
+            finally:
+                webhook.stop()
+
+        webhook, outputs = asyncio.run(_run())
+        name = os.path.basename(outputs["output"][0])
+        self.assertTrue(name.endswith("bytes.bin"))
+        self.assertEqual(webhook.files[name], b"x" * 250)
+        self.assertEqual(webhook.num_offset_requests, 2)
+
+    def test_dedup(self):
+        async def _run(deduplicator):
+            webhook = LocalWebhook()
+            webhook.start()
+            try:
+                with mock.patch.object(utils, "_deduplicator", deduplicator):
+                    first = await async_upload_files(
+                        f"{webhook.url}/upload", make_files(2) + [BytesFile(b"bytes", "a.bin")])
+                    # The same contents with different filenames, and a new file
+                    second = await async_upload_files(
+                        f"{webhook.url}/upload", make_files(3) + [BytesFile(b"bytes", "b.bin")])
+                return webhook, first, second
+            finally:
+                webhook.stop()
+
+        webhook, first, second = asyncio.run(_run(UploadDeduplicator(capacity=16)))
+        # The known contents get the URLs of the first uploads, and only the new file is sent
+        self.assertListEqual(second["output"][:2], first["output"][:2])
+        self.assertEqual(second["output"][3], first["output"][2])
+        self.assertEqual(webhook.num_requests, 4)
+        self.assertEqual(webhook.files[os.path.basename(second["output"][2])], b"file 2")
+
+        # The known URLs don't exist, so the files are uploaded again
+        webhook, first, second = asyncio.run(_run(UploadDeduplicator(capacity=16, check_exists=True)))
+        self.assertEqual(len(webhook.files), 7)
+
+    def test_dedup_keep_files(self):
+        async def _run():
+            webhook = LocalWebhook()
+            webhook.start()
+            try:
+                with mock.patch.object(utils, "_deduplicator", UploadDeduplicator(capacity=16)):
+                    await async_upload_files(f"{webhook.url}/upload_batch", make_files(2))
+                    paths = make_files(2)
+                    outputs = await async_upload_files(f"{webhook.url}/upload_batch", paths)
+                return webhook, paths, outputs
+            finally:
+                webhook.stop()
+
+        webhook, paths, outputs = asyncio.run(_run())
+        self.assertEqual(webhook.num_requests, 1)
+        self.assertEqual(len(outputs["output"]), 2)
+        # The skipped files are kept as the uploaded ones for "upload_batch"
+        self.assertTrue(all(os.path.exists(str(path)) for path in paths))
+
+    def test_aggregate(self):
+        model = KServeModel("test", CustomModel)
+
+        async def _run(aggregator):
+            webhook = LocalWebhook()
+            webhook.start()
+            try:
+                with mock.patch.object(utils, "_aggregator", aggregator):
+                    outputs = await asyncio.gather(*[
+                        model.predict({
+                            "num_files": 2,
+                            "prefix": f"request {j}",
+                            "upload_webhook": f"{webhook.url}/upload_batch"
+                        })
+                        for j in range(8)
+                    ])
+                return outputs, webhook
+            finally:
+                webhook.stop()
+
+        def _upload(webhook_url, paths):
+            return utils._async_upload_batch(webhook_url, paths, timeout=60)
+
+        # The files of the 8 requests are uploaded in one webhook call, and each request gets
+        # the URLs of its own files back
+        results, webhook = asyncio.run(_run(UploadAggregator(_upload, max_wait_time=0.05)))
+        self.assertEqual(webhook.num_requests, 1)
+        self.assertEqual(len(webhook.files), 16)
+        for j, outputs in enumerate(results):
+            self.assertListEqual(
+                [webhook.files[os.path.basename(url)] for url in outputs["output"]],
+                [f"request {j} {i}".encode() for i in range(2)])
+
+        # At most 4 files in one webhook call
+        results, webhook = asyncio.run(_run(UploadAggregator(_upload, max_wait_time=0.05, max_batch_files=4)))
+        self.assertEqual(webhook.num_requests, 4)
+        self.assertEqual(len(webhook.files), 16)
+
+    def test_model(self):
+        model = KServeModel("test", CustomModel)
+
+        async def _run():
+            webhook = LocalWebhook()
+            webhook.start()
+            try:
+                return await asyncio.gather(*[
+                    model.predict({"num_files": 2, "upload_webhook": f"{webhook.url}/upload"})
+                    for _ in range(3)
+                ])
+            finally:
+                webhook.stop()
+
+        for outputs in asyncio.run(_run()):
+            self.assertEqual(len(outputs["output"]), 2)
+            self.assertTrue(outputs["output"][0].startswith("https://storage/"))
+
+    def test_streaming_model(self):
+        model = KServeModel("test", StreamingModel)
+
+        async def _run():
+            return await model.predict({"num_files": 3, "upload_webhook": f"{webhook.url}/upload_batch"})
+
+        webhook = LocalWebhook()
+        model.model.webhook = webhook
+        webhook.start()
+        try:
+            outputs = asyncio.run(_run())
+        finally:
+            webhook.stop()
+        self.assertEqual(len(outputs["output"]), 3)
+        for i, url in enumerate(outputs["output"]):
+            self.assertTrue(url.endswith(f"-{i}.txt"))
+            self.assertEqual(webhook.files[os.path.basename(url)], f"file {i}".encode())
+        # The uploads overlap with the generation, i.e., each file is uploaded before the next one is generated
+        self.assertListEqual(model.model.uploaded, [True] * 3)
+
+    def test_streaming_concurrency(self):
+        model = KServeModel("test", ExclusiveModel)
+
+        async def _run():
+            return await asyncio.gather(*[
+                model.predict({"num_files": 3, "upload_webhook": f"{webhook.url}/upload"}) for _ in range(2)])
+
+        webhook = LocalWebhook()
+        webhook.start()
+        try:
+            results = asyncio.run(_run())
+        finally:
+            webhook.stop()
+        self.assertTrue(all(len(outputs["output"]) == 3 for outputs in results))
+        # The generators of the two requests hold the executor slot in turn (`MAX_CONCURRENCY` = 1)
+        self.assertEqual(model.model.max_active, 1)
+
+    def test_bytes_model(self):
+        model = KServeModel("test", BytesModel)
+
+        async def _run():
+            webhook = LocalWebhook()
+            webhook.start()
+            try:
+                return [
+                    await model.predict({"num_files": 2, "upload_webhook": f"{webhook.url}/{suffix}"})
+                    for suffix in ["upload", "upload_batch"]
+                ], webhook
+            finally:
+                webhook.stop()
+
+        results, webhook = asyncio.run(_run())
+        for outputs in results:
+            self.assertEqual(len(outputs["output"]), 2)
+            for i, url in enumerate(outputs["output"]):
+                self.assertTrue(url.endswith(f"-{i}.txt"))
+                self.assertEqual(webhook.files[os.path.basename(url)], f"file {i}".encode())
+
+    def test_deferred_upload(self):
+        model = KServeModel("test", CustomModel)
+
+        async def _run():
+            # The uploads are blocked until `predict` returns
+            uploading = asyncio.Event()
+
+            async def _upload(*args, **kwargs):
+                await uploading.wait()
+                return await async_upload_files(*args, **kwargs)
+
+            webhook = LocalWebhook()
+            webhook.start()
+            try:
+                with mock.patch("kservehelper.model.async_upload_files", _upload):
+                    outputs = await asyncio.wait_for(model.predict({
+                        "num_files": 2,
+                        "upload_webhook": f"{webhook.url}/upload_batch",
+                        "upload_mode": "deferred",
+                        "upload_callback": f"{webhook.url}/callback"
+                    }), timeout=5)
+                    pending = await model.predict({"upload_status": outputs["upload_id"]})
+                    uploading.set()
+                    while not webhook.callbacks:
+                        await asyncio.sleep(0.05)
+                status = await model.predict({"upload_status": outputs["upload_id"]})
+                return outputs, pending, status, webhook
+            finally:
+                webhook.stop()
+
+        outputs, pending, status, webhook = asyncio.run(_run())
+        # `predict` returns before the files are uploaded
+        self.assertEqual(outputs["status"], "pending")
+        self.assertEqual(pending["status"], "pending")
+        self.assertEqual(status["status"], "succeeded")
+        self.assertEqual(len(status["output"]), 2)
+        self.assertDictEqual(webhook.callbacks[0], status)
+        with self.assertRaises(ValueError):
+            asyncio.run(model.predict({"upload_status": "unknown"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -41,6 +41,23 @@ class CustomModel:
         return outputs
 
 
+class RequiredModel:
+
+    def predict(
+            self,
+            batch: list = [{
+                "prompt": Input(
+                    description="Input prompt"
+                ),
+                "param_a": Input(
+                    description="param",
+                    default=1
+                ),
+            }]
+    ) -> Dict:
+        return {"outputs": batch}
+
+
 class TestKServeModel(unittest.TestCase):
 
     def test_model(self):
@@ -63,6 +80,27 @@ class TestKServeModel(unittest.TestCase):
         self.assertDictEqual(values[0], {"prompt": "test a", "param_a": 3, "param_b": 1})
         self.assertDictEqual(values[1], {"prompt": "test b", "param_a": 1, "param_b": 2})
 
+    def test_validation(self):
+        model = KServeModel("test", CustomModel)
+        payload = {"batch": [{"prompt": "test a", "param_b": 3}]}
+        with self.assertRaises(AssertionError):
+            asyncio.run(model.predict(payload))
+        payload = {"batch": [{"prompt": "test a", "param_c": 1}]}
+        with self.assertRaises(ValueError):
+            asyncio.run(model.predict(payload))
+        payload = {"batch": [{"prompt": "test a"}], "unknown": 1}
+        with self.assertRaises(ValueError):
+            asyncio.run(model.predict(payload))
+
+    def test_required(self):
+        model = KServeModel("test", RequiredModel)
+        outputs = asyncio.run(model.predict({"batch": [{"prompt": "test a"}]}))
+        self.assertListEqual(outputs["outputs"], [{"prompt": "test a", "param_a": 1}])
+        with self.assertRaisesRegex(ValueError, "batch.prompt"):
+            asyncio.run(model.predict({"batch": [{"prompt": "test a"}, {"param_a": 2}]}))
+        with self.assertRaisesRegex(ValueError, "batch"):
+            asyncio.run(model.predict({}))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,143 @@
+import os
+import unittest
+import asyncio
+import tempfile
+from typing import Dict
+from kservehelper.model import KServeModel
+from kservehelper.batching import UploadAggregator
+from kservehelper.types import Input, Path
+
+
+class CustomModel:
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def load(self):
+        pass
+
+    def predict(
+            self,
+            prompt: str = Input(
+                description="Input prompt",
+                default="standing, (full body)++"
+            ),
+            repeat: int = Input(
+                description="The number of repeats",
+                default=1
+            )
+    ) -> Dict:
+        return {"outputs": prompt * repeat}
+
+    def predict_batch(self, payloads):
+        self.batch_sizes.append(len(payloads))
+        return [self.predict(**payload) for payload in payloads]
+
+    def after_predict(self, outputs):
+        outputs["after_predict"] = True
+        return outputs
+
+
+class TestBatching(unittest.TestCase):
+
+    def setUp(self) -> None:
+        os.environ["MAX_BATCH_SIZE"] = "4"
+        os.environ["MAX_BATCH_WAIT_TIME"] = "0.05"
+
+    def tearDown(self) -> None:
+        os.environ.pop("MAX_BATCH_SIZE")
+        os.environ.pop("MAX_BATCH_WAIT_TIME")
+
+    def test_batch(self):
+        model = KServeModel("test", CustomModel)
+
+        async def _run():
+            payloads = [{"prompt": f"{i}", "repeat": 2} for i in range(6)]
+            return await asyncio.gather(*[model.predict(payload) for payload in payloads])
+
+        outputs = asyncio.run(_run())
+        self.assertListEqual([o["outputs"] for o in outputs], [f"{i}{i}" for i in range(6)])
+        self.assertTrue(all(o["after_predict"] for o in outputs))
+        self.assertListEqual(model.model.batch_sizes, [4, 2])
+
+    def test_error(self):
+        model = KServeModel("test", CustomModel)
+        model.model.predict_batch = lambda payloads: payloads[:1]
+        model.batcher.batch_func = model.model.predict_batch
+
+        async def _run():
+            payloads = [{"prompt": f"{i}"} for i in range(2)]
+            return await asyncio.gather(*[model.predict(payload) for payload in payloads], return_exceptions=True)
+
+        outputs = asyncio.run(_run())
+        self.assertTrue(all(isinstance(o, AssertionError) for o in outputs))
+
+
+class TestUploadAggregator(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    async def _upload(self, webhook_url, paths):
+        self.calls.append(len(paths))
+        for path in paths:
+            if not os.path.exists(str(path)):
+                raise FileNotFoundError(str(path))
+        return [f"{webhook_url}/{os.path.basename(str(path))}" for path in paths]
+
+    @staticmethod
+    def _make_file():
+        f = tempfile.NamedTemporaryFile(delete=False)
+        f.write(b"file")
+        f.close()
+        return Path(f.name)
+
+    def test_merge(self):
+        aggregator = UploadAggregator(self._upload, max_wait_time=0.05)
+        paths = [self._make_file() for _ in range(3)]
+
+        async def _run():
+            return await asyncio.gather(
+                aggregator.submit("http://webhook", paths[:1]), aggregator.submit("http://webhook", paths[1:]))
+
+        outputs = asyncio.run(_run())
+        self.assertListEqual(self.calls, [3])
+        self.assertListEqual(outputs[1], [f"http://webhook/{os.path.basename(str(p))}" for p in paths[1:]])
+
+    def test_missing_file(self):
+        aggregator = UploadAggregator(self._upload, max_wait_time=0.05)
+        good, bad = self._make_file(), Path("/tmp/missing-file.png")
+
+        async def _run():
+            return await asyncio.gather(
+                aggregator.submit("http://webhook", [good]),
+                aggregator.submit("http://webhook", [bad]),
+                return_exceptions=True
+            )
+
+        outputs = asyncio.run(_run())
+        # The missing file is rejected before joining the batch
+        self.assertIsInstance(outputs[1], FileNotFoundError)
+        self.assertListEqual(outputs[0], [f"http://webhook/{os.path.basename(str(good))}"])
+        self.assertListEqual(self.calls, [1])
+
+    def test_fallback(self):
+        aggregator = UploadAggregator(self._upload, max_wait_time=0.05)
+        good, bad = self._make_file(), self._make_file()
+
+        async def _run():
+            tasks = [asyncio.ensure_future(aggregator.submit("http://webhook", [path])) for path in [good, bad]]
+            await asyncio.sleep(0)
+            # The file is removed after joining the batch, so the merged upload fails
+            os.remove(str(bad))
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        outputs = asyncio.run(_run())
+        # Only the request with the bad file fails after the files of each request are uploaded separately
+        self.assertListEqual(outputs[0], [f"http://webhook/{os.path.basename(str(good))}"])
+        self.assertIsInstance(outputs[1], FileNotFoundError)
+        self.assertListEqual(self.calls, [2, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
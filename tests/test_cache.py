@@ -1,10 +1,68 @@
 import os
+import time
+import asyncio
 import pytest
 import unittest
 import shutil
 import tempfile
+import threading
+import multiprocessing
 from kservehelper.cache import \
-    MemoryCache, DiskLRUCache, DiskCache
+    MemoryCache, DiskLRUCache, DiskCache, ModelCache, _clone_file
+from kservehelper.locks import flock
+
+
+def _read_cache(cache_dir, keys):
+    cache = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+    for _ in range(20):
+        for key in keys:
+            assert cache[key] is not None
+
+
+class BarrierStorage:
+
+    def __init__(self, num_parties=1):
+        # The downloads only finish when `num_parties` of them are in progress at the same time
+        self.barrier = threading.Barrier(num_parties, timeout=5)
+        self.lock = threading.Lock()
+        self.num_downloads = 0
+
+    def download(self, key, filename):
+        with self.lock:
+            self.num_downloads += 1
+        with open(filename, "wb") as f:
+            f.write(key.encode())
+            self.barrier.wait()
+            f.write(key.encode())
+        return True
+
+
+class SlowLoader:
+
+    def __init__(self, error=None):
+        self.error = error
+        self.num_calls = 0
+
+    def __call__(self, path):
+        self.num_calls += 1
+        time.sleep(0.2)
+        if self.error is not None:
+            raise self.error
+        return {"path": path}
+
+
+def _run_threads(func, num_threads):
+    outputs = [None] * num_threads
+
+    def _run(i):
+        outputs[i] = func()
+
+    threads = [threading.Thread(target=_run, args=(i,)) for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outputs
 
 
 class TestMemoryCache(unittest.TestCase):
@@ -39,6 +97,30 @@ class TestMemoryCache(unittest.TestCase):
             {"b": os.path.join(folder, "2"), "c": os.path.join(folder, "3")}
         )
 
+    def test_single_flight(self):
+        load_func = SlowLoader()
+        cache = MemoryCache(folder="", num_cached_objects=2, models={"a": "1"}, load_func=load_func)
+        # The concurrent callers share one load
+        outputs = _run_threads(lambda: cache["a"], 8)
+        self.assertEqual(load_func.num_calls, 1)
+        self.assertTrue(all(output is outputs[0] for output in outputs))
+
+        async def _aget():
+            return await asyncio.gather(*[cache.aget("b") for _ in range(8)])
+
+        outputs = asyncio.run(_aget())
+        self.assertEqual(load_func.num_calls, 2)
+        self.assertTrue(all(output is outputs[0] for output in outputs))
+        self.assertIs(cache["b"], outputs[0])
+
+        # The error is seen by all the callers
+        load_func = SlowLoader(error=RuntimeError("out of memory"))
+        cache = MemoryCache(folder="", num_cached_objects=2, models={}, load_func=load_func)
+        self.assertListEqual(_run_threads(lambda: cache["a"], 8), [None] * 8)
+        self.assertEqual(load_func.num_calls, 1)
+        self.assertEqual(cache["a"], None)
+        self.assertEqual(load_func.num_calls, 2)
+
 
 class TestDiskLRUCache(unittest.TestCase):
 
@@ -50,13 +132,18 @@ class TestDiskLRUCache(unittest.TestCase):
             f.write(b"\0")
 
     def test_get(self):
+        for index_backend in ["journal", "sqlite"]:
+            self._test_get(index_backend)
+
+    def _test_get(self, index_backend):
         tmp_dir = tempfile.gettempdir()
         cache_dir = os.path.join(tmp_dir, "cache")
         if os.path.isdir(cache_dir):
             shutil.rmtree(cache_dir)
         cache = DiskLRUCache(
             capacity=32,
-            cache_dir=cache_dir
+            cache_dir=cache_dir,
+            index_backend=index_backend
         )
 
         filepath = os.path.join(tmp_dir, "tmp1")
@@ -91,6 +178,175 @@ class TestDiskLRUCache(unittest.TestCase):
         self.assertEqual(len(cache.cache), 2)
         self.assertListEqual(sorted(cache.cache.keys()), ["file_1", "file_4"])
 
+    def test_journal(self):
+        tmp_dir = tempfile.gettempdir()
+        cache_dir = os.path.join(tmp_dir, "cache_journal")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        # Two caches sharing the same directory, e.g., in two processes
+        cache_a = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        cache_b = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        cache_a.index.compact_threshold = 10
+
+        filepath = os.path.join(tmp_dir, "tmp1")
+        self._make_file(filepath, 8)
+        for i in range(5):
+            cache_a[f"file_{i}"] = filepath
+        self.assertEqual(cache_b["file_0"], os.path.join(cache_dir, "file_0"))
+        self.assertEqual(cache_b.total_size, 40)
+        # The hit in `cache_b` is seen by `cache_a`
+        self.assertEqual(cache_a["none"], None)
+        self.assertListEqual(list(cache_a.cache.keys()), ["file_1", "file_2", "file_3", "file_4", "file_0"])
+
+        # Compaction starts a new journal, after which `cache_b` reloads the snapshot
+        for i in range(5, 20):
+            cache_a[f"file_{i}"] = filepath
+        self.assertGreater(cache_a.index.generation, 0)
+        self.assertEqual(cache_b["file_19"], os.path.join(cache_dir, "file_19"))
+        self.assertEqual(cache_b.index.generation, cache_a.index.generation)
+        self.assertEqual(cache_b.total_size, 160)
+        self.assertListEqual(list(cache_b.cache.keys()), list(cache_a.cache.keys()))
+
+        # A new cache loads the snapshot and the journal
+        cache_c = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        self.assertEqual(cache_c.total_size, 160)
+        self.assertListEqual(list(cache_c.cache.keys()), list(cache_b.cache.keys()))
+
+    def test_hits_compaction(self):
+        tmp_dir = tempfile.gettempdir()
+        cache_dir = os.path.join(tmp_dir, "cache_hits_only")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        filepath = os.path.join(tmp_dir, "tmp1")
+        self._make_file(filepath, 8)
+        cache = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        for i in range(2):
+            cache[f"file_{i}"] = filepath
+        cache.index.compact_threshold = 10
+
+        # Only lookups, which append a "touch" record for each hit
+        reader = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        reader.index.compact_threshold = 10
+        for _ in range(50):
+            for i in range(2):
+                self.assertIsNotNone(reader[f"file_{i}"])
+        # The journal is compacted by the lookups and stays bounded
+        self.assertGreater(reader.index.generation, 0)
+        self.assertLessEqual(reader.index.num_records, 10)
+        journal_file = reader.index._journal_file(reader.index.generation)
+        with open(journal_file, "rb") as f:
+            self.assertLessEqual(len(f.read().splitlines()), 10)
+        self.assertListEqual(list(DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir).cache.keys()),
+                             list(reader.cache.keys()))
+
+    def test_concurrent_hits(self):
+        tmp_dir = tempfile.gettempdir()
+        cache_dir = os.path.join(tmp_dir, "cache_hits")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        filepath = os.path.join(tmp_dir, "tmp1")
+        self._make_file(filepath, 8)
+        cache = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        keys = [f"file_{i}" for i in range(10)]
+        for key in keys:
+            cache[key] = filepath
+
+        # The hits in different processes append to the journal at the same time
+        processes = [multiprocessing.Process(target=_read_cache, args=(cache_dir, keys[i:] + keys[:i]))
+                     for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        cache["file_10"] = filepath
+        self.assertEqual(cache.total_size, 88)
+        self.assertListEqual(sorted(cache.cache.keys()), sorted(keys + ["file_10"]))
+        self.assertListEqual(list(DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir).cache.keys()),
+                             list(cache.cache.keys()))
+
+    def test_move(self):
+        tmp_dir = tempfile.gettempdir()
+        cache_dir = os.path.join(tmp_dir, "cache_move")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        cache = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+
+        filepath = os.path.join(tmp_dir, "tmp_move")
+        with open(filepath, "wb") as f:
+            f.write(b"abc" * 1000)
+        # Copying keeps the file
+        cache["file_1"] = filepath
+        self.assertTrue(os.path.isfile(filepath))
+        # Moving renames the file into the cache directory
+        inode = os.stat(filepath).st_ino
+        cache.set("file_2", filepath, move=True)
+        self.assertFalse(os.path.exists(filepath))
+        self.assertEqual(os.stat(cache["file_2"]).st_ino, inode)
+        for key in ["file_1", "file_2"]:
+            with open(cache[key], "rb") as f:
+                self.assertEqual(f.read(), b"abc" * 1000)
+        self.assertEqual(cache.total_size, 6000)
+        self.assertFalse([name for name in os.listdir(cache_dir) if name.startswith(".staging")])
+
+        _clone_file(cache["file_1"], filepath)
+        with open(filepath, "rb") as f:
+            self.assertEqual(f.read(), b"abc" * 1000)
+
+    def test_stale_staging_files(self):
+        cache_dir = os.path.join(tempfile.gettempdir(), "cache_staging")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        cache = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        stale_path, active_path = cache.staging_path(), cache.staging_path()
+        for path in [stale_path, active_path]:
+            with open(path, "wb") as f:
+                f.write(b"abc")
+        old_time = time.time() - DiskLRUCache.STALE_STAGING_AGE - 10
+        os.utime(stale_path, (old_time, old_time))
+
+        # Only the staging file left by a crashed process is removed when a cache is opened
+        DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir)
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertTrue(os.path.exists(active_path))
+
+        # A moved file isn't treated as stale because of its old modification time
+        filepath = os.path.join(tempfile.gettempdir(), "tmp_staging")
+        with open(filepath, "wb") as f:
+            f.write(b"abc")
+        os.utime(filepath, (old_time, old_time))
+        staged_path = cache._stage(filepath, move=True)
+        self.assertLess(time.time() - os.stat(staged_path).st_mtime, DiskLRUCache.STALE_STAGING_AGE)
+        os.remove(staged_path)
+
+    def test_sqlite(self):
+        tmp_dir = tempfile.gettempdir()
+        cache_dir = os.path.join(tmp_dir, "cache_sqlite")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        filepath = os.path.join(tmp_dir, "tmp1")
+        self._make_file(filepath, 8)
+        cache = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir, index_backend="journal")
+        for i in range(3):
+            cache[f"file_{i}"] = filepath
+        cache["file_0"]
+
+        # The items in the journaled index are imported
+        cache_a = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir, index_backend="sqlite")
+        cache_b = DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir, index_backend="sqlite")
+        self.assertEqual(cache_a.total_size, 24)
+        self.assertListEqual(list(cache_a.cache.keys()), ["file_1", "file_2", "file_0"])
+
+        cache_a["file_3"] = filepath
+        self.assertEqual(cache_b["file_1"], os.path.join(cache_dir, "file_1"))
+        self.assertEqual(cache_a.total_size, 32)
+        self.assertListEqual(list(cache_a.cache.keys()), ["file_2", "file_0", "file_3", "file_1"])
+        # Replacing an item doesn't change the total size
+        cache_b["file_3"] = filepath
+        self.assertEqual(cache_a.total_size, 32)
+        self.assertEqual(len(cache_a.index), 4)
+
 
 class TestDiskCache(unittest.TestCase):
 
@@ -101,6 +357,70 @@ class TestDiskCache(unittest.TestCase):
             b = cache._shard_index(i)
             count[b] = count.get(b, 0) + 1
 
+    def test_get_concurrent(self):
+        cache_dir = os.path.join(tempfile.gettempdir(), "cache_download")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        cache = DiskCache(num_shards=2, cache_dir=cache_dir)
+        # The misses for different keys download at the same time (otherwise the barrier breaks and
+        # the downloads fail) without overwriting each other
+        cache.storage = BarrierStorage(num_parties=4)
+        keys = [f"model_{i}" for i in range(4)] * 2
+        paths = [None] * len(keys)
+
+        def _get(i):
+            paths[i] = cache.get(keys[i])
+
+        threads = [threading.Thread(target=_get, args=(i,)) for i in range(len(keys))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(cache.storage.barrier.broken)
+        self.assertEqual(cache.storage.num_downloads, 4)
+        for key, path in zip(keys, paths):
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), key.encode() * 2)
+
+    def test_lock_files(self):
+        cache_dir = os.path.join(tempfile.gettempdir(), "cache_locks")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.makedirs(cache_dir)
+        # The per-key lock files of the previous versions are removed unless they are locked
+        for key in ["model_a", "model_b"]:
+            open(os.path.join(cache_dir, f"{key}.lock"), "w").close()
+        with flock(os.path.join(cache_dir, "model_b.lock")):
+            cache = DiskCache(num_shards=2, cache_dir=cache_dir)
+        self.assertFalse(os.path.exists(os.path.join(cache_dir, "model_a.lock")))
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, "model_b.lock")))
+
+        # The number of lock files is bounded by the number of stripes instead of the keys
+        cache.storage = BarrierStorage()
+        for i in range(200):
+            self.assertIsNotNone(cache.get(f"model_{i}"))
+        self.assertEqual(cache.storage.num_downloads, 200)
+        lock_files = [name for name in os.listdir(cache_dir) if name.startswith(".lock-")]
+        self.assertLessEqual(len(lock_files), DiskCache.NUM_LOCK_STRIPES)
+        self.assertListEqual([name for name in os.listdir(cache_dir) if name.endswith(".lock")], ["model_b.lock"])
+
+    def test_model_cache(self):
+        cache_dir = os.path.join(tempfile.gettempdir(), "cache_model")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        load_func = SlowLoader()
+        cache = ModelCache(num_shards=2, cache_dir=cache_dir, model_load_func=load_func,
+                           aws_access_key_id="", aws_secret_access_key="")
+        filepath = os.path.join(tempfile.gettempdir(), "tmp_model")
+        with open(filepath, "wb") as f:
+            f.write(b"weights")
+        self.assertTrue(cache.disk_cache.set("model", filepath))
+
+        outputs = _run_threads(lambda: cache.get("model"), 8)
+        self.assertEqual(load_func.num_calls, 1)
+        self.assertTrue(all(output is outputs[0] for output in outputs))
+        self.assertIs(asyncio.run(cache.aget("model")), outputs[0])
+
     @pytest.mark.skip
     def test_set(self):
         os.environ["AWS_ACCESS_KEY_ID"] = ""
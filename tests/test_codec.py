@@ -0,0 +1,140 @@
+import os
+import asyncio
+import unittest
+import msgpack
+from typing import Dict, Iterator
+from unittest import mock
+from kservehelper.model import KServeModel
+from kservehelper.types import Input, Path, BytesFile
+from kservehelper.codec import decode_payload
+
+
+class CustomModel:
+
+    def __init__(self):
+        self.mask_path = None
+
+    def load(self):
+        pass
+
+    def predict(
+            self,
+            image: bytes = Input(
+                description="Input image",
+                default=b""
+            ),
+            mask: Path = Input(
+                description="Mask image",
+                default=None
+            ),
+            radius: float = Input(
+                description="Blur radius",
+                default=2
+            )
+    ) -> Dict:
+        mask_data = None
+        if mask is not None:
+            with open(str(mask), "rb") as f:
+                mask_data = f.read()
+            self.mask_path = str(mask)
+        return {"image": image, "mask": mask_data, "radius": radius}
+
+
+class MaskModel:
+
+    def __init__(self):
+        self.mask_path = None
+
+    def predict(
+            self,
+            mask: Path = Input(
+                description="Mask image"
+            ),
+            num_files: int = Input(
+                description="The number of output files",
+                default=3
+            )
+    ) -> Iterator[BytesFile]:
+        self.mask_path = str(mask)
+        for i in range(num_files):
+            # The input file is read while the outputs are generated
+            with open(self.mask_path, "rb") as f:
+                yield BytesFile(f.read() + f"-{i}".encode(), f"{i}.txt")
+
+
+async def _fake_upload(upload_webhook, paths):
+    return {"output": [f"{upload_webhook}/{bytes(path.getbuffer()).decode()}" for path in paths]}
+
+
+def _multipart(fields):
+    boundary = "----kservehelper"
+    lines = []
+    for name, value, filename in fields:
+        lines.append(f"--{boundary}".encode())
+        if filename is None:
+            lines.append(f'Content-Disposition: form-data; name="{name}"'.encode())
+        else:
+            lines.append(f'Content-Disposition: form-data; name="{name}"; filename="{filename}"'.encode())
+            lines.append(b"Content-Type: application/octet-stream")
+        lines.append(b"")
+        lines.append(value)
+    lines.append(f"--{boundary}--".encode())
+    lines.append(b"")
+    return b"\r\n".join(lines), {"content-type": f"multipart/form-data; boundary={boundary}"}
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_json(self):
+        payload = decode_payload(b'{"radius": 3}', {"content-type": "application/json"})
+        self.assertDictEqual(payload, {"radius": 3})
+        payload = decode_payload(b'{"radius": 3}')
+        self.assertDictEqual(payload, {"radius": 3})
+
+    def test_msgpack(self):
+        model = KServeModel("test", CustomModel)
+        body = msgpack.packb({"image": b"\x00\x01\xff", "radius": 5.0})
+        outputs = asyncio.run(model.predict(body, headers={"content-type": "application/msgpack"}))
+        self.assertEqual(outputs["image"], b"\x00\x01\xff")
+        self.assertEqual(outputs["radius"], 5.0)
+
+    def test_multipart(self):
+        model = KServeModel("test", CustomModel)
+        body, headers = _multipart([
+            ("image", b"\x00\r\n\xff", "image.jpg"),
+            ("mask", b"mask bytes", "mask.png"),
+            ("radius", b"1.5", None),
+            ("upload_webhook", b"http://localhost/upload", None)
+        ])
+        outputs = asyncio.run(model.predict(body, headers=headers))
+        self.assertEqual(outputs["image"], b"\x00\r\n\xff")
+        self.assertEqual(outputs["mask"], b"mask bytes")
+        self.assertEqual(outputs["radius"], 1.5)
+        # The temporary file of the `Path` input is removed after `predict`
+        self.assertIsNotNone(model.model.mask_path)
+        self.assertFalse(os.path.exists(model.model.mask_path))
+
+    def test_multipart_deferred(self):
+        model = KServeModel("test", MaskModel)
+        body, headers = _multipart([
+            ("mask", b"mask", "mask.png"),
+            ("upload_webhook", b"http://localhost/upload", None),
+            ("upload_mode", b"deferred", None)
+        ])
+
+        async def _run():
+            outputs = await model.predict(body, headers=headers)
+            while model._background_tasks:
+                await asyncio.gather(*model._background_tasks)
+            return await model.predict({"upload_status": outputs["upload_id"]})
+
+        with mock.patch("kservehelper.model.async_upload_files", _fake_upload):
+            status = asyncio.run(_run())
+        self.assertEqual(status["status"], "succeeded")
+        self.assertListEqual(status["output"], [f"http://localhost/upload/mask-{i}" for i in range(3)])
+        # The temporary file is removed after the background upload
+        self.assertFalse(os.path.exists(model.model.mask_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import time
+import unittest
+import asyncio
+import threading
+from typing import Dict
+from kservehelper.model import KServeModel
+from kservehelper.executor import ModelExecutor, ExecutorBusyError
+from kservehelper.types import Input
+
+
+class CustomModel:
+
+    def __init__(self):
+        self.ticked = threading.Event()
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def load(self):
+        pass
+
+    def predict(
+            self,
+            name: str = Input(
+                description="The request name",
+                default="a"
+            )
+    ) -> Dict:
+        # Waits until the event loop runs another task, and then until the other prediction starts
+        ticked = self.ticked.wait(timeout=5)
+        self.barrier.wait()
+        return {"outputs": name, "ticked": ticked}
+
+
+class TestModelExecutor(unittest.TestCase):
+
+    def test_thread_mode(self):
+        model = KServeModel("test", CustomModel)
+        model.executor = ModelExecutor(mode="thread", max_concurrency=2)
+
+        async def _tick():
+            await asyncio.sleep(0.01)
+            model.model.ticked.set()
+
+        async def _run():
+            return await asyncio.gather(
+                model.predict({"name": "a"}),
+                model.predict({"name": "b"}),
+                _tick()
+            )
+
+        # The event loop is not blocked, and two predictions run concurrently (otherwise the barrier breaks)
+        outputs = asyncio.run(_run())
+        for name, output in zip(["a", "b"], outputs):
+            self.assertEqual(output["outputs"], name)
+            self.assertTrue(output["ticked"])
+        self.assertFalse(model.model.barrier.broken)
+
+    def test_queue_size(self):
+        executor = ModelExecutor(mode="thread", max_concurrency=1, max_queue_size=1, num_workers=1)
+
+        async def _run():
+            return await asyncio.gather(
+                *[executor.run(time.sleep, 0.1) for _ in range(3)],
+                return_exceptions=True
+            )
+
+        outputs = asyncio.run(_run())
+        executor.shutdown()
+        self.assertListEqual([isinstance(o, ExecutorBusyError) for o in outputs], [False, False, True])
+
+    def test_iterate(self):
+        for mode in ModelExecutor.MODES:
+            executor = ModelExecutor(mode=mode)
+            events = []
+
+            def _generate():
+                for i in range(3):
+                    events.append(i)
+                    yield i
+
+            async def _run():
+                outputs = executor.iterate(_generate())
+                items = [await outputs.__anext__()]
+                # The call waits until the generator releases the slot
+                call = asyncio.ensure_future(executor.run(events.append, "call"))
+                items += [item async for item in outputs]
+                await call
+                return items
+
+            self.assertListEqual(asyncio.run(_run()), [0, 1, 2])
+            self.assertListEqual(events, [0, 1, 2, "call"])
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            ModelExecutor(mode="process")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import time
+import tempfile
+import unittest
+import threading
+import multiprocessing
+from kservehelper.locks import flock
+from kservehelper.metrics import LOCK_WAIT_SECONDS
+
+
+def _hold_and_die(lock_path, event):
+    with flock(lock_path):
+        event.set()
+        # Exit without releasing the lock
+        os._exit(0)
+
+
+class TestLocks(unittest.TestCase):
+
+    def setUp(self):
+        self.lock_path = os.path.join(tempfile.gettempdir(), "test_locks.lock")
+
+    def test_shared(self):
+        with flock(self.lock_path, shared=True):
+            # Another shared lock can be acquired at the same time, but not an exclusive one
+            with flock(self.lock_path, timeout=0.1, shared=True):
+                pass
+            with self.assertRaises(TimeoutError):
+                with flock(self.lock_path, timeout=0.1):
+                    pass
+        with flock(self.lock_path, timeout=0.1):
+            with self.assertRaises(TimeoutError):
+                with flock(self.lock_path, timeout=0.1, shared=True):
+                    pass
+
+    def test_blocking(self):
+        def _hold():
+            with flock(self.lock_path):
+                holding.set()
+                time.sleep(0.3)
+
+        holding = threading.Event()
+        thread = threading.Thread(target=_hold)
+        thread.start()
+        holding.wait()
+        wait_time = LOCK_WAIT_SECONDS.labels(mode="exclusive")._sum.get()
+        start_time, cpu_time = time.monotonic(), time.process_time()
+        with flock(self.lock_path, timeout=None):
+            self.assertGreater(time.monotonic() - start_time, 0.2)
+        # Waiting for the lock doesn't keep the CPU busy
+        self.assertLess(time.process_time() - cpu_time, 0.1)
+        self.assertGreater(LOCK_WAIT_SECONDS.labels(mode="exclusive")._sum.get() - wait_time, 0.2)
+        thread.join()
+
+    def test_process_exit(self):
+        event = multiprocessing.Event()
+        process = multiprocessing.Process(target=_hold_and_die, args=(self.lock_path, event))
+        process.start()
+        event.wait()
+        process.join()
+        # The lock is released by the kernel once the holder exits
+        with flock(self.lock_path, timeout=1):
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
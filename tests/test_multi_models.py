@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+from typing import Dict
+from kservehelper.model import KServeModel
+from kservehelper.types import Input
+
+
+class ModelA:
+
+    def predict(
+            self,
+            prompt: str = Input(
+                description="Input prompt",
+                default="a"
+            )
+    ) -> Dict:
+        return {"outputs": prompt.upper()}
+
+
+class ModelB:
+
+    def predict(
+            self,
+            value: int = Input(
+                description="Input value",
+                default=1,
+                ge=0
+            )
+    ) -> Dict:
+        return {"outputs": value * 2}
+
+
+class TransformC:
+
+    def preprocess(
+            self,
+            prompt: str = Input(
+                description="Input prompt",
+                default="c"
+            )
+    ) -> Dict:
+        return {"outputs": prompt}
+
+    def postprocess(self, infer_response: Dict) -> Dict:
+        return infer_response
+
+
+class TestMultiModels(unittest.TestCase):
+
+    def test_models(self):
+        model_a = KServeModel("model_a", ModelA)
+        model_b = KServeModel("model_b", ModelB)
+        transform = KServeModel("transform_c", TransformC)
+
+        self.assertEqual(asyncio.run(model_a.predict({"prompt": "test"}))["outputs"], "TEST")
+        self.assertEqual(asyncio.run(model_b.predict({"value": 3}))["outputs"], 6)
+        self.assertEqual(asyncio.run(model_a.predict({}))["outputs"], "A")
+        with self.assertRaises(ValueError):
+            asyncio.run(model_a.predict({"value": 3}))
+        with self.assertRaises(AssertionError):
+            asyncio.run(model_b.predict({"value": -1}))
+
+        self.assertListEqual(list(model_a.docs().keys()), ["prompt"])
+        self.assertListEqual(list(model_b.model_io_info.inputs.keys()), ["value"])
+        self.assertListEqual(list(transform.docs().keys()), ["prompt"])
+        self.assertFalse(transform.has_predict)
+        self.assertFalse(model_a.has_preprocess)
+
+
+if __name__ == "__main__":
+    unittest.main()
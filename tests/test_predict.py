@@ -21,6 +21,17 @@ class CustomModel:
         return {"outputs": prompt}
 
 
+class RequiredModel:
+
+    def predict(
+            self,
+            prompt: str = Input(
+                description="Input prompt"
+            )
+    ) -> Dict:
+        return {"outputs": prompt}
+
+
 class TestKServeModel(unittest.TestCase):
 
     def test_model(self):
@@ -41,6 +52,12 @@ class TestKServeModel(unittest.TestCase):
             outputs = model.predict(payload)
         self.assertEqual(outputs["outputs"], "standing, (full body)++")
 
+    def test_required(self):
+        model = KServeModel("test", RequiredModel)
+        self.assertEqual(asyncio.run(model.predict({"prompt": "test"}))["outputs"], "test")
+        with self.assertRaisesRegex(ValueError, "prompt"):
+            asyncio.run(model.predict({}))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,140 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from typing import Dict
+from unittest import mock
+from kservehelper.cache import ResultCache, DiskLRUCache
+from kservehelper.model import KServeModel
+from kservehelper.types import Input, BytesFile
+
+
+class CustomModel:
+
+    def __init__(self):
+        self.num_calls = 0
+
+    def load(self):
+        pass
+
+    def predict(
+            self,
+            prompt: str = Input(
+                description="Input prompt",
+                default="standing, (full body)++"
+            ),
+            seed: int = Input(
+                description="Random seed",
+                default=0
+            )
+    ) -> Dict:
+        self.num_calls += 1
+        return {"outputs": f"{prompt}-{seed}"}
+
+
+class FileModel:
+
+    def __init__(self):
+        self.num_calls = 0
+
+    def predict(
+            self,
+            seed: int = Input(
+                description="Random seed",
+                default=0
+            )
+    ) -> BytesFile:
+        self.num_calls += 1
+        return BytesFile(f"{seed}".encode(), "output.txt")
+
+
+async def _fake_upload(upload_webhook, paths):
+    return {"output": [f"{upload_webhook}/{path}" for path in paths]}
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_key(self):
+        a = ResultCache.make_key({"prompt": "a", "seed": 1, "batch": [{"x": 1, "y": 2}]})
+        b = ResultCache.make_key({"seed": 1, "batch": [{"y": 2, "x": 1}], "prompt": "a"})
+        c = ResultCache.make_key({"seed": 2, "batch": [{"y": 2, "x": 1}], "prompt": "a"})
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+        self.assertNotEqual(ResultCache.make_key({"prompt": "a"}, "http://webhook-a"),
+                            ResultCache.make_key({"prompt": "a"}, "http://webhook-b"))
+
+    def test_lru(self):
+        cache = ResultCache(capacity=2)
+        cache.set("a", {"output": 1})
+        cache.set("b", {"output": 2})
+        self.assertEqual(cache.get("a"), {"output": 1})
+        cache.set("c", {"output": 3})
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("c"), {"output": 3})
+        # The cached value is not changed by the caller
+        cache.get("c")["output"] = 4
+        self.assertEqual(cache.get("c"), {"output": 3})
+        self.assertDictEqual(cache.stats(), {"hits": 4, "misses": 1, "evictions": 1, "size": 2})
+
+    def test_ttl(self):
+        cache = ResultCache(capacity=2, ttl=0.05)
+        cache.set("a", {"output": 1})
+        self.assertEqual(cache.get("a"), {"output": 1})
+        time.sleep(0.1)
+        self.assertEqual(cache.get("a"), None)
+        # The TTL of a result is capped by the one of the cache
+        cache = ResultCache(capacity=2, ttl=10)
+        cache.set("a", {"output": 1}, ttl=0.05)
+        cache.set("b", {"output": 2}, ttl=100)
+        time.sleep(0.1)
+        self.assertEqual(cache.get("a"), None)
+        self.assertLessEqual(cache.cache["b"][0], time.time() + 10)
+
+    def test_disk(self):
+        cache_dir = os.path.join(tempfile.gettempdir(), "result_cache")
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        cache = ResultCache(capacity=1, disk_cache=DiskLRUCache(capacity=10 ** 6, cache_dir=cache_dir))
+        cache.set("a", {"output": ["https://storage/a.jpg"]})
+        cache.set("b", {"output": ["https://storage/b.jpg"]})
+        self.assertListEqual(list(cache.cache.keys()), ["b"])
+        self.assertEqual(cache.get("a"), {"output": ["https://storage/a.jpg"]})
+        self.assertListEqual(list(cache.cache.keys()), ["a"])
+
+    def test_model(self):
+        os.environ["RESULT_CACHE_SIZE"] = "8"
+        try:
+            model = KServeModel("test", CustomModel)
+        finally:
+            os.environ.pop("RESULT_CACHE_SIZE")
+        outputs = asyncio.run(model.predict({"prompt": "a", "seed": 1, "upload_webhook": "http://localhost"}))
+        self.assertEqual(outputs["outputs"], "a-1")
+        # The outputs are not uploaded, so the cache key doesn't depend on `upload_webhook`
+        outputs = asyncio.run(model.predict({"seed": 1, "prompt": "a"}))
+        self.assertEqual(outputs["outputs"], "a-1")
+        asyncio.run(model.predict({"prompt": "a"}))
+        self.assertEqual(model.model.num_calls, 2)
+        self.assertEqual(model.result_cache.hits, 1)
+        self.assertEqual(model.result_cache.misses, 2)
+
+    def test_model_upload_target(self):
+        os.environ["RESULT_CACHE_SIZE"] = "8"
+        try:
+            model = KServeModel("test", FileModel)
+        finally:
+            os.environ.pop("RESULT_CACHE_SIZE")
+        with mock.patch("kservehelper.model.async_upload_files", _fake_upload):
+            a = asyncio.run(model.predict({"seed": 1, "upload_webhook": "http://webhook-a"}))
+            self.assertEqual(asyncio.run(model.predict({"seed": 1, "upload_webhook": "http://webhook-a"}))["output"],
+                             a["output"])
+            self.assertEqual(model.model.num_calls, 1)
+            # The URLs uploaded via another webhook are not reused
+            b = asyncio.run(model.predict({"seed": 1, "upload_webhook": "http://webhook-b"}))
+            self.assertTrue(b["output"][0].startswith("http://webhook-b/"))
+            self.assertEqual(model.model.num_calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import time
+import asyncio
+import unittest
+from kservehelper.retry import RetryPolicy, CircuitOpenError, WebhookError
+
+
+class Flaky:
+
+    def __init__(self, num_failures, latencies=()):
+        self.num_failures = num_failures
+        self.latencies = list(latencies)
+        self.num_calls = 0
+
+    def __call__(self):
+        self.num_calls += 1
+        if self.latencies:
+            time.sleep(self.latencies.pop(0))
+        if self.num_calls <= self.num_failures:
+            raise WebhookError("webhook error", 500)
+        return self.num_calls
+
+    async def acall(self):
+        self.num_calls += 1
+        num_calls = self.num_calls
+        if self.latencies:
+            await asyncio.sleep(self.latencies.pop(0))
+        if num_calls <= self.num_failures:
+            raise WebhookError("webhook error", 500)
+        return num_calls
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_retry(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=0.01)
+        func = Flaky(num_failures=2)
+        self.assertEqual(policy.call("http://webhook/upload", func), 3)
+
+        func = Flaky(num_failures=3)
+        with self.assertRaises(RuntimeError):
+            policy.call("http://webhook/upload", func)
+        self.assertEqual(func.num_calls, 3)
+
+        func = Flaky(num_failures=1)
+        self.assertEqual(asyncio.run(policy.acall("http://webhook/upload", func.acall)), 2)
+
+    def test_not_retryable(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=0.01, breaker_threshold=1)
+        for error in [FileNotFoundError("missing.png"), WebhookError("bad request", 400), KeyError("url")]:
+            num_calls = []
+
+            def _fail():
+                num_calls.append(1)
+                raise error
+
+            with self.assertRaises(type(error)):
+                policy.call("http://webhook/upload", _fail)
+            self.assertEqual(len(num_calls), 1)
+        # The errors not caused by the webhook don't open the circuit breaker
+        self.assertFalse(policy.breaker("http://webhook/upload").is_open)
+        self.assertTrue(policy.is_retryable(ConnectionResetError()))
+        self.assertTrue(policy.is_retryable(asyncio.TimeoutError()))
+
+    def test_backoff(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=2)
+        for attempt in range(5):
+            delay = policy.backoff(attempt)
+            self.assertTrue(0 <= delay <= min(2, 0.5 * 2 ** attempt))
+        self.assertEqual(RetryPolicy(attempt_timeout=5).timeout(60), 5)
+        self.assertEqual(RetryPolicy().timeout(60), 60)
+
+    def test_circuit_breaker(self):
+        policy = RetryPolicy(max_attempts=2, base_delay=0.01, breaker_threshold=4, breaker_reset_timeout=0.2)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                policy.call("http://webhook/upload", Flaky(num_failures=10))
+        # The webhook is not called while the breaker is open
+        func = Flaky(num_failures=0)
+        with self.assertRaises(CircuitOpenError):
+            policy.call("http://webhook/upload_batch", func)
+        self.assertEqual(func.num_calls, 0)
+        # The other hosts are not affected
+        self.assertEqual(policy.call("http://other/upload", func), 1)
+        # A trial call is allowed after `breaker_reset_timeout`, which closes the breaker
+        time.sleep(0.25)
+        self.assertEqual(policy.call("http://webhook/upload", Flaky(num_failures=0)), 1)
+        self.assertFalse(policy.breaker("http://webhook/upload").is_open)
+
+    def test_hedge(self):
+        policy = RetryPolicy(hedge_delay=0.05)
+        # The first request is slow, so the result of the hedged request is used
+        func = Flaky(num_failures=0, latencies=[1, 0])
+        start_time = time.time()
+        self.assertEqual(policy.call("http://webhook/upload", func, hedge=True), 2)
+        self.assertLess(time.time() - start_time, 0.5)
+
+        func = Flaky(num_failures=0, latencies=[1, 0])
+        start_time = time.time()
+        self.assertEqual(asyncio.run(policy.acall("http://webhook/upload", func.acall, hedge=True)), 2)
+        self.assertLess(time.time() - start_time, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,35 @@
+import os
 import time
+import boto3
 import pytest
+import asyncio
+import requests
 import unittest
+from unittest import mock
+from typing import List
+from kservehelper import utils
+from kservehelper.model import KServeModel
 from kservehelper.storage import S3Storage
+from kservehelper.dedup import UploadDeduplicator
+from kservehelper.types import Input, Path, BytesFile
+
+
+class CustomModel:
+
+    def predict(
+            self,
+            num_files: int = Input(
+                description="The number of output files",
+                default=2
+            )
+    ) -> List[Path]:
+        paths = []
+        for i in range(num_files):
+            path = KServeModel.generate_filepath(f"{i}.txt")
+            with open(path, "w") as f:
+                f.write(f"file {i}")
+            paths.append(Path(path))
+        return paths
 
 
 class TestS3Storage(unittest.TestCase):
@@ -24,5 +52,82 @@ class TestS3Storage(unittest.TestCase):
         print(f"Download time: {time.time() - start_time}")
 
 
+class TestDirectUpload(unittest.TestCase):
+    """
+    Uploads the outputs to a local S3-compatible server provided by moto.
+    """
+
+    def setUp(self):
+        moto_server = pytest.importorskip("moto.server")
+        self.server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+        self.server.start()
+        host, port = self.server.get_host_and_port()
+        self.endpoint_url = f"http://{host}:{port}"
+        self.patches = [
+            mock.patch.dict(os.environ, {
+                "AWS_ACCESS_KEY_ID": "test",
+                "AWS_SECRET_ACCESS_KEY": "test"
+            }),
+            mock.patch.object(utils, "S3_ENDPOINT_URL", self.endpoint_url),
+            mock.patch.object(utils, "S3_UPLOAD_BUCKETS", {"outputs"}),
+            mock.patch.object(utils, "_storages", {})
+        ]
+        for patch in self.patches:
+            patch.start()
+        boto3.client("s3", region_name="us-east-1", endpoint_url=self.endpoint_url).create_bucket(Bucket="outputs")
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.server.stop()
+
+    def test_model(self):
+        model = KServeModel("test", CustomModel)
+        outputs = asyncio.run(model.predict({"num_files": 2, "upload_webhook": "s3://outputs/images"}))
+        self.assertEqual(len(outputs["output"]), 2)
+        for i, url in enumerate(outputs["output"]):
+            # Presigned GET URLs
+            self.assertIn("Signature=", url)
+            self.assertEqual(requests.get(url).content, f"file {i}".encode())
+
+    def test_object_urls(self):
+        files = [BytesFile(b"bytes", "a.bin")]
+        with mock.patch.object(utils, "S3_URL_EXPIRES", 0):
+            outputs = utils.upload_files("s3://outputs", files)
+        prefix = f"{self.endpoint_url}/outputs/"
+        self.assertTrue(outputs["output"][0].startswith(prefix))
+        key = outputs["output"][0][len(prefix):]
+        self.assertTrue(key.endswith(f"/{files[0].filename}"))
+        s3 = boto3.client("s3", region_name="us-east-1", endpoint_url=self.endpoint_url)
+        obj = s3.get_object(Bucket="outputs", Key=key)
+        self.assertEqual(obj["Body"].read(), b"bytes")
+        self.assertEqual(obj["ContentType"], "application/octet-stream")
+
+    def test_unique_keys(self):
+        first = utils.upload_files("s3://outputs/images", [BytesFile(b"first", "image.png")])
+        second = utils.upload_files("s3://outputs/images", [BytesFile(b"second", "image.png")])
+        # The files with the same name don't overwrite each other
+        self.assertNotEqual(first["output"][0], second["output"][0])
+        self.assertEqual(requests.get(first["output"][0]).content, b"first")
+        self.assertEqual(requests.get(second["output"][0]).content, b"second")
+
+    def test_bucket_not_allowed(self):
+        boto3.client("s3", region_name="us-east-1", endpoint_url=self.endpoint_url).create_bucket(Bucket="models")
+        model = KServeModel("test", CustomModel)
+        with self.assertRaises(ValueError):
+            asyncio.run(model.predict({"num_files": 1, "upload_webhook": "s3://models/weights"}))
+        with self.assertRaises(ValueError):
+            utils.upload_files("s3://models", [BytesFile(b"bytes", "a.bin")])
+
+    def test_expiring_urls(self):
+        with mock.patch.object(utils, "_deduplicator", UploadDeduplicator(capacity=16)):
+            first = utils.upload_files("s3://outputs", [BytesFile(b"bytes", "a.bin")])
+            second = utils.upload_files("s3://outputs", [BytesFile(b"bytes", "a.bin")])
+        # The presigned URLs are not reused by the deduplicator
+        self.assertNotEqual(first["output"][0], second["output"][0])
+        self.assertEqual(utils.upload_url_ttl("s3://outputs"), utils.S3_URL_EXPIRES / 2)
+        self.assertIsNone(utils.upload_url_ttl("http://localhost/upload"))
+
+
 if __name__ == "__main__":
     unittest.main()
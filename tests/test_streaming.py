@@ -0,0 +1,140 @@
+import json
+import asyncio
+import threading
+import unittest
+import numpy as np
+from kservehelper.model import KServeModel
+from kservehelper.streaming import iterate_in_thread
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_not_blocking(self):
+        ticked = threading.Event()
+
+        def _generator():
+            # The event loop keeps running the other tasks while the generator waits
+            for _ in range(3):
+                yield ticked.wait(timeout=5)
+
+        async def _tick():
+            await asyncio.sleep(0.01)
+            ticked.set()
+
+        async def _consume():
+            return [json.loads(line) async for line in KServeModel.wrap_generator(_generator)]
+
+        async def _run():
+            outputs, _ = await asyncio.gather(_consume(), _tick())
+            return outputs
+
+        outputs = asyncio.run(_run())
+        self.assertListEqual(outputs, [{"id": i, "data": True} for i in range(3)])
+
+    def test_backpressure(self):
+        produced = []
+        closed = []
+
+        def _generator():
+            try:
+                for i in range(100):
+                    produced.append(i)
+                    yield i
+            finally:
+                closed.append(True)
+
+        async def _run():
+            items = iterate_in_thread(_generator(), max_queue_size=2)
+            outputs = []
+            async for item in items:
+                outputs.append(item)
+                await asyncio.sleep(0.02)
+                if len(outputs) == 3:
+                    break
+            await items.aclose()
+            await asyncio.sleep(0.2)
+            return outputs
+
+        outputs = asyncio.run(_run())
+        self.assertListEqual(outputs, [0, 1, 2])
+        # The producer stops at most a few items ahead of the consumer
+        self.assertLessEqual(len(produced), 3 + 2 + 1)
+        self.assertListEqual(closed, [True])
+
+    def test_error(self):
+        def _generator():
+            yield 1
+            raise ValueError("test")
+
+        async def _run():
+            return [item async for item in iterate_in_thread(_generator())]
+
+        with self.assertRaises(ValueError):
+            asyncio.run(_run())
+
+    def test_async_generator(self):
+        async def _generator():
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield f"token {i}"
+
+        async def _run():
+            return [json.loads(line) async for line in KServeModel.wrap_generator(_generator)]
+
+        outputs = asyncio.run(_run())
+        self.assertListEqual(outputs, [{"id": i, "data": f"token {i}"} for i in range(3)])
+
+    def test_coalesce(self):
+        def _generator():
+            for i in range(10):
+                yield i
+
+        async def _run():
+            return [chunk async for chunk in KServeModel.wrap_generator(_generator, flush_items=4)]
+
+        chunks = asyncio.run(_run())
+        self.assertListEqual([len(chunk.splitlines()) for chunk in chunks], [4, 4, 2])
+        lines = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        self.assertListEqual(lines, [{"id": i, "data": i} for i in range(10)])
+
+    def test_coalesce_interval(self):
+        async def _run():
+            flushed = asyncio.Event()
+
+            async def _generator():
+                for i in range(3):
+                    yield i
+                # The last item is generated after the first chunk is received (or the wait times out)
+                try:
+                    await asyncio.wait_for(flushed.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                yield 3
+
+            chunks = []
+            async for chunk in KServeModel.wrap_generator(_generator, flush_items=10, flush_interval=0.05):
+                chunks.append(chunk)
+                flushed.set()
+            return chunks
+
+        chunks = asyncio.run(_run())
+        # The first three items are flushed before the last one is generated
+        self.assertListEqual([len(chunk.splitlines()) for chunk in chunks], [3, 1])
+
+    def test_encode(self):
+        def _generator():
+            yield b"raw bytes"
+            yield np.array([1, 2, 3])
+            yield "中文"
+
+        async def _run():
+            return [chunk async for chunk in KServeModel.wrap_generator(_generator)]
+
+        chunks = asyncio.run(_run())
+        self.assertEqual(chunks[0], b"raw bytes")
+        self.assertDictEqual(json.loads(chunks[1]), {"id": 1, "data": [1, 2, 3]})
+        self.assertDictEqual(json.loads(chunks[2]), {"id": 2, "data": "中文"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import asyncio
 from typing import Dict
 from kservehelper.model import KServeModel
 from kservehelper.types import Input
@@ -25,9 +26,32 @@ class TestKServeModel(unittest.TestCase):
     def test_tansform(self):
         payload = {"prompt": "test test", "upload_webhook": "http://localhost"}
         model = KServeModel("test", CustomTransform)
-        outputs = model.postprocess(model.preprocess(payload))
+
+        async def _run():
+            return await model.postprocess(await model.preprocess(payload))
+
+        outputs = asyncio.run(_run())
         self.assertEqual(outputs["outputs"], "TEST TEST ABC")
 
+    def test_concurrent_requests(self):
+        model = KServeModel("test", CustomTransform)
+
+        async def _request(prompt, delay, infer_time):
+            await asyncio.sleep(delay)
+            inputs = await model.preprocess({"prompt": prompt, "upload_webhook": "http://localhost"})
+            await asyncio.sleep(infer_time)
+            return await model.postprocess(inputs)
+
+        async def _run():
+            return await asyncio.gather(_request("a", 0, 0.3), _request("b", 0.1, 0.1))
+
+        outputs = asyncio.run(_run())
+        self.assertEqual(outputs[0]["outputs"], "A ABC")
+        self.assertEqual(outputs[1]["outputs"], "B ABC")
+        # Each request measures its own running time
+        self.assertGreaterEqual(float(outputs[0]["running_time"][:-1]), 0.3)
+        self.assertLess(float(outputs[1]["running_time"][:-1]), 0.2)
+
 
 if __name__ == "__main__":
     unittest.main()
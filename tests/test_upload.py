@@ -4,7 +4,12 @@ import pytest
 import unittest
 from typing import List
 from kservehelper.model import KServeModel
-from kservehelper.types import Input, Path
+from kservehelper.types import Input, Path, BytesFile
+from unittest import mock
+from kservehelper.utils import upload_files
+from kservehelper.multipart import MultipartEncoder
+from kservehelper.codec import decode_payload
+from kservehelper.testing import LocalWebhook, make_files
 
 
 class CustomModel:
@@ -33,6 +38,68 @@ class CustomModel:
         return paths
 
 
+class TestUploadFiles(unittest.TestCase):
+
+    def test_connection_reuse(self):
+        webhook = LocalWebhook()
+        webhook.start()
+        try:
+            for _ in range(5):
+                paths = make_files(4)
+                outputs = upload_files(f"{webhook.url}/upload", paths)
+                self.assertListEqual(
+                    outputs["output"], [f"https://storage/{os.path.basename(str(p))}" for p in paths])
+            for _ in range(5):
+                paths = make_files(2)
+                outputs = upload_files(f"{webhook.url}/upload_batch", paths)
+                self.assertEqual(len(outputs["output"]), 2)
+        finally:
+            webhook.stop()
+        # The connections are kept alive and shared across the requests
+        self.assertLessEqual(len(webhook.connections), 4)
+
+    def test_bytes_files(self):
+        webhook = LocalWebhook()
+        webhook.start()
+        try:
+            files = [BytesFile(b"file 0", "0.txt"), BytesFile(bytearray(b"file 1"), "1.txt")]
+            for suffix in ["upload", "upload_batch"]:
+                outputs = upload_files(f"{webhook.url}/{suffix}", files)
+                self.assertListEqual(outputs["output"], [f"https://storage/{f.filename}" for f in files])
+        finally:
+            webhook.stop()
+
+    def test_upload_chunked(self):
+        webhook = LocalWebhook()
+        webhook.start()
+        try:
+            paths = make_files(3)
+            with mock.patch("kservehelper.utils.UPLOAD_CHUNK_SIZE", 4):
+                outputs = upload_files(f"{webhook.url}/upload_chunked", paths)
+        finally:
+            webhook.stop()
+        self.assertListEqual(outputs["output"], [f"https://storage/{os.path.basename(str(p))}" for p in paths])
+        self.assertListEqual(
+            sorted(c["data"] for c in webhook.chunks.values()), [f"file {i}".encode() for i in range(3)])
+        # Each 6-byte file is sent in two chunks of at most 4 bytes
+        self.assertEqual(webhook.num_chunks, 6)
+
+    def test_multipart_encoder(self):
+        path = make_files(1)[0]
+        with open(str(path), "rb") as f:
+            encoder = MultipartEncoder([
+                ("file_0", str(path), f, None),
+                ("file_1", "image.png", BytesFile(b"\x00\r\n" * 1000, "image.png").getbuffer(), "image/png")
+            ])
+            length = len(encoder)
+            body = b"".join(iter(lambda: encoder.read(7), b""))
+        os.remove(str(path))
+        self.assertEqual(len(body), length)
+        payload = decode_payload(body, {"Content-Type": encoder.content_type})
+        self.assertEqual(payload["file_0"], b"file 0")
+        self.assertEqual(payload["file_1"], b"\x00\r\n" * 1000)
+
+
 class TestKServeModel(unittest.TestCase):
 
     @pytest.mark.skip